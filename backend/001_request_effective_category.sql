@@ -0,0 +1,34 @@
+-- Материализованная категория заявки и индексы для очередей согласования
+
+ALTER TABLE requests
+    ADD COLUMN IF NOT EXISTS effective_category VARCHAR(50)
+    GENERATED ALWAYS AS (
+        CASE
+            WHEN source = 'employee' AND employee_category = 'pitanie_projivanie'
+                THEN 'pitanie_projivanie'
+            WHEN source = 'treasury' AND treasury_import_type IN ('graphs', 'approved_by_director', 'non_transferable')
+                THEN treasury_import_type
+            WHEN employee_category = 'filialy' OR (source = 'employee' AND employee_category IS NULL)
+                THEN 'filialy'
+            ELSE NULL
+        END
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS ix_requests_status_effective_category
+    ON requests (status, effective_category);
+
+CREATE INDEX IF NOT EXISTS ix_requests_status_import_id
+    ON requests (status, import_id);
+
+CREATE INDEX IF NOT EXISTS ix_requests_status_created_by
+    ON requests (status, created_by);
+
+CREATE INDEX IF NOT EXISTS ix_requests_pending_queue
+    ON requests (effective_category, import_id)
+    WHERE status = 'pending';
+
+CREATE INDEX IF NOT EXISTS ix_requests_approved_for_payment_queue
+    ON requests (effective_category, organization, recipient)
+    WHERE status = 'approved_for_payment';
+
+ANALYZE requests;
@@ -0,0 +1,4 @@
+-- Индекс для курсора изменений заявок (опрос дерева импортов казначейства)
+
+CREATE INDEX IF NOT EXISTS ix_requests_updated_at
+    ON requests (updated_at);
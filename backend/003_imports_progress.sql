@@ -0,0 +1,4 @@
+-- Прогресс фоновой обработки импорта
+
+ALTER TABLE imports
+    ADD COLUMN IF NOT EXISTS progress INTEGER DEFAULT 0;
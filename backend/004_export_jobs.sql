@@ -0,0 +1,19 @@
+-- Фоновые выгрузки в Excel (файлы хранятся в EXPORT_ARTIFACT_DIR)
+
+CREATE TABLE IF NOT EXISTS export_jobs (
+    id UUID PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES users(id),
+    export_type VARCHAR(30) NOT NULL,
+    params JSON,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    progress INTEGER DEFAULT 0,
+    row_count INTEGER DEFAULT 0,
+    file_name VARCHAR(255) NOT NULL,
+    file_path VARCHAR(500),
+    file_size INTEGER,
+    error_message TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+    completed_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS ix_export_jobs_user_id ON export_jobs (user_id);
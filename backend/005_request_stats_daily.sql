@@ -0,0 +1,29 @@
+-- Суточные итоги по заявкам для статистики (обновляются задачей update_request_statistics)
+
+CREATE TABLE IF NOT EXISTS request_stats_daily (
+    day DATE NOT NULL,
+    status VARCHAR(30) NOT NULL,
+    organization VARCHAR(100) NOT NULL,
+    department VARCHAR(100) NOT NULL,
+    article VARCHAR(200) NOT NULL,
+    recipient VARCHAR(200) NOT NULL,
+    created_by UUID NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    total_amount DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, status, organization, department, article, recipient, created_by)
+);
+
+CREATE INDEX IF NOT EXISTS ix_request_stats_daily_created_by_day
+    ON request_stats_daily (created_by, day);
+
+CREATE TABLE IF NOT EXISTS rollup_watermarks (
+    name VARCHAR(50) PRIMARY KEY,
+    watermark TIMESTAMP WITH TIME ZONE,
+    refreshed_at TIMESTAMP WITH TIME ZONE
+);
+
+-- Пересчет затронутых дней выбирает заявки по диапазонам created_at
+CREATE INDEX IF NOT EXISTS ix_requests_created_at
+    ON requests (created_at);
+
+ANALYZE requests;
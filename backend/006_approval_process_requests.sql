@@ -0,0 +1,34 @@
+-- Состав процессов согласования (вместо массива approval_processes.request_ids)
+
+CREATE TABLE IF NOT EXISTS approval_process_requests (
+    process_id UUID NOT NULL REFERENCES approval_processes(id) ON DELETE CASCADE,
+    request_id UUID NOT NULL REFERENCES requests(id) ON DELETE CASCADE,
+    decision VARCHAR(20) NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+    PRIMARY KEY (process_id, request_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_approval_process_requests_request_id
+    ON approval_process_requests (request_id);
+
+CREATE INDEX IF NOT EXISTS ix_approval_process_requests_process_decision
+    ON approval_process_requests (process_id, decision);
+
+-- История согласований заместителя: процессы по deputy_id в порядке создания
+CREATE INDEX IF NOT EXISTS ix_approval_processes_deputy_created_at
+    ON approval_processes (deputy_id, created_at);
+
+-- Перенос существующих процессов: согласование заместителя (status = 'approved')
+-- содержит только согласованные заявки, остальные процессы - отправки казначейства
+INSERT INTO approval_process_requests (process_id, request_id, decision, created_at)
+SELECT p.id,
+       r.id,
+       CASE WHEN p.status = 'approved' THEN 'approved' ELSE 'submitted' END,
+       p.created_at
+FROM approval_processes p
+CROSS JOIN LATERAL unnest(p.request_ids) AS member(request_id)
+JOIN requests r ON r.id = member.request_id
+ON CONFLICT (process_id, request_id) DO NOTHING;
+
+ANALYZE approval_process_requests;
+ANALYZE approval_processes;
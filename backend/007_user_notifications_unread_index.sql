@@ -0,0 +1,8 @@
+-- Непрочитанные уведомления пользователя: выдача в колокольчике и пересчет
+-- счетчика непрочитанных (при отсутствии его в Redis) по частичному индексу
+
+CREATE INDEX IF NOT EXISTS ix_user_notifications_unread
+    ON user_notifications (user_id, created_at)
+    WHERE NOT is_read;
+
+ANALYZE user_notifications;
@@ -0,0 +1,85 @@
+-- Версия набора заявок на согласовании (status = 'pending') для курсора дерева
+-- импортов казначейства (/treasury/pending/imports-tree).
+--
+-- Триггеры оператора на requests только ставят отметку "версию нужно
+-- увеличить" (одну на транзакцию, флаг транзакции в set_config). Сама версия
+-- увеличивается отложенным триггером-ограничением при commit: строка версии
+-- блокируется последней и только на время фиксации, поэтому писатели заявок
+-- не выстраиваются в очередь на ней и не взаимоблокируются. Версии идут в
+-- порядке фиксации и учитывают удаления (в отличие от max(updated_at)).
+
+CREATE TABLE IF NOT EXISTS data_versions (
+    name VARCHAR(50) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO data_versions (name, version)
+VALUES ('pending_requests', 0)
+ON CONFLICT (name) DO NOTHING;
+
+-- Отметки о необходимости увеличить версию (строка удаляется при commit)
+CREATE TABLE IF NOT EXISTS data_version_bumps (
+    id BIGSERIAL PRIMARY KEY,
+    name VARCHAR(50) NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION apply_data_version_bump() RETURNS trigger AS $$
+BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE name = NEW.name;
+    DELETE FROM data_version_bumps WHERE id = NEW.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_data_version_bumps_apply ON data_version_bumps;
+CREATE CONSTRAINT TRIGGER trg_data_version_bumps_apply
+    AFTER INSERT ON data_version_bumps
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW EXECUTE FUNCTION apply_data_version_bump();
+
+-- Триггеры уровня оператора: версия нужна, только если оператор затронул
+-- заявки в статусе 'pending' (до или после изменения). Отметка ставится один
+-- раз за транзакцию; флаг транзакции откатывается вместе с точкой сохранения,
+-- как и сама отметка.
+CREATE OR REPLACE FUNCTION bump_pending_requests_version() RETURNS trigger AS $$
+DECLARE
+    touched BOOLEAN := FALSE;
+BEGIN
+    IF current_setting('sariz.pending_version_bump', true) = '1' THEN
+        RETURN NULL;
+    END IF;
+
+    -- Запросы к old_rows/new_rows разбираются только в своей ветке: у триггера
+    -- INSERT нет old_rows, у DELETE - new_rows
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        touched := EXISTS (SELECT 1 FROM old_rows WHERE status = 'pending');
+    END IF;
+    IF NOT touched AND TG_OP IN ('INSERT', 'UPDATE') THEN
+        touched := EXISTS (SELECT 1 FROM new_rows WHERE status = 'pending');
+    END IF;
+    IF touched THEN
+        INSERT INTO data_version_bumps (name) VALUES ('pending_requests');
+        PERFORM set_config('sariz.pending_version_bump', '1', true);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Таблицы переходов допускаются только для триггера с одним событием
+DROP TRIGGER IF EXISTS trg_requests_pending_version_insert ON requests;
+CREATE TRIGGER trg_requests_pending_version_insert
+    AFTER INSERT ON requests
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_pending_requests_version();
+
+DROP TRIGGER IF EXISTS trg_requests_pending_version_update ON requests;
+CREATE TRIGGER trg_requests_pending_version_update
+    AFTER UPDATE ON requests
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_pending_requests_version();
+
+DROP TRIGGER IF EXISTS trg_requests_pending_version_delete ON requests;
+CREATE TRIGGER trg_requests_pending_version_delete
+    AFTER DELETE ON requests
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_pending_requests_version();
@@ -68,12 +68,10 @@ def verify_token(token: str) -> TokenData:
     except JWTError:
         raise credentials_exception
 
-# Зависимость для получения текущего пользователя
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
-    token_data = verify_token(credentials.credentials)
+# Пользователь по токену (для зависимостей и потоков событий, где токен
+# передается не в заголовке)
+def get_user_by_token(db: Session, token: str) -> User:
+    token_data = verify_token(token)
     
     user = db.query(User).filter(User.username == token_data.username).first()
     if user is None:
@@ -90,6 +88,13 @@ async def get_current_user(
     
     return user
 
+# Зависимость для получения текущего пользователя
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+) -> User:
+    return get_user_by_token(db, credentials.credentials)
+
 # Зависимости для проверки ролей
 def require_role(required_role: str):
     def role_checker(current_user: User = Depends(get_current_user)):
@@ -30,3 +30,15 @@ celery_app.conf.update(
     broker_pool_limit=10,
     broker_connection_max_retries=3,
 )
+
+# Периодические задачи (celery beat)
+celery_app.conf.beat_schedule = {
+    'cleanup-old-exports': {
+        'task': 'app.tasks.cleanup_old_exports',
+        'schedule': 3600.0,  # раз в час
+    },
+    'update-request-statistics': {
+        'task': 'app.tasks.update_request_statistics',
+        'schedule': 300.0,  # каждые 5 минут
+    },
+}
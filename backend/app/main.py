@@ -10,7 +10,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from app.database import engine, Base, get_db
-from app.routes import auth, requests, imports, approval, treasury, statistics, notifications
+from app.routes import auth, requests, imports, approval, treasury, statistics, notifications, exports
 
 # Создание таблиц при запуске
 @asynccontextmanager
@@ -36,6 +36,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Курсоры страниц и дерева, оценка количества записей
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "X-Tree-Cursor"],
 )
 
 # Подключение маршрутов
@@ -46,6 +48,7 @@ app.include_router(approval.router, prefix="/api/approval", tags=["Approval"])
 app.include_router(treasury.router, prefix="/api/treasury", tags=["Treasury"])
 app.include_router(statistics.router, prefix="/api/statistics", tags=["Statistics"])
 app.include_router(notifications.router, prefix="/api/notifications", tags=["Notifications"])
+app.include_router(exports.router, prefix="/api/exports", tags=["Exports"])
 
 @app.get("/")
 async def root():
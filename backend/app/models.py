@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, Text, Date, ForeignKey
+from sqlalchemy import Column, String, Integer, BigInteger, Float, Boolean, DateTime, Text, Date, ForeignKey, Computed, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID, ARRAY, JSON
 from sqlalchemy.sql import func
@@ -23,8 +23,39 @@ class User(Base):
     # Relationships
     notifications = relationship("UserNotification", back_populates="user", cascade="all, delete-orphan")
 
+# Категория заявки для интерфейса заместителя/казначейства.
+# Условия взаимоисключающие, NULL - заявка не попадает ни в одну категорию.
+# То же выражение используется в миграции 001_request_effective_category.sql
+EFFECTIVE_CATEGORY_SQL = """CASE
+    WHEN source = 'employee' AND employee_category = 'pitanie_projivanie'
+        THEN 'pitanie_projivanie'
+    WHEN source = 'treasury' AND treasury_import_type IN ('graphs', 'approved_by_director', 'non_transferable')
+        THEN treasury_import_type
+    WHEN employee_category = 'filialy' OR (source = 'employee' AND employee_category IS NULL)
+        THEN 'filialy'
+    ELSE NULL
+END"""
+
 class Request(Base):
     __tablename__ = "requests"
+    __table_args__ = (
+        Index('ix_requests_status_effective_category', 'status', 'effective_category'),
+        Index('ix_requests_status_import_id', 'status', 'import_id'),
+        Index('ix_requests_status_created_by', 'status', 'created_by'),
+        Index('ix_requests_updated_at', 'updated_at'),
+        Index('ix_requests_created_at', 'created_at'),
+        # Очереди "на согласовании в казначействе" и "на согласовании у заместителя"
+        Index(
+            'ix_requests_pending_queue',
+            'effective_category', 'import_id',
+            postgresql_where=text("status = 'pending'")
+        ),
+        Index(
+            'ix_requests_approved_for_payment_queue',
+            'effective_category', 'organization', 'recipient',
+            postgresql_where=text("status = 'approved_for_payment'")
+        ),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     article = Column(String(200), nullable=False)
@@ -51,6 +82,8 @@ class Request(Base):
     employee_category = Column(String(50))
     treasury_import_type = Column(String(30))
     source = Column(String(20), default="employee")
+    # Вычисляется БД при вставке и при любом изменении source/категорий
+    effective_category = Column(String(50), Computed(EFFECTIVE_CATEGORY_SQL, persisted=True))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
@@ -58,6 +91,9 @@ class Request(Base):
 
 class ApprovalProcess(Base):
     __tablename__ = "approval_processes"
+    __table_args__ = (
+        Index('ix_approval_processes_deputy_created_at', 'deputy_id', 'created_at'),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     deputy_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
@@ -73,6 +109,68 @@ class ApprovalProcess(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     approved_at = Column(DateTime(timezone=True))
 
+class ApprovalProcessRequest(Base):
+    """
+    Заявка в процессе согласования и решение по ней
+
+    decision: submitted - отправлена казначейством заместителю,
+    approved / rejected - решение заместителя.
+    """
+    __tablename__ = "approval_process_requests"
+    __table_args__ = (
+        Index('ix_approval_process_requests_request_id', 'request_id'),
+        Index('ix_approval_process_requests_process_decision', 'process_id', 'decision'),
+    )
+
+    process_id = Column(UUID(as_uuid=True), ForeignKey('approval_processes.id', ondelete='CASCADE'), primary_key=True)
+    request_id = Column(UUID(as_uuid=True), ForeignKey('requests.id', ondelete='CASCADE'), primary_key=True)
+    decision = Column(String(20), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class RequestStatsDaily(Base):
+    """
+    Суточные итоги по заявкам (кроме черновиков) для статистики
+
+    День - дата created_at заявки. Обновляется задачей update_request_statistics.
+    """
+    __tablename__ = "request_stats_daily"
+    __table_args__ = (
+        Index('ix_request_stats_daily_created_by_day', 'created_by', 'day'),
+    )
+
+    day = Column(Date, primary_key=True)
+    status = Column(String(30), primary_key=True)
+    organization = Column(String(100), primary_key=True)
+    department = Column(String(100), primary_key=True)
+    article = Column(String(200), primary_key=True)
+    recipient = Column(String(200), primary_key=True)
+    created_by = Column(UUID(as_uuid=True), primary_key=True)
+
+    count = Column(Integer, nullable=False, default=0)
+    total_amount = Column(Float, nullable=False, default=0)
+
+class RollupWatermark(Base):
+    """
+    Отметка времени, до которой агрегат учел изменения исходной таблицы
+    """
+    __tablename__ = "rollup_watermarks"
+
+    name = Column(String(50), primary_key=True)
+    watermark = Column(DateTime(timezone=True))
+    refreshed_at = Column(DateTime(timezone=True))
+
+class DataVersion(Base):
+    """
+    Версия набора данных для курсоров "не изменилось ли"
+
+    Увеличивается отложенным триггером БД при commit изменения (см.
+    008_pending_requests_version.sql), поэтому учитывает удаления и поздние commit.
+    """
+    __tablename__ = "data_versions"
+
+    name = Column(String(50), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
 class TreasuryNotification(Base):
     __tablename__ = "treasury_notifications"
 
@@ -101,8 +199,31 @@ class Import(Base):
     error_message = Column(Text)
     imported_count = Column(Integer, default=0)
     skipped_count = Column(Integer, default=0)
+    # Прогресс фоновой обработки, %
+    progress = Column(Integer, default=0)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ExportJob(Base):
+    __tablename__ = "export_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False, index=True)
+    # Тип выгрузки: treasury_payments, statistics
+    export_type = Column(String(30), nullable=False)
+    # Параметры выгрузки (фильтры), с которыми запущено задание
+    params = Column(JSON)
+    status = Column(String(20), nullable=False, default='queued')
+    # Прогресс фоновой выгрузки, %
+    progress = Column(Integer, default=0)
+    row_count = Column(Integer, default=0)
+    file_name = Column(String(255), nullable=False)
+    file_path = Column(String(500))
+    file_size = Column(Integer)
+    error_message = Column(Text)
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    completed_at = Column(DateTime(timezone=True))
 
 class CategoryKeyword(Base):
     __tablename__ = "category_keywords"
@@ -119,6 +240,14 @@ class CategoryKeyword(Base):
 class UserNotification(Base):
     """Уведомления пользователей для колокольчика в хедере"""
     __tablename__ = "user_notifications"
+    __table_args__ = (
+        # Непрочитанные уведомления пользователя (колокольчик, пересчет счетчика)
+        Index(
+            'ix_user_notifications_unread',
+            'user_id', 'created_at',
+            postgresql_where=text("NOT is_read")
+        ),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
@@ -3,11 +3,13 @@ from app.routes.requests import router as requests_router
 from app.routes.imports import router as imports_router
 from app.routes.approval import router as approval_router
 from app.routes.treasury import router as treasury_router
+from app.routes.exports import router as exports_router
 
 __all__ = [
     "auth_router",
     "requests_router",
     "imports_router",
     "approval_router",
-    "treasury_router"
+    "treasury_router",
+    "exports_router"
 ]
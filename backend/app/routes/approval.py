@@ -1,29 +1,37 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 import logging
 
 logger = logging.getLogger(__name__)
-from sqlalchemy import func, and_, or_
+from sqlalchemy import func, or_
 from typing import List, Dict, Optional
 import uuid
 from datetime import datetime
-from sqlalchemy import func
+from sqlalchemy import func, update, insert, values, column, select, tuple_, true, String
 from decimal import Decimal
 
 from app.database import get_db
 from app.auth import get_current_user, require_deputy_director
-from app.models import User, Request, CategoryKeyword, ApprovalProcess, TreasuryNotification
+from app.models import User, Request, CategoryKeyword, ApprovalProcess, ApprovalProcessRequest, TreasuryNotification
+from app.utils.categorization import get_category_stats, category_condition
+from app.utils.pivot import build_recipient_pivot
+from app.utils.pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, REQUEST_FIELDS, estimate_count, parse_fields,
+    project_request_fields, paginate, page_response
+)
 from app.routes.notifications import (
-    create_batch_for_approval_notification,
-    create_batch_processed_notification_for_employee,
-    create_batch_treasury_notification_for_deputy
+    create_notifications,
+    batch_processed_notification_for_employee,
+    batch_treasury_notification_for_deputy
 )
 from app.schemas import NotificationType
 from app.schemas import (
     PivotTableRequest, 
     PivotTableResponse, 
     ApprovalRequest,
-    CategoryStats
+    ApprovalHistoryItem,
+    CategoryStats,
+    RequestResponse
 )
 
 router = APIRouter()
@@ -36,115 +44,26 @@ async def get_categories_stats(
     """
     Получение статистики по категориям для отображения на кнопках
     """
-    # Заявки со статусом 'pending' (на согласовании)
-    base_query = db.query(Request).filter(Request.status == 'approved_for_payment')
-    
-    stats = {}
-    
-    # 1. Питание, проживание, аренда, связь
-    pitanie_count = base_query.filter(
-        Request.employee_category == 'pitanie_projivanie',
-        Request.source == 'employee'
-    ).count()
-    
-    pitanie_amount = base_query.filter(
-        Request.employee_category == 'pitanie_projivanie',
-        Request.source == 'employee'
-    ).with_entities(func.coalesce(func.sum(Request.amount), 0)).scalar() or 0
-    
-    stats['pitanie_projivanie'] = CategoryStats( 
-        count=pitanie_count,
-        total_amount=float(pitanie_amount),
-        label="Питание, проживание, аренда, связь"
-    )
-    
-    # 2. Графики
-    graphs_count = base_query.filter(
-        Request.treasury_import_type == 'graphs',
-        Request.source == 'treasury'
-    ).count()
-    
-    graphs_amount = base_query.filter(
-        Request.treasury_import_type == 'graphs',
-        Request.source == 'treasury'
-    ).with_entities(func.coalesce(func.sum(Request.amount), 0)).scalar() or 0
-    
-    stats['graphs'] = CategoryStats( 
-        count=graphs_count,
-        total_amount=float(graphs_amount),
-        label="Графики"
-    )
-    
-    # 3. Утверждено генеральным директором
-    approved_count = base_query.filter(
-        Request.treasury_import_type == 'approved_by_director',
-        Request.source == 'treasury'
-    ).count()
-    
-    approved_amount = base_query.filter(
-        Request.treasury_import_type == 'approved_by_director',
-        Request.source == 'treasury'
-    ).with_entities(func.coalesce(func.sum(Request.amount), 0)).scalar() or 0
-    
-    stats['approved_by_director'] = CategoryStats( 
-        count=approved_count,
-        total_amount=float(approved_amount),
-        label="Утверждено генеральным директором"
-    )
-    
-    # 4. Непереносимые оплаты
-    non_transferable_count = base_query.filter(
-        Request.treasury_import_type == 'non_transferable',
-        Request.source == 'treasury'
-    ).count()
-    
-    non_transferable_amount = base_query.filter(
-        Request.treasury_import_type == 'non_transferable',
-        Request.source == 'treasury'
-    ).with_entities(func.coalesce(func.sum(Request.amount), 0)).scalar() or 0
-    
-    stats['non_transferable'] = CategoryStats( 
-        count=non_transferable_count,
-        total_amount=float(non_transferable_amount),
-        label="Непереносимые оплаты"
-    )
-    
-    # 5. Филиалы
-    filialy_query = base_query.filter(
-        or_(
-            Request.employee_category == 'filialy',
-            and_(
-                Request.employee_category.is_(None),
-                Request.source == 'employee',
-                Request.treasury_import_type.is_(None)
-            )
+    # Заявки со статусом 'approved_for_payment' (на согласовании у заместителя)
+    category_stats = get_category_stats(db, 'approved_for_payment')
+
+    labels = {
+        'pitanie_projivanie': "Питание, проживание, аренда, связь",
+        'graphs': "Графики",
+        'approved_by_director': "Утверждено генеральным директором",
+        'non_transferable': "Непереносимые оплаты",
+        'filialy': "Филиалы",
+        'all': "Все оплаты"
+    }
+
+    return {
+        category: CategoryStats(
+            count=category_stats[category]['count'],
+            total_amount=category_stats[category]['amount'],
+            label=label
         )
-    )
-    
-    filialy_count = filialy_query.count()
-    filialy_amount = filialy_query.with_entities(
-        func.coalesce(func.sum(Request.amount), 0)
-    ).scalar() or 0
-    
-    stats['filialy'] = CategoryStats( 
-        count=filialy_count,
-        total_amount=float(filialy_amount),
-        label="Филиалы"
-    )
-    
-    # 6. Все оплаты
-    all_count = base_query.count()
-    all_amount = base_query.with_entities(
-        func.coalesce(func.sum(Request.amount), 0)
-    ).scalar() or 0
-    
-    stats['all'] = CategoryStats( 
-        count=all_count,
-        total_amount=float(all_amount),
-        label="Все оплаты"
-    )
-    
-    return stats
+        for category, label in labels.items()
+    }
 
 @router.post("/pivot-table", response_model=PivotTableResponse)
 async def get_pivot_table(
@@ -160,146 +79,70 @@ async def get_pivot_table(
     - Столбцы: department
     - Значения: amount (SUM)
     """
-    # Базовый запрос с фильтрацией по категории
-    query = db.query(Request).filter(Request.status == "approved_for_payment")
+    # Условия отбора: статус, категория и дополнительные фильтры
+    conditions = [Request.status == "approved_for_payment"]
     
-    # Применяем фильтр категории
-    if pivot_request.category == 'pitanie_projivanie':
-        query = query.filter(
-            Request.employee_category == 'pitanie_projivanie',
-            Request.source == 'employee'
-        )
-    elif pivot_request.category == 'graphs':
-        query = query.filter(
-            Request.treasury_import_type == 'graphs',
-            Request.source == 'treasury'
-        )
-    elif pivot_request.category == 'approved_by_director':
-        query = query.filter(
-            Request.treasury_import_type == 'approved_by_director',
-            Request.source == 'treasury'
-        )
-    elif pivot_request.category == 'non_transferable':
-        query = query.filter(
-            Request.treasury_import_type == 'non_transferable',
-            Request.source == 'treasury'
-        )
-    elif pivot_request.category == 'filialy':
-        query = query.filter(
-            or_(
-                Request.employee_category == 'filialy',
-                and_(
-                    Request.employee_category.is_(None),
-                    Request.source == 'employee',
-                    Request.treasury_import_type.is_(None)
-                )
-            )
-        )
-    elif pivot_request.category == 'all':
-        # Все заявки - без дополнительных фильтров
-        pass
+    # Применяем фильтр категории ('all' - без дополнительных фильтров)
+    condition = category_condition(pivot_request.category)
+    if condition is not None:
+        conditions.append(condition)
     
     # Применяем дополнительные фильтры если есть
     if pivot_request.filters:
         filters = pivot_request.filters
         if filters.get('organization'):
-            query = query.filter(Request.organization.ilike(f"%{filters['organization']}%"))
+            conditions.append(Request.organization.ilike(f"%{filters['organization']}%"))
         if filters.get('recipient'):
-            query = query.filter(Request.recipient.ilike(f"%{filters['recipient']}%"))
+            conditions.append(Request.recipient.ilike(f"%{filters['recipient']}%"))
         if filters.get('article'):
-            query = query.filter(Request.article.ilike(f"%{filters['article']}%"))
-    
-    # Получаем все уникальные подразделения для столбцов
-    departments = db.query(Request.department).distinct().all()
-    departments = [dept[0] for dept in departments if dept[0]]
-    
-    # Получаем данные для группировки: organization -> recipient
-    # Сначала получаем все организации
-    organizations = db.query(
-        Request.organization,
-        Request.recipient,
-        Request.department,
-        func.sum(Request.amount).label('total_amount')
-    ).filter(
-        Request.id.in_([r.id for r in query.all()])
-    ).group_by(
-        Request.organization,
-        Request.recipient,
-        Request.department
-    ).all()
+            conditions.append(Request.article.ilike(f"%{filters['article']}%"))
     
-    # Структурируем данные для сводной таблицы
-    pivot_data = {}
-    
-    for org, recipient, dept, amount in organizations:
-        if org not in pivot_data:
-            pivot_data[org] = {
-                'organization': org,
-                'recipients': {},
-                'department_totals': {dept: 0 for dept in departments},
-                'organization_total': 0
-            }
-        
-        if recipient not in pivot_data[org]['recipients']:
-            pivot_data[org]['recipients'][recipient] = {
-                'recipient': recipient,
-                'department_amounts': {dept: 0 for dept in departments},
-                'recipient_total': 0
-            }
-        
-        # Добавляем amount в соответствующее подразделение
-        if dept:
-            pivot_data[org]['recipients'][recipient]['department_amounts'][dept] += float(amount)
-            pivot_data[org]['recipients'][recipient]['recipient_total'] += float(amount)
-            
-            pivot_data[org]['department_totals'][dept] += float(amount)
-            pivot_data[org]['organization_total'] += float(amount)
-    
-    # Преобразуем в список для ответа
-    rows = []
-    for org, org_data in pivot_data.items():
-        # Добавляем строку организации (итог)
-        rows.append({
-            'type': 'organization',
-            'organization': org,
-            'department_amounts': org_data['department_totals'],
-            'total': org_data['organization_total'],
-            'is_expanded': False
-        })
-        
-        # Добавляем строки контрагентов
-        for recipient, recipient_data in org_data['recipients'].items():
-            rows.append({
-                'type': 'recipient',
-                'organization': org,
-                'recipient': recipient,
-                'department_amounts': recipient_data['department_amounts'],
-                'total': recipient_data['recipient_total']
-            })
-    
-    # Добавляем итоговую строку
-    total_row = {
-        'type': 'total',
-        'department_totals': {},
-        'grand_total': 0
-    }
-    
-    # Вычисляем итоги по подразделениям
-    for dept in departments:
-        dept_total = sum(
-            org_data['department_totals'].get(dept, 0)
-            for org_data in pivot_data.values()
-        )
-        total_row['department_totals'][dept] = dept_total
-        total_row['grand_total'] += dept_total
+    # Вся группировка выполняется одним агрегирующим запросом
+    pivot = build_recipient_pivot(db, conditions)
     
     return PivotTableResponse(
-        rows=rows,
-        total_row=total_row,
-        departments=departments,
+        rows=pivot['rows'],
+        total_row=pivot['total_row'],
+        departments=pivot['departments'],
         category=pivot_request.category
     )
 
+def approval_selection_condition(selection):
+    """
+    Условие SQL "заявка выбрана заместителем"
+
+    Выбранные категории - через выражение категории, выбранные контрагенты -
+    пары (организация, получатель) из VALUES. None - ничего не выбрано.
+    """
+    conditions = []
+
+    for category_selection in selection.selected_categories:
+        if category_selection.selected:
+            condition = category_condition(category_selection.category)
+            if condition is None:
+                # Категория "все" - все заявки на согласовании
+                return true()
+            conditions.append(condition)
+
+    selected_pairs = list(dict.fromkeys(
+        (recipient_selection.organization, recipient_selection.recipient)
+        for recipient_selection in selection.selected_recipients
+        if recipient_selection.selected
+    ))
+    if selected_pairs:
+        pairs = values(
+            column('organization', String(100)),
+            column('recipient', String(200)),
+            name='selected_recipients'
+        ).data(selected_pairs)
+        conditions.append(
+            tuple_(Request.organization, Request.recipient).in_(
+                select(pairs.c.organization, pairs.c.recipient)
+            )
+        )
+
+    return or_(*conditions) if conditions else None
+
 @router.post("/approve")
 async def approve_requests(
     approval_request: ApprovalRequest,
@@ -310,188 +153,83 @@ async def approve_requests(
     Массовое согласование заявок с новой логикой:
     1. Выбранные категории целиком → все заявки категории → for_payment
     2. Выбранные контрагенты → их заявки → for_payment  
-    3. Невыбранные заявки (из тех же категорий) → rejected
-    """
-    from sqlalchemy import and_, or_
-    
-    # Получаем все заявки со статусом pending для анализа
-    all_pending_requests = db.query(Request).filter(
-        Request.status == "approved_for_payment"
-    ).all()
-    
-    if not all_pending_requests:
-        raise HTTPException(status_code=404, detail="Нет заявок на согласовании")
-    
-    # Собираем ID заявок для согласования (for_payment)
-    approved_request_ids = set()
-    
-    # 1. Обрабатываем выбранные категории
-    for category_selection in approval_request.selection.selected_categories:
-        if category_selection.selected:
-            category = category_selection.category
-            
-            # Получаем все заявки этой категории со статусом pending
-            category_requests = get_requests_by_category(db, category, 'approved_for_payment')
-            for req in category_requests:
-                approved_request_ids.add(str(req.id))
-    
-    # 2. Обрабатываем выбранных контрагентов
-    for recipient_selection in approval_request.selection.selected_recipients:
-        if recipient_selection.selected:
-            organization = recipient_selection.organization
-            recipient = recipient_selection.recipient
-            
-            # Находим заявки этого контрагента
-            recipient_requests = db.query(Request).filter(
-                Request.status == 'approved_for_payment',
-                Request.organization == organization,
-                Request.recipient == recipient
-            ).all()
-            
-            for req in recipient_requests:
-                approved_request_ids.add(str(req.id))
-    
-    if not approved_request_ids:
-        raise HTTPException(status_code=400, detail="Не выбраны заявки для согласования")
-    
-    # 3. Обновляем статусы
-    # Заявки для оплаты
-    # Получаем заявки которые будут согласованы (до обновления статуса)
-    requests_to_approve = db.query(Request).filter(
-        Request.id.in_(list(approved_request_ids)),
-        Request.status == 'approved_for_payment'
-    ).all()
+    3. Невыбранные заявки → rejected
 
-    # Получаем заявки которые будут отклонены (до обновления статуса)  
-    requests_to_reject = db.query(Request).filter(
-        Request.status == 'approved_for_payment',
-        ~Request.id.in_(list(approved_request_ids))
-    ).all()
-
-    # 3. Обновляем статусы
-    # Заявки для оплаты
-    # Получаем заявки которые будут согласованы (до обновления статуса)
-    requests_to_approve = db.query(Request).filter(
-        Request.id.in_(list(approved_request_ids)),
-        Request.status == 'approved_for_payment'
-    ).all()
+    Выполняется в одной транзакции: выбор вычисляется в SQL, оба перехода
+    статуса - UPDATE ... RETURNING, уведомления строятся по возвращенным строкам
+    и фиксируются тем же commit.
+    """
+    selection = approval_request.selection
+    selected = approval_selection_condition(selection)
 
-    # Получаем заявки которые будут отклонены (до обновления статуса)  
-    requests_to_reject = db.query(Request).filter(
-        Request.status == 'approved_for_payment',
-        ~Request.id.in_(list(approved_request_ids))
-    ).all()
+    if selected is None:
+        raise HTTPException(status_code=400, detail="Не выбраны заявки для согласования")
 
-    # 3. Обновляем статусы
-    # Заявки для оплаты
-    approved_count = db.query(Request).filter(
-        Request.id.in_(list(approved_request_ids)),
-        Request.status == 'approved_for_payment'
-    ).update(
-        {"status": "for_payment"},
-        synchronize_session=False
-    )
-    
-    # Остальные заявки (не выбранные) отклоняем
-    rejected_count = db.query(Request).filter(
-        Request.status == 'approved_for_payment',
-        ~Request.id.in_(list(approved_request_ids))
-    ).update(
-        {"status": "rejected"},
-        synchronize_session=False
-    )
-    
-    # 4. Создаем запись о согласовании
+    # 1. Запись о согласовании (заявки ссылаются на нее в том же UPDATE)
     approval_process = ApprovalProcess(
         id=uuid.uuid4(),
         deputy_id=current_user.id,
-        category="mixed" if (len(approval_request.selection.selected_categories) > 0 and 
-                           len(approval_request.selection.selected_recipients) > 0) else 
-                ("category" if len(approval_request.selection.selected_categories) > 0 else "recipient"),
+        category="mixed" if (len(selection.selected_categories) > 0 and 
+                           len(selection.selected_recipients) > 0) else 
+                ("category" if len(selection.selected_categories) > 0 else "recipient"),
         comment=approval_request.comment,
         status="approved",
-        request_ids=list(approved_request_ids),
+        request_ids=[],
         approved_at=datetime.utcnow()
     )
-    
     db.add(approval_process)
-    db.commit()
-    # 4.1. Обновляем approval_process_id в согласованных заявках
-    if approved_count > 0:
-        db.query(Request).filter(
-            Request.id.in_(list(approved_request_ids))
-        ).update(
-            {"approval_process_id": approval_process.id},
-            synchronize_session=False
-        )
-        db.commit()
-    
-    # 4.2. Создаем пакетные уведомления для сотрудников
-    # Группируем заявки по import_id и создателю
-    import_groups = {}
-    
-    # Обрабатываем согласованные заявки
-    for request in requests_to_approve:
-        if request.import_id:
-            import_key = (request.import_id, request.created_by)
-        else:
-            # Для заявок без импорта - группируем по создателю
-            import_key = (None, request.created_by)
-            
-        if import_key not in import_groups:
-            import_groups[import_key] = {
-                "approved": 0,
-                "rejected": 0,
-                "total_amount": 0.0,
-                "requests": []
-            }
-        
-        import_groups[import_key]["approved"] += 1
-        import_groups[import_key]["total_amount"] += float(request.amount)
-        import_groups[import_key]["requests"].append(request)
-    
-    # Обрабатываем отклоненные заявки
-    for request in requests_to_reject:
-        if request.import_id:
-            import_key = (request.import_id, request.created_by)
-        else:
-            # Для заявок без импорта - группируем по создателю
-            import_key = (None, request.created_by)
-            
-        if import_key not in import_groups:
-            import_groups[import_key] = {
-                "approved": 0,
-                "rejected": 0,
-                "total_amount": 0.0,
-                "requests": []
-            }
-        
-        import_groups[import_key]["rejected"] += 1
-        import_groups[import_key]["requests"].append(request)
-    
-    # Создаем пакетные уведомления для каждого пакета
-    for (import_id, created_by), stats in import_groups.items():
-        if stats["approved"] == 0 and stats["rejected"] == 0:
-            continue
-            
-        # Получаем сотрудника
-        employee = db.query(User).filter(User.id == created_by).first()
-        if not employee:
-            continue
-        
-        # Создаем уведомление для сотрудника
-        create_batch_processed_notification_for_employee(
-            db=db,
-            employee_id=employee.id,
-            deputy_name=current_user.full_name,
-            approved_count=stats["approved"],
-            rejected_count=stats["rejected"],
-            total_amount=stats["total_amount"],
-            import_id=import_id,
-            comment=approval_request.comment
-        )
+    db.flush()
+
+    # 2. Выбранные заявки → for_payment со ссылкой на согласование
+    approved = db.execute(
+        update(Request).where(
+            Request.status == 'approved_for_payment',
+            selected
+        ).values(
+            status='for_payment',
+            approval_process_id=approval_process.id,
+            updated_at=func.now()
+        ).returning(Request.id, Request.import_id, Request.created_by, Request.amount),
+        execution_options={"synchronize_session": False}
+    ).all()
+
+    if not approved:
+        db.rollback()
+        has_pending = db.query(Request.id).filter(
+            Request.status == "approved_for_payment"
+        ).first()
+        if not has_pending:
+            raise HTTPException(status_code=404, detail="Нет заявок на согласовании")
+        raise HTTPException(status_code=400, detail="Не выбраны заявки для согласования")
 
-    # 5. Создаем уведомление для казначейства
+    # 3. Остальные заявки (не выбранные) отклоняем
+    rejected = db.execute(
+        update(Request).where(
+            Request.status == 'approved_for_payment'
+        ).values(
+            status='rejected',
+            updated_at=func.now()
+        ).returning(Request.id, Request.import_id, Request.created_by, Request.amount),
+        execution_options={"synchronize_session": False}
+    ).all()
+
+    approved_count = len(approved)
+    rejected_count = len(rejected)
+    approved_amount = sum(float(row.amount) for row in approved)
+
+    approval_process.request_ids = [row.id for row in approved]
+
+    # Решения заместителя по каждой заявке (история согласования)
+    db.execute(
+        insert(ApprovalProcessRequest),
+        [
+            {"process_id": approval_process.id, "request_id": row.id, "decision": decision}
+            for rows, decision in ((approved, "approved"), (rejected, "rejected"))
+            for row in rows
+        ]
+    )
+
+    # 4. Уведомление для казначейства
     treasury_notification = TreasuryNotification(
         id=uuid.uuid4(),
         approval_process_id=approval_process.id,
@@ -499,33 +237,58 @@ async def approve_requests(
         deputy_name=current_user.full_name,
         comment=approval_request.comment,
         request_count=approved_count,
-        total_amount=db.query(func.sum(Request.amount)).filter(
-            Request.id.in_(list(approved_request_ids))
-        ).scalar() or 0,
+        total_amount=approved_amount,
         is_read=False
     )
-    
     db.add(treasury_notification)
-    db.commit()
-    
 
-    # 6. Создаем уведомление для заместителя о том, что казначейство уведомлено
+    # 5. Пакетные уведомления для сотрудников
+    # Группируем заявки по import_id и создателю (без импорта - по создателю)
+    import_groups = {}
+
+    for rows, outcome in ((approved, "approved"), (rejected, "rejected")):
+        for row in rows:
+            stats = import_groups.setdefault(
+                (row.import_id, row.created_by),
+                {"approved": 0, "rejected": 0, "total_amount": 0.0}
+            )
+            stats[outcome] += 1
+            if outcome == "approved":
+                stats["total_amount"] += float(row.amount)
+
+    notifications = [
+        batch_processed_notification_for_employee(
+            employee_id=created_by,
+            deputy_name=current_user.full_name,
+            approved_count=stats["approved"],
+            rejected_count=stats["rejected"],
+            total_amount=stats["total_amount"],
+            import_id=import_id,
+            comment=approval_request.comment
+        )
+        for (import_id, created_by), stats in import_groups.items()
+    ]
+
+    # 6. Уведомление для заместителя о том, что казначейство уведомлено
     # Получаем пользователя казначейства
     treasury_user = db.query(User).filter(User.role == "treasury").first()
     if treasury_user:
-        create_batch_treasury_notification_for_deputy(
-            db=db,
+        notifications.append(batch_treasury_notification_for_deputy(
             deputy_id=current_user.id,
             treasury_user=treasury_user,
             approved_count=approved_count,
-            total_amount=treasury_notification.total_amount,
+            total_amount=approved_amount,
             import_id=None,  # Пока не связываем с импортом
             comment=approval_request.comment
-        )
-        logger.info(f"Создано уведомление для заместителя о передаче в казначейство: {approved_count} заявок")
+        ))
     else:
         logger.warning("Не найден пользователь казначейства для отправки уведомления")
 
+    # Все уведомления - одним INSERT, фиксируются вместе со сменой статусов
+    create_notifications(db, notifications)
+
+    db.commit()
+
     return {
         "message": f"Успешно согласовано {approved_count} заявок, отклонено {rejected_count}",
         "approved_count": approved_count,
@@ -534,48 +297,79 @@ async def approve_requests(
         "approval_process_id": str(approval_process.id)
     }
 
-# Вспомогательная функция для получения заявок по категории
-def get_requests_by_category(db: Session, category: str, status: str = 'pending'):
+@router.get("/processes/{process_id}/requests", response_model=List[RequestResponse])
+async def get_process_requests(
+    process_id: uuid.UUID,
+    response: Response,
+    decision: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
     """
-    Получение заявок по категории для кабинета заместителя
+    Заявки процесса согласования постранично
+
+    decision - фильтр по решению (submitted, approved, rejected). Курсор
+    следующей страницы - в заголовке X-Next-Cursor.
     """
-    from sqlalchemy import or_, and_
-    
-    query = db.query(Request).filter(Request.status == status)
-    
-    if category == 'all':
-        # Все заявки со статусом pending
-        pass
-    elif category == 'pitanie_projivanie':
-        query = query.filter(
-            Request.employee_category == 'pitanie_projivanie',
-            Request.source == 'employee'
-        )
-    elif category == 'graphs':
-        query = query.filter(
-            Request.treasury_import_type == 'graphs',
-            Request.source == 'treasury'
-        )
-    elif category == 'approved_by_director':
-        query = query.filter(
-            Request.treasury_import_type == 'approved_by_director',
-            Request.source == 'treasury'
-        )
-    elif category == 'non_transferable':
-        query = query.filter(
-            Request.treasury_import_type == 'non_transferable',
-            Request.source == 'treasury'
-        )
-    elif category == 'filialy':
-        query = query.filter(
-            or_(
-                Request.employee_category == 'filialy',
-                and_(
-                    Request.employee_category.is_(None),
-                    Request.source == 'employee',
-                    Request.treasury_import_type.is_(None)
-                )
-            )
-        )
-    
-    return query.all()
\ No newline at end of file
+    if current_user.role not in ("deputy_director", "treasury"):
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+
+    process_exists = db.query(ApprovalProcess.id).filter(
+        ApprovalProcess.id == process_id
+    ).first()
+    if not process_exists:
+        raise HTTPException(status_code=404, detail="Процесс согласования не найден")
+
+    selected_fields = parse_fields(fields, REQUEST_FIELDS)
+    query = db.query(Request).join(
+        ApprovalProcessRequest, ApprovalProcessRequest.request_id == Request.id
+    ).filter(ApprovalProcessRequest.process_id == process_id)
+
+    if decision:
+        query = query.filter(ApprovalProcessRequest.decision == decision)
+
+    total = estimate_count(db, query, cursor)
+    query = project_request_fields(query, selected_fields)
+    requests, next_cursor = paginate(query, cursor, limit)
+
+    return page_response(response, requests, next_cursor, total, selected_fields)
+
+@router.get("/requests/{request_id}/history", response_model=List[ApprovalHistoryItem])
+async def get_request_approval_history(
+    request_id: uuid.UUID,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    История согласования заявки: процессы, в которые она входила, и решения по ней
+    """
+    request = db.query(Request.id, Request.created_by).filter(Request.id == request_id).first()
+    if not request:
+        raise HTTPException(status_code=404, detail="Заявка не найдена")
+
+    if current_user.role == "employee" and request.created_by != current_user.id:
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+
+    rows = db.query(
+        ApprovalProcessRequest.process_id,
+        ApprovalProcessRequest.decision,
+        ApprovalProcess.category,
+        ApprovalProcess.status.label("process_status"),
+        ApprovalProcess.deputy_id,
+        User.full_name.label("deputy_name"),
+        ApprovalProcess.comment,
+        ApprovalProcess.treasury_comment,
+        ApprovalProcess.created_at,
+        ApprovalProcess.approved_at
+    ).join(
+        ApprovalProcess, ApprovalProcess.id == ApprovalProcessRequest.process_id
+    ).outerjoin(
+        User, User.id == ApprovalProcess.deputy_id
+    ).filter(
+        ApprovalProcessRequest.request_id == request_id
+    ).order_by(ApprovalProcess.created_at, ApprovalProcessRequest.process_id).all()
+
+    return [ApprovalHistoryItem(**row._mapping) for row in rows]
@@ -0,0 +1,220 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Header
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from typing import List, Optional, Tuple
+from pathlib import Path
+from urllib.parse import quote
+import re
+import uuid
+
+from app.database import get_db
+from app.models import ExportJob, User
+from app.schemas import ExportJobResponse, ExportType, StatisticsExportParams
+from app.auth import get_current_user, require_treasury
+from app.utils.excel_export import XLSX_MEDIA_TYPE, EXPORT_CHUNK_SIZE
+from app.routes.treasury import ExportRequest, payment_register_file_name
+from app.routes.statistics import statistics_file_name
+from app.tasks import run_export_job
+
+router = APIRouter()
+
+# Поддерживается один диапазон: bytes=начало-конец, bytes=начало- и bytes=-длина
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def create_export_job(
+    db: Session,
+    user: User,
+    export_type: ExportType,
+    params: dict,
+    file_name: str
+) -> ExportJob:
+    """
+    Создание задания на выгрузку и постановка его в очередь
+    """
+    job = ExportJob(
+        user_id=user.id,
+        export_type=export_type.value,
+        params=params,
+        status="queued",
+        progress=0,
+        file_name=file_name
+    )
+
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+    run_export_job.delay(str(job.id))
+
+    return job
+
+def get_user_export_job(db: Session, job_id: uuid.UUID, user: User) -> ExportJob:
+    """
+    Задание на выгрузку текущего пользователя
+    """
+    job = db.query(ExportJob).filter(
+        ExportJob.id == job_id,
+        ExportJob.user_id == user.id
+    ).first()
+
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Выгрузка не найдена"
+        )
+
+    return job
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Диапазон байтов (начало, конец включительно) из заголовка Range
+
+    Нераспознанный заголовок игнорируется (отдается весь файл),
+    недопустимый диапазон - ошибка 416.
+    """
+    match = RANGE_PATTERN.match(range_header.strip())
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+
+    if not start:
+        # Последние N байт файла
+        length = int(end)
+        start, end = max(size - length, 0), size - 1
+        if length == 0:
+            start = size
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Недопустимый диапазон",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+
+    return start, end
+
+def iter_file_range(path: Path, start: int, end: int):
+    """
+    Чтение части файла с start по end включительно
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(EXPORT_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+@router.post("/treasury-payments", response_model=ExportJobResponse)
+async def create_treasury_payments_export(
+    export_data: ExportRequest,
+    current_user: User = Depends(require_treasury),
+    db: Session = Depends(get_db)
+):
+    """
+    Фоновая выгрузка заявок к оплате (аналог POST /api/treasury/export)
+    """
+    return create_export_job(
+        db,
+        current_user,
+        ExportType.TREASURY_PAYMENTS,
+        export_data.model_dump(mode="json"),
+        payment_register_file_name()
+    )
+
+@router.post("/statistics", response_model=ExportJobResponse)
+async def create_statistics_export(
+    params: StatisticsExportParams,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Фоновая выгрузка статистики (аналог GET /api/statistics/export)
+    """
+    if params.group_by not in ("article", "organization", "department", "recipient"):
+        raise HTTPException(status_code=400, detail="Некорректный параметр группировки")
+
+    return create_export_job(
+        db,
+        current_user,
+        ExportType.STATISTICS,
+        params.model_dump(mode="json"),
+        statistics_file_name(current_user)
+    )
+
+@router.get("/", response_model=List[ExportJobResponse])
+async def get_export_jobs(
+    skip: int = 0,
+    limit: int = 50,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Список выгрузок пользователя
+    """
+    return db.query(ExportJob).filter(
+        ExportJob.user_id == current_user.id
+    ).order_by(ExportJob.created_at.desc()).offset(skip).limit(limit).all()
+
+@router.get("/{job_id}", response_model=ExportJobResponse)
+async def get_export_job(
+    job_id: uuid.UUID,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Состояние выгрузки
+    """
+    return get_user_export_job(db, job_id, current_user)
+
+@router.get("/{job_id}/download")
+async def download_export(
+    job_id: uuid.UUID,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Скачивание готовой выгрузки (с поддержкой заголовка Range для докачки)
+    """
+    job = get_user_export_job(db, job_id, current_user)
+
+    if job.status != "completed":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Выгрузка еще не готова"
+        )
+
+    path = Path(job.file_path) if job.file_path else None
+    if not path or not path.exists():
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Файл выгрузки удален по истечении срока хранения"
+        )
+
+    size = path.stat().st_size
+    byte_range = parse_range(range_header, size) if range_header else None
+    start, end = byte_range or (0, size - 1)
+
+    headers = {
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(job.file_name, safe='')}",
+        "Content-Length": str(end - start + 1),
+        "Accept-Ranges": "bytes",
+    }
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    return StreamingResponse(
+        iter_file_range(path, start, end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK,
+        media_type=XLSX_MEDIA_TYPE,
+        headers=headers
+    )
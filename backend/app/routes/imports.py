@@ -4,18 +4,16 @@ from typing import List
 import os
 import uuid
 from datetime import datetime
-import pytz
 import openpyxl
 from io import BytesIO
 
 from app.database import get_db
-from app.models import Import, Request, User
+from app.models import Import, User
 from app.schemas import ImportCreate, ImportResponse, RequestCreate, ImportType, Category
 from app.auth import get_current_user, require_employee
-from app.utils.categorization import categorize_request
 import logging
-from app.utils.excel_processor import process_excel_file
-from app.routes.notifications import create_batch_for_approval_notification
+from app.utils.import_pipeline import stage_upload, fail_import
+from app.tasks import process_excel_import_task
 
 router = APIRouter()
 
@@ -61,127 +59,40 @@ async def import_excel(
         file_size=sum([f.size for f in files]),
         payment_date=datetime.strptime(payment_date, "%Y-%m-%d").date(),
         comment=comment,
-        status="processing"
+        status="queued",
+        progress=0
     )
     
     db.add(db_import)
     db.commit()
     db.refresh(db_import)
     
-    imported_count = 0
-    skipped_count = 0
-    errors = []
-    
+    # Файлы сохраняются в область хранения, разбор и вставка заявок
+    # выполняются фоновой задачей, а не в обработчике запроса
     try:
-        for file in files:
-            # Валидация размера файла
-            if file.size > 5 * 1024 * 1024:  # 5 MB
-                errors.append(f"Файл {file.filename} превышает лимит 5 МБ")
-                skipped_count += 1
-                continue
-            
-            # Чтение содержимого файла
-            content = await file.read()
-            
-            try:
-                # Обработка Excel файла
-                logger.info(f"Processing file {file.filename}, size: {len(content)} bytes")
-                requests_data = process_excel_file(content)
-                logger.info(f"Processed {len(requests_data)} rows from file {file.filename}")
-                
-                # Создание заявок
-                for request_data in requests_data:
-                    try:
-                        db_request = Request(
-                            article=request_data.get("Статья ДДС", ""),
-                            amount=float(request_data.get("Сумма", 0)),
-                            recipient=request_data.get("Получатель", ""),
-                            request_number=request_data.get("Номер заявки", ""),
-                            request_date=pytz.timezone('Europe/Moscow').localize(datetime.strptime(
-                                request_data.get("Дата заявки", "2024-01-01"),
-                                "%d.%m.%Y %H:%M:%S"
-                            )),
-                            organization=request_data.get("Организация", ""),
-                            department=request_data.get("Подразделение", ""),
-                            purpose=request_data.get("Назначение", ""),
-                            applicant=request_data.get("Заявитель", current_user.full_name),
-                            category="subdivisions",  # По умолчанию
-                            import_type="regular",
-                            created_by=current_user.id,
-                            import_id=db_import.id,
-                            source='treasury' if current_user.role == 'treasury' else 'employee',
-                            status="draft"
-                        )
-
-                        
-                        db.add(db_request)
-
-                        # Автоматическая категоризация
-                        categorize_request(db_request, db)
-
-                        logger.info(f"Created request: {db_request.request_number}, amount: {db_request.amount}")
-                        imported_count += 1
-                        
-                    except Exception as e:
-                        errors.append(f"Ошибка при обработке строки в файле {file.filename}: {str(e)}")
-                        skipped_count += 1
-                
-            except Exception as e:
-                errors.append(f"Ошибка при обработке файла {file.filename}: {str(e)}")
-                skipped_count += 1
-        
-        # Обновление статуса импорта
-        db_import.status = "completed"
-        db_import.imported_count = imported_count
-        db_import.skipped_count = skipped_count
-        
-        if errors:
-            db_import.error_message = "; ".join(errors[:5])  # Сохраняем первые 5 ошибок
-        
-        db.commit()
-        
-
-        # Создание пакетного уведомления для заместителя
-        try:
-            # Получаем всех заместителей
-            deputies = db.query(User).filter(User.role == "deputy_director").all()
-            
-            # Получаем статистику по импортированным заявкам
-            imported_requests = db.query(Request).filter(Request.import_id == db_import.id).all()
-            
-            if imported_requests:
-                # Рассчитываем общую сумму
-                total_amount = sum([req.amount for req in imported_requests])
-                
-                # Собираем уникальные категории
-                categories = list(set([req.category for req in imported_requests]))
-                
-                # Отправляем уведомление каждому заместителю
-                for deputy in deputies:
-                    create_batch_for_approval_notification(
-                        db=db,
-                        deputy_id=deputy.id,
-                        import_id=db_import.id,
-                        request_count=len(imported_requests),
-                        categories=categories,
-                        total_amount=total_amount,
-                        imported_by_user=current_user
-                    )
-                
-                logger.info(f"Создано пакетное уведомление для заместителей о {len(imported_requests)} заявках")
-        except Exception as e:
-            logger.error(f"Ошибка при создании уведомления: {str(e)}")
-            # Не прерываем импорт из-за ошибки уведомления
+        for index, file in enumerate(files):
+            await stage_upload(db_import.id, index, file)
     except Exception as e:
-        # В случае общей ошибки
-        db_import.status = "failed"
-        db_import.error_message = str(e)
-        db.commit()
+        # Частично записанные файлы удаляются вместе с отметкой failed
+        fail_import(db, db_import, str(e))
         
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Ошибка при импорте: {str(e)}"
+            detail=f"Ошибка при сохранении файлов: {str(e)}"
+        )
+    
+    try:
+        process_excel_import_task.delay(str(db_import.id))
+    except Exception as e:
+        # Брокер недоступен: задача не поставлена, импорт не будет обработан
+        logger.error(f"Не удалось поставить импорт {db_import.id} в очередь: {str(e)}")
+        fail_import(db, db_import, f"Не удалось поставить импорт в очередь: {str(e)}")
+        
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Очередь импорта временно недоступна, повторите загрузку позже"
         )
+    logger.info(f"Import {db_import.id} queued: {len(files)} files")
     
     return db_import
 
@@ -1,18 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request as HTTPRequest
+from fastapi.responses import StreamingResponse
 import logging
+import redis
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import uuid
 from datetime import datetime, timedelta
-from sqlalchemy import func, or_
+from sqlalchemy import func, or_, insert, update
 
-from app.database import get_db
+from app.database import get_db, SessionLocal
 from app.models import User, UserNotification, Request, ApprovalProcess, Import
-from app.schemas import UserNotificationResponse, NotificationType
-from app.auth import get_current_user
+from app.schemas import UserNotificationResponse, UserNotificationCreate, NotificationType
+from app.auth import get_current_user, get_user_by_token
+from app.utils.notification_events import (
+    get_unread_count as get_cached_unread_count,
+    add_unread,
+    open_unread_count_subscription,
+    close_unread_count_subscription,
+    iter_unread_count_events
+)
 
 router = APIRouter()
 
+logger = logging.getLogger(__name__)
+
 @router.get("/user-notifications", response_model=List[UserNotificationResponse])
 async def get_user_notifications(
     unread_only: bool = False,
@@ -49,13 +60,10 @@ async def get_unread_count(
     db: Session = Depends(get_db)
 ):
     """
-    Получение количества непрочитанных уведомлений
+    Получение количества непрочитанных уведомлений (счетчик в Redis)
     """
     try:
-        count = db.query(UserNotification).filter(
-            UserNotification.user_id == current_user.id,
-            UserNotification.is_read == False
-        ).count()
+        count = get_cached_unread_count(db, current_user.id)
 
         return {"unread_count": count}
     except Exception as e:
@@ -72,18 +80,30 @@ async def mark_notification_read(
     Отметка уведомления как прочитанного
     """
     try:
-        notification = db.query(UserNotification).filter(
-            UserNotification.id == notification_id,
-            UserNotification.user_id == current_user.id
-        ).first()
+        # Условие NOT is_read: счетчик уменьшается, только если уведомление
+        # действительно было непрочитанным (и только одним из параллельных запросов)
+        result = db.execute(
+            update(UserNotification).where(
+                UserNotification.id == notification_id,
+                UserNotification.user_id == current_user.id,
+                UserNotification.is_read == False
+            ).values(is_read=True),
+            execution_options={"synchronize_session": False}
+        )
 
-        if not notification:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Уведомление не найдено"
-            )
+        if result.rowcount:
+            add_unread(db, [current_user.id], -1)
+        else:
+            exists = db.query(UserNotification.id).filter(
+                UserNotification.id == notification_id,
+                UserNotification.user_id == current_user.id
+            ).first()
+            if not exists:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Уведомление не найдено"
+                )
 
-        notification.is_read = True
         db.commit()
 
         return {"message": "Уведомление отмечено как прочитанное"}
@@ -96,6 +116,51 @@ async def mark_notification_read(
             detail="Внутренняя ошибка сервера"
         )
 
+@router.get("/user-notifications/stream")
+async def stream_unread_count(
+    http_request: HTTPRequest,
+    token: str = Query(...)
+):
+    """
+    Поток Server-Sent Events с числом непрочитанных уведомлений
+
+    Заменяет периодический опрос /user-notifications/count. EventSource не
+    передает заголовки, поэтому токен - в параметре token. Сессия БД нужна
+    только на старте (пользователь и текущее число) и не держится на время потока.
+    Если Redis недоступен - 503 до начала потока: EventSource не переподключается
+    после ответа с ошибкой, и клиент переходит на опрос.
+    """
+    db = SessionLocal()
+    try:
+        user = get_user_by_token(db, token)
+
+        try:
+            client, pubsub = await open_unread_count_subscription(user.id)
+        except redis.RedisError as e:
+            logger.warning(f"Поток уведомлений недоступен: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Поток уведомлений временно недоступен"
+            )
+
+        try:
+            unread_count = get_cached_unread_count(db, user.id)
+        except Exception:
+            await close_unread_count_subscription(client, pubsub)
+            raise
+    finally:
+        db.close()
+
+    return StreamingResponse(
+        iter_unread_count_events(client, pubsub, unread_count, http_request.is_disconnected),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Отключение буферизации ответа в nginx
+            "X-Accel-Buffering": "no"
+        }
+    )
+
 # Остальные функции пока не нужны для тестирования
 
 @router.get("/test-notifications", response_model=List[UserNotificationResponse])
@@ -104,99 +169,82 @@ async def test_notifications():
     return []
 
 # Вспомогательные функции для создания уведомлений
-def create_notification(
-    db: Session,
-    user_id: uuid.UUID,
-    notification_type: NotificationType,
-    title: str,
-    message: str,
-    data: Optional[dict] = None,
-    request_id: Optional[uuid.UUID] = None,
-    approval_process_id: Optional[uuid.UUID] = None,
-    import_id: Optional[uuid.UUID] = None
-):
-    """
-    Создание нового уведомления
-    """
-    notification = UserNotification(
-        user_id=user_id,
-        notification_type=notification_type,
-        title=title,
-        message=message,
-        data=data,
-        request_id=request_id,
-        approval_process_id=approval_process_id,
-        import_id=import_id
-    )
-
-    db.add(notification)
-    db.commit()
-    db.refresh(notification)
-
-    return notification
+#
+# Уведомления создаются в транзакции вызывающего кода (без commit): изменения
+# данных и уведомления о них фиксируются вместе. Рассылка нескольким
+# пользователям - один многострочный INSERT через create_notifications.
 
-# Функции для создания специфичных уведомлений
+# Сколько уведомлений вставлять одним INSERT (ограничение числа параметров запроса)
+NOTIFICATION_INSERT_CHUNK_SIZE = 1000
 
+def create_notifications(db: Session, specs: List[UserNotificationCreate]) -> List[uuid.UUID]:
+    """
+    Создание пакета уведомлений одним многострочным INSERT (без commit)
 
+    Возвращает id созданных уведомлений в порядке specs.
+    """
+    rows = [
+        {"id": uuid.uuid4(), "is_read": False, **spec.model_dump()}
+        for spec in specs
+    ]
 
-    category_name = category_names.get(category, category)
+    for start in range(0, len(rows), NOTIFICATION_INSERT_CHUNK_SIZE):
+        db.execute(insert(UserNotification).values(rows[start:start + NOTIFICATION_INSERT_CHUNK_SIZE]))
 
-    return create_notification(
-        db=db,
-        user_id=deputy_id,
-        notification_type=NotificationType.NEW_REQUESTS_FOR_APPROVAL,
-        title="Новые заявки на согласование",
-        message=f"Поступило {request_count} новых заявок в категории '{category_name}' для согласования",
-        data={
-            "request_count": request_count,
-            "category": category,
-            "category_name": category_name
-        }
-    )
+    # Счетчики непрочитанных получателей обновляются после commit
+    add_unread(db, [row["user_id"] for row in rows])
 
+    return [row["id"] for row in rows]
 
-# Функции для пакетных уведомлений (оптимизированная версия)
-def create_batch_requests_notification(
+def create_notification(
     db: Session,
     user_id: uuid.UUID,
-    batch_type: NotificationType,
+    notification_type: NotificationType,
     title: str,
     message: str,
-    batch_data: dict
-):
+    data: Optional[dict] = None,
+    request_id: Optional[uuid.UUID] = None,
+    approval_process_id: Optional[uuid.UUID] = None,
+    import_id: Optional[uuid.UUID] = None
+) -> uuid.UUID:
     """
-    Создание уведомления о пакете заявок
+    Создание нового уведомления (без commit), возвращает его id
     """
-    return create_notification(
-        db=db,
-        user_id=user_id,
-        notification_type=batch_type,
-        title=title,
-        message=message,
-        data=batch_data
-    )
+    return create_notifications(db, [
+        UserNotificationCreate(
+            user_id=user_id,
+            notification_type=notification_type,
+            title=title,
+            message=message,
+            data=data,
+            request_id=request_id,
+            approval_process_id=approval_process_id,
+            import_id=import_id
+        )
+    ])[0]
 
-def create_batch_for_approval_notification(
-    db: Session,
+# Пакетные уведомления: функции batch_* описывают уведомление,
+# create_batch_* - создают одно уведомление
+
+def batch_for_approval_notification(
     deputy_id: uuid.UUID,
-    import_id: uuid.UUID,
+    import_id: Optional[uuid.UUID],
     request_count: int,
     categories: List[str],
     total_amount: float,
     imported_by_user: User
-):
+) -> UserNotificationCreate:
     """
-    Создание уведомления о пакете заявок на согласование для заместителя
+    Уведомление о пакете заявок на согласование для заместителя
     """
     categories_str = ", ".join(categories[:3]) + (", ..." if len(categories) > 3 else "")
-    
-    return create_batch_requests_notification(
-        db=db,
+
+    return UserNotificationCreate(
         user_id=deputy_id,
-        batch_type=NotificationType.BATCH_REQUESTS_FOR_APPROVAL,
-        title=f"Новый пакет заявок на согласование",
+        notification_type=NotificationType.BATCH_REQUESTS_FOR_APPROVAL,
+        title="Новый пакет заявок на согласование",
         message=f"Сотрудник {imported_by_user.full_name} загрузил пакет из {request_count} заявок на сумму {total_amount:.2f} руб. Категории: {categories_str}",
-        batch_data={
+        data={
             "import_id": str(import_id),
             "request_count": request_count,
             "categories": categories,
@@ -206,8 +254,7 @@ def create_batch_for_approval_notification(
         }
     )
 
-def create_batch_processed_notification_for_employee(
-    db: Session,
+def batch_processed_notification_for_employee(
     employee_id: uuid.UUID,
     deputy_name: str,
     approved_count: int,
@@ -215,9 +262,9 @@ def create_batch_processed_notification_for_employee(
     total_amount: float,
     import_id: uuid.UUID = None,
     comment: str = ""
-):
+) -> UserNotificationCreate:
     """
-    Создание уведомления для сотрудника о результате обработки пакета заявок
+    Уведомление для сотрудника о результате обработки пакета заявок
     """
     if approved_count > 0 and rejected_count == 0:
         # Все заявки согласованы
@@ -241,43 +288,38 @@ def create_batch_processed_notification_for_employee(
     if comment:
         message += f"Комментарий: {comment[:100]}{'...' if len(comment) > 100 else ''}"
     
-    batch_data = {
-        "deputy_name": deputy_name,
-        "approved_count": approved_count,
-        "rejected_count": rejected_count,
-        "total_amount": total_amount,
-        "import_id": str(import_id) if import_id else None,
-        "comment": comment
-    }
-    
-    return create_batch_requests_notification(
-        db=db,
+    return UserNotificationCreate(
         user_id=employee_id,
-        batch_type=batch_type,
+        notification_type=batch_type,
         title=title,
         message=message,
-        batch_data=batch_data
+        data={
+            "deputy_name": deputy_name,
+            "approved_count": approved_count,
+            "rejected_count": rejected_count,
+            "total_amount": total_amount,
+            "import_id": str(import_id) if import_id else None,
+            "comment": comment
+        }
     )
 
-def create_batch_treasury_notification_for_deputy(
-    db: Session,
+def batch_treasury_notification_for_deputy(
     deputy_id: uuid.UUID,
     treasury_user: User,
     approved_count: int,
     total_amount: float,
     import_id: uuid.UUID = None,
     comment: str = ""
-):
+) -> UserNotificationCreate:
     """
-    Создание уведомления для заместителя о том, что казначейство получило уведомление о пакете
+    Уведомление для заместителя о том, что казначейство получило уведомление о пакете
     """
-    return create_batch_requests_notification(
-        db=db,
+    return UserNotificationCreate(
         user_id=deputy_id,
-        batch_type=NotificationType.TREASURY_NOTIFICATION,
+        notification_type=NotificationType.TREASURY_NOTIFICATION,
         title="Пакет заявок передан в казначейство",
         message=f"Казначейство ({treasury_user.full_name}) получило уведомление о {approved_count} согласованных заявках на сумму {total_amount:.2f} руб.",
-        batch_data={
+        data={
             "treasury_user": treasury_user.full_name,
             "approved_count": approved_count,
             "total_amount": total_amount,
@@ -286,6 +328,24 @@ def create_batch_treasury_notification_for_deputy(
         }
     )
 
+def create_batch_for_approval_notification(db: Session, **kwargs) -> uuid.UUID:
+    """
+    Создание уведомления о пакете заявок на согласование для заместителя (без commit)
+    """
+    return create_notifications(db, [batch_for_approval_notification(**kwargs)])[0]
+
+def create_batch_processed_notification_for_employee(db: Session, **kwargs) -> uuid.UUID:
+    """
+    Создание уведомления для сотрудника о результате обработки пакета заявок (без commit)
+    """
+    return create_notifications(db, [batch_processed_notification_for_employee(**kwargs)])[0]
+
+def create_batch_treasury_notification_for_deputy(db: Session, **kwargs) -> uuid.UUID:
+    """
+    Создание уведомления для заместителя о передаче пакета в казначейство (без commit)
+    """
+    return create_notifications(db, [batch_treasury_notification_for_deputy(**kwargs)])[0]
+
 @router.post("/user-notifications/mark-all-read")
 async def mark_all_notifications_read(
     current_user: User = Depends(get_current_user),
@@ -298,20 +358,21 @@ async def mark_all_notifications_read(
         # Создаем logger для этой функции
         logger = logging.getLogger(__name__)
         
-        # Находим все непрочитанные уведомления пользователя
-        unread_notifications = db.query(UserNotification).filter(
-            UserNotification.user_id == current_user.id,
-            UserNotification.is_read == False
-        ).all()
-
-        # Отмечаем все как прочитанные
-        for notification in unread_notifications:
-            notification.is_read = True
-
+        # Все непрочитанные уведомления пользователя - одним UPDATE
+        marked_count = db.execute(
+            update(UserNotification).where(
+                UserNotification.user_id == current_user.id,
+                UserNotification.is_read == False
+            ).values(is_read=True),
+            execution_options={"synchronize_session": False}
+        ).rowcount
+
+        # Приращение, а не обнуление: уведомление, созданное параллельно, не теряется
+        add_unread(db, [current_user.id], -marked_count)
         db.commit()
 
         logger.info(f"Отмечены все уведомления как прочитанные для пользователя {current_user.id}")
-        return {"message": f"Отмечено {len(unread_notifications)} уведомлений как прочитанных", "marked_count": len(unread_notifications)}
+        return {"message": f"Отмечено {marked_count} уведомлений как прочитанных", "marked_count": marked_count}
 
     except Exception as e:
         db.rollback()
@@ -1,5 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.orm import Session
+from sqlalchemy import update, delete, func
 from typing import List, Optional
 from datetime import datetime, date
 import uuid
@@ -9,14 +10,20 @@ from app.models import Request, User
 from app.routes.notifications import create_batch_for_approval_notification
 from app.schemas import RequestCreate, RequestUpdate, RequestResponse, RequestStatus, BulkStatusUpdate, BulkDelete
 from app.auth import get_current_user, require_employee, require_deputy_director, require_treasury
+from app.utils.pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, REQUEST_FIELDS, estimate_count, paginate, page_response, parse_fields, project_request_fields
+)
 
 router = APIRouter()
 
 @router.get("", response_model=List[RequestResponse])
 @router.get("/", response_model=List[RequestResponse])
 async def get_requests(
+    response: Response,
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
     status: Optional[RequestStatus] = None,
     category: Optional[str] = None,
     start_date: Optional[date] = None,
@@ -26,7 +33,11 @@ async def get_requests(
 ):
     """
     Получение списка заявок с фильтрацией
+
+    Постраничная выдача по курсору (заголовок X-Next-Cursor); skip оставлен
+    для совместимости. fields - список нужных полей через запятую.
     """
+    selected_fields = parse_fields(fields, REQUEST_FIELDS)
     query = db.query(Request)
 
     # Фильтрация по пользователю (сотрудники видят только свои заявки)
@@ -46,10 +57,17 @@ async def get_requests(
     if end_date:
         query = query.filter(Request.created_at <= end_date)
 
+    total = estimate_count(db, query, cursor)
+    query = project_request_fields(query, selected_fields)
+
     # Сортировка и пагинация
-    requests = query.order_by(Request.created_at.desc()).offset(skip).limit(limit).all()
+    if skip and not cursor:
+        requests = query.order_by(Request.created_at.desc()).offset(skip).limit(limit).all()
+        next_cursor = None
+    else:
+        requests, next_cursor = paginate(query, cursor, limit)
 
-    return requests
+    return page_response(response, requests, next_cursor, total, selected_fields)
 
 @router.post("/", response_model=RequestResponse, status_code=status.HTTP_201_CREATED)
 async def create_request(
@@ -175,6 +193,49 @@ async def update_request(
     
     return request
 
+def unmatched_outcomes(
+    db: Session,
+    request_ids: List[uuid.UUID],
+    matched_ids: set,
+    user: User,
+    draft_only: bool = False,
+    owner_only: bool = False
+) -> List[dict]:
+    """
+    Причины, по которым заявки не попали под массовую операцию
+
+    Одним запросом по заявкам, которые не вернул UPDATE/DELETE ... RETURNING.
+    owner_only - операция разрешена только автору заявки при любой роли.
+    """
+    unmatched = [request_id for request_id in dict.fromkeys(request_ids) if request_id not in matched_ids]
+    if not unmatched:
+        return []
+
+    existing = {
+        row.id: row
+        for row in db.query(Request.id, Request.created_by, Request.status).filter(
+            Request.id.in_(unmatched)
+        )
+    }
+
+    outcomes = []
+    for request_id in unmatched:
+        row = existing.get(request_id)
+        if row is None:
+            outcomes.append({"request_id": str(request_id), "reason": "not_found", "detail": "Заявка не найдена"})
+        elif (owner_only or user.role == "employee") and row.created_by != user.id:
+            outcomes.append({"request_id": str(request_id), "reason": "forbidden", "detail": "Недостаточно прав"})
+        elif draft_only and row.status != "draft":
+            outcomes.append({
+                "request_id": str(request_id),
+                "reason": "not_draft",
+                "detail": f"Можно удалять только черновики, заявка имеет статус {row.status}"
+            })
+        else:
+            outcomes.append({"request_id": str(request_id), "reason": "skipped", "detail": "Заявка не изменена"})
+
+    return outcomes
+
 @router.post("/bulk/status")
 async def bulk_update_status(
     bulk_data: BulkStatusUpdate,
@@ -183,31 +244,34 @@ async def bulk_update_status(
 ):
     """
     Массовое обновление статуса заявок
+
+    Один UPDATE ... RETURNING; сотрудник может менять только свои заявки
+    (условие в WHERE). Не обновленные заявки перечисляются в failed с причиной.
     """
+    query = update(Request).where(Request.id.in_(bulk_data.request_ids))
+
     if current_user.role == "employee":
         # Сотрудник может отправлять только свои заявки на согласование
-        for request_id in bulk_data.request_ids:
-            request = db.query(Request).filter(Request.id == request_id).first()
-            if request and request.created_by != current_user.id:
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail=f"Недостаточно прав для обновления заявки {request_id}"
-                )
-    
-    # Обновление статуса
-    updated_count = 0
-    for request_id in bulk_data.request_ids:
-        request = db.query(Request).filter(Request.id == request_id).first()
-        if request:
-            request.status = bulk_data.status
-            request.updated_at = datetime.utcnow()
-            updated_count += 1
-    
+        query = query.where(Request.created_by == current_user.id)
+
+    updated = db.execute(
+        query.values(status=bulk_data.status, updated_at=func.now()).returning(Request.id, Request.status),
+        execution_options={"synchronize_session": False}
+    ).all()
+
+    failed = unmatched_outcomes(db, bulk_data.request_ids, {row.id for row in updated}, current_user)
+
     db.commit()
-    
+
+    message = f"Статус {len(updated)} заявок обновлен"
+    if failed:
+        message += f", не обновлено: {len(failed)}"
+
     return {
-        "message": f"Статус {updated_count} заявок обновлен",
-        "updated_count": updated_count
+        "message": message,
+        "updated_count": len(updated),
+        "updated": [{"request_id": str(row.id), "status": row.status} for row in updated],
+        "failed": failed
     }
 
 @router.post("/bulk/delete")
@@ -218,33 +282,32 @@ async def bulk_delete_requests(
 ):
     """
     Массовое удаление заявок
+
+    Один DELETE ... RETURNING: удаляются только свои черновики (условия в WHERE).
+    Не удаленные заявки перечисляются в failed с причиной.
     """
-    deleted_count = 0
-    
-    for request_id in bulk_data.request_ids:
-        request = db.query(Request).filter(Request.id == request_id).first()
-        
-        if request:
-            # Проверка прав доступа
-            if request.created_by != current_user.id:
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail=f"Недостаточно прав для удаления заявки {request_id}"
-                )
-            
-            # Можно удалять только черновики
-            if request.status != "draft":
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Можно удалять только черновики. Заявка {request_id} имеет статус {request.status}"
-                )
-            
-            db.delete(request)
-            deleted_count += 1
-    
+    deleted = db.execute(
+        delete(Request).where(
+            Request.id.in_(bulk_data.request_ids),
+            Request.created_by == current_user.id,
+            Request.status == "draft"
+        ).returning(Request.id),
+        execution_options={"synchronize_session": False}
+    ).all()
+
+    failed = unmatched_outcomes(
+        db, bulk_data.request_ids, {row.id for row in deleted}, current_user,
+        draft_only=True, owner_only=True
+    )
+
     db.commit()
-    
+
+    message = f"Удалено {len(deleted)} заявок"
+    if failed:
+        message += f", не удалено: {len(failed)}"
+
     return {
-        "message": f"Удалено {deleted_count} заявок",
-        "deleted_count": deleted_count
+        "message": message,
+        "deleted_count": len(deleted),
+        "failed": failed
     }
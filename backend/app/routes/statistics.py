@@ -1,16 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_, or_
 from datetime import date, datetime, timedelta
 from typing import List, Optional
-import xlsxwriter
-from io import BytesIO
-from fastapi.responses import StreamingResponse
 
 from app.database import get_db
-from app.models import Request, User, ApprovalProcess
+from app.models import Request, User, ApprovalProcess, RequestStatsDaily
 from app.auth import get_current_user, require_role
 from app.schemas import RequestStatus, Category
+from app.utils.stats_rollup import rollup_covers
+from app.utils.pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, estimate_count, paginate, page_headers, page_response, parse_fields, project_request_fields
+)
+from app.utils.excel_export import EXPORT_YIELD_PER, ProgressCallback, build_xlsx, write_sheet, xlsx_response
 
 router = APIRouter()
 
@@ -25,58 +27,71 @@ def get_statistics_data(
 ):
     """
     Получение агрегированных данных для статистики
+
+    Период, не включающий сегодняшний день, считается по суточным итогам
+    request_stats_daily, иначе - по таблице заявок.
     """
-    # Базовый запрос в зависимости от роли
-    if user.role == "employee":
-        # Сотрудник: только свои заявки, исключаем черновики
-        base_query = db.query(Request).filter(
-            Request.created_by == user.id,
-            Request.status != RequestStatus.DRAFT.value
-        )
-    elif user.role == "deputy_director":
-        # Заместитель: все заявки (кроме черновиков)
-        base_query = db.query(Request).filter(
-            Request.status != RequestStatus.DRAFT.value
-        )
-    elif user.role == "treasury":
-        # Казначейство: все заявки, исключая черновики
-        base_query = db.query(Request).filter(
-            Request.status != RequestStatus.DRAFT.value
-        )
-    else:
+    if user.role not in ("employee", "deputy_director", "treasury"):
         raise HTTPException(status_code=403, detail="Недостаточно прав")
+    if group_by not in ("article", "organization", "department", "recipient"):
+        raise HTTPException(status_code=400, detail="Некорректный параметр группировки")
 
-    # Фильтр по статусу, если указан
-    if status_filter:
-        base_query = base_query.filter(Request.status == status_filter)
+    if rollup_covers(db, end_date):
+        # Черновиков в суточных итогах нет
+        group_by_field = getattr(RequestStatsDaily, group_by)
+        query = db.query(
+            group_by_field.label("group"),
+            func.sum(RequestStatsDaily.count).label("count"),
+            func.sum(RequestStatsDaily.total_amount).label("total_amount")
+        )
 
-    # Фильтр по дате создания заявки (created_at) вместо paid_at
-    if start_date:
-        base_query = base_query.filter(Request.created_at >= start_date)
-    if end_date:
-        base_query = base_query.filter(Request.created_at <= end_date)
-
-    # Определяем поле для группировки
-    group_by_field = None
-    if group_by == "article":
-        group_by_field = Request.article
-    elif group_by == "organization":
-        group_by_field = Request.organization
-    elif group_by == "department":
-        group_by_field = Request.department
-    elif group_by == "recipient":
-        group_by_field = Request.recipient
+        # Сотрудник: только свои заявки
+        if user.role == "employee":
+            query = query.filter(RequestStatsDaily.created_by == user.id)
+        if status_filter:
+            query = query.filter(RequestStatsDaily.status == status_filter)
+        if start_date:
+            query = query.filter(RequestStatsDaily.day >= start_date)
+        query = query.filter(RequestStatsDaily.day < end_date)
+
+        results = query.group_by(group_by_field).order_by(
+            func.sum(RequestStatsDaily.total_amount).desc()
+        ).all()
     else:
-        raise HTTPException(status_code=400, detail="Некорректный параметр группировки")
-
-    # Выполняем группировку и агрегацию
-    query = base_query.with_entities(
-        group_by_field.label("group"),
-        func.count(Request.id).label("count"),
-        func.sum(Request.amount).label("total_amount")
-    )
+        # Базовый запрос в зависимости от роли
+        if user.role == "employee":
+            # Сотрудник: только свои заявки, исключаем черновики
+            base_query = db.query(Request).filter(
+                Request.created_by == user.id,
+                Request.status != RequestStatus.DRAFT.value
+            )
+        else:
+            # Заместитель и казначейство: все заявки (кроме черновиков)
+            base_query = db.query(Request).filter(
+                Request.status != RequestStatus.DRAFT.value
+            )
+
+        # Фильтр по статусу, если указан
+        if status_filter:
+            base_query = base_query.filter(Request.status == status_filter)
+
+        # Фильтр по дате создания заявки (created_at) вместо paid_at
+        if start_date:
+            base_query = base_query.filter(Request.created_at >= start_date)
+        if end_date:
+            base_query = base_query.filter(Request.created_at <= end_date)
+
+        # Поле для группировки
+        group_by_field = getattr(Request, group_by)
+
+        # Выполняем группировку и агрегацию
+        query = base_query.with_entities(
+            group_by_field.label("group"),
+            func.count(Request.id).label("count"),
+            func.sum(Request.amount).label("total_amount")
+        )
 
-    results = query.group_by(group_by_field).order_by(func.sum(Request.amount).desc()).all()
+        results = query.group_by(group_by_field).order_by(func.sum(Request.amount).desc()).all()
 
     # Форматируем результат
     return [
@@ -88,8 +103,8 @@ def get_statistics_data(
         for item in results
     ]
 
-def get_detailed_requests(
-    db: Session,
+def filter_detailed_requests(
+    query,
     user: User,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
@@ -98,25 +113,26 @@ def get_detailed_requests(
     status_filter: Optional[str] = None
 ):
     """
-    Получение детальных заявок для статистики
+    Фильтры детальных заявок для статистики (по роли, статусу, периоду и группе)
     """
     # Базовый запрос в зависимости от роли
     if user.role == "employee":
         # Сотрудник: только свои заявки, исключаем черновики
-        query = db.query(Request).filter(
+        query = query.filter(
             Request.created_by == user.id,
             Request.status != RequestStatus.DRAFT.value
         )
     elif user.role == "deputy_director":
         # Заместитель: все заявки (кроме черновиков)
-        query = db.query(Request).filter(
+        query = query.filter(
             Request.status != RequestStatus.DRAFT.value
         )
     elif user.role == "treasury":
         # Казначейство: все заявки, исключая черновики
-        query = db.query(Request).filter(
+        query = query.filter(
             Request.status != RequestStatus.DRAFT.value
         )
+    else:
         raise HTTPException(status_code=403, detail="Недостаточно прав")
 
     # Фильтр по статусу, если указан
@@ -140,11 +156,23 @@ def get_detailed_requests(
         elif group_by == "recipient":
             query = query.filter(Request.recipient == group_value)
 
-    # Получаем заявки
-    requests = query.order_by(Request.created_at.desc()).all()
+    return query.order_by(Request.created_at.desc())
 
-    # Форматируем результат
-    return requests
+def get_detailed_requests(
+    db: Session,
+    user: User,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    group_by: str = "article",
+    group_value: Optional[str] = None,
+    status_filter: Optional[str] = None
+):
+    """
+    Получение детальных заявок для статистики
+    """
+    return filter_detailed_requests(
+        db.query(Request), user, start_date, end_date, group_by, group_value, status_filter
+    ).all()
 
 # Endpoint для получения данных дашборда
 @router.get("/dashboard")
@@ -182,22 +210,49 @@ async def get_statistics_dashboard(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Поля детального списка статистики
+DETAIL_FIELDS = [
+    "id", "article", "amount", "recipient", "request_number", "request_date", "status",
+    "organization", "department", "purpose", "payment_date", "applicant", "category",
+    "paid_at", "created_at", "created_by"
+]
+
 # Endpoint для получения детальных заявок
 @router.get("/details")
 async def get_statistics_details(
+    response: Response,
     start_date: Optional[date] = Query(None, description="Дата начала периода (YYYY-MM-DD)"),
     end_date: Optional[date] = Query(None, description="Дата окончания периода (YYYY-MM-DD)"),
     group_by: str = Query("article", description="Поле для группировки: article, organization, department, recipient"),
     group_value: Optional[str] = Query(None, description="Конкретное значение группы (например, название статьи)"),
     status: Optional[str] = Query(None, description="Фильтр по статусу заявки"),
+    cursor: Optional[str] = Query(None, description="Курсор страницы (заголовок X-Next-Cursor предыдущего ответа)"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Размер страницы"),
+    fields: Optional[str] = Query(None, description="Нужные поля через запятую"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
     Получение детального списка заявок для статистики
     """
+    with_creator = current_user.role in ["deputy_director", "treasury"]
+    selected_fields = parse_fields(
+        fields, [name for name in DETAIL_FIELDS if with_creator or name != "created_by"]
+    )
+
     try:
-        requests = get_detailed_requests(db, current_user, start_date, end_date, group_by, group_value, status)
+        query = filter_detailed_requests(
+            db.query(Request), current_user, start_date, end_date, group_by, group_value, status
+        )
+        total = estimate_count(db, query, cursor)
+        query = project_request_fields(query, selected_fields)
+
+        requests, next_cursor = paginate(query, cursor, limit)
+
+        if selected_fields:
+            return page_response(response, requests, next_cursor, total, selected_fields)
+
+        response.headers.update(page_headers(next_cursor, total))
 
         # Форматируем результат
         return [
@@ -217,13 +272,120 @@ async def get_statistics_details(
                 "category": req.category,
                 "paid_at": req.paid_at.isoformat() if req.paid_at else None,
                 "created_at": req.created_at.isoformat() if req.created_at else None,
-                "created_by": str(req.created_by) if current_user.role in ["deputy_director", "treasury"] else None
+                "created_by": str(req.created_by) if with_creator else None
             }
             for req in requests
         ]
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def statistics_file_name(user: User) -> str:
+    """
+    Имя файла выгрузки статистики
+    """
+    return f"statistics_{user.role}_{user.username}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+
+def build_statistics_workbook(
+    db: Session,
+    user: User,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    group_by: str = "article",
+    status: Optional[str] = None,
+    output=None,
+    progress_callback: Optional[ProgressCallback] = None
+):
+    """
+    Книга со статистикой и детальными данными
+
+    Детальные заявки читаются одним запросом (с именем создателя через
+    соединение с users) серверным курсором и пишутся в книгу xlsxwriter
+    в режиме constant_memory. Возвращает (файл, количество заявок).
+    """
+    # Получаем агрегированные данные
+    aggregated_data = get_statistics_data(db, user, start_date, end_date, group_by, status)
+    total = sum(item['count'] for item in aggregated_data)
+
+    # Создатель показывается заместителю и казначейству
+    with_creator = user.role in ["deputy_director", "treasury"]
+
+    detail_headers = [
+        "Статья ДДС", "Сумма", "Получатель", "Номер заявки",
+        "Дата заявки", "Статус", "Организация", "Подразделение", "Назначение",
+        "Дата оплаты (план)", "Дата оплаты (факт)", "Заявитель", "Категория"
+    ]
+    if with_creator:
+        detail_headers.append("Создатель")
+
+    details_query = filter_detailed_requests(
+        db.query(
+            Request.article,
+            Request.amount,
+            Request.recipient,
+            Request.request_number,
+            Request.request_date,
+            Request.status,
+            Request.organization,
+            Request.department,
+            Request.purpose,
+            Request.payment_date,
+            Request.paid_at,
+            Request.applicant,
+            Request.category,
+            User.full_name.label("creator_name")
+        ).outerjoin(User, User.id == Request.created_by),
+        user, start_date, end_date, group_by, None, status
+    )
+
+    def detail_rows():
+        for req in details_query.yield_per(EXPORT_YIELD_PER):
+            row = [
+                req.article,
+                req.amount,
+                req.recipient,
+                req.request_number,
+                req.request_date.strftime('%d.%m.%Y %H:%M:%S') if req.request_date else '',
+                req.status,
+                req.organization,
+                req.department,
+                req.purpose,
+                req.payment_date.strftime('%d.%m.%Y') if req.payment_date else '',
+                req.paid_at.strftime('%d.%m.%Y') if req.paid_at else '',
+                req.applicant,
+                req.category
+            ]
+            if with_creator:
+                row.append(req.creator_name or "Неизвестно")
+            yield row
+
+    # Форматирование суммы как денежного значения
+    money_format = {'num_format': '#,##0.00'}
+
+    def write(workbook):
+        if not aggregated_data:
+            return
+
+        # Лист со статистикой
+        write_sheet(
+            workbook, 'Статистика', ['Группа', 'Количество', 'Общая сумма'],
+            ((item['group'], item['count'], item['total_amount']) for item in aggregated_data),
+            column_formats={2: money_format}
+        )
+
+        # Лист с детальными данными (те же фильтры, что и у статистики)
+        write_sheet(
+            workbook, 'Детальные данные', detail_headers, detail_rows(),
+            column_formats={1: money_format},
+            column_width=20,
+            progress_callback=progress_callback,
+            total=total
+        )
+
+    output = build_xlsx(write, output)
+    return output, total
+
 # Endpoint для экспорта в Excel
 @router.get("/export")
 async def export_statistics_to_excel(
@@ -236,97 +398,16 @@ async def export_statistics_to_excel(
 ):
     """
     Экспорт статистики и детальных данных в Excel
+
+    Для больших выгрузок - фоновое задание POST /api/exports/statistics.
     """
     try:
-        # Получаем агрегированные данные
-        aggregated_data = get_statistics_data(db, current_user, start_date, end_date, group_by, status)
-
-        # Получаем детальные данные
-        detailed_requests = get_detailed_requests(db, current_user, start_date, end_date, group_by, None, status)
-
-        # Создаем Excel файл в памяти с помощью xlsxwriter
-        output = BytesIO()
-
-        # Создаем workbook
-        with xlsxwriter.Workbook(output, {'in_memory': True}) as workbook:
-            # Лист со статистикой
-            if aggregated_data:
-                stats_sheet = workbook.add_worksheet('Статистика')
-                # Заголовки
-                headers = ['Группа', 'Количество', 'Общая сумма']
-                for col, header in enumerate(headers):
-                    stats_sheet.write(0, col, header)
-
-                # Данные
-                for row, item in enumerate(aggregated_data, start=1):
-                    stats_sheet.write(row, 0, item['group'])
-                    stats_sheet.write(row, 1, item['count'])
-                    stats_sheet.write_number(row, 2, item['total_amount'])
-
-                # Форматирование суммы как денежного значения
-                money_format = workbook.add_format({'num_format': '#,##0.00'})
-                stats_sheet.set_column(2, 2, 15, money_format)
-
-            # Лист с детальными данными
-            if detailed_requests:
-                details_sheet = workbook.add_worksheet('Детальные данные')
-                # Определяем заголовки
-                detail_headers = [
-                    "Статья ДДС", "Сумма", "Получатель", "Номер заявки",
-                    "Дата заявки", "Статус", "Организация", "Подразделение", "Назначение",
-                    "Дата оплаты (план)", "Дата оплаты (факт)", "Заявитель", "Категория"
-                ]
-
-                # Добавляем поле "Создатель" для заместителя и казначейства
-                if current_user.role in ["deputy_director", "treasury"]:
-                    detail_headers.append("Создатель")
-
-                # Записываем заголовки
-                for col, header in enumerate(detail_headers):
-                    details_sheet.write(0, col, header)
-
-                # Записываем данные
-                for row, req in enumerate(detailed_requests, start=1):
-                    details_sheet.write(row, 0, req.article)
-                    details_sheet.write_number(row, 1, req.amount)
-                    details_sheet.write(row, 2, req.recipient)
-                    details_sheet.write(row, 3, req.request_number)
-                    details_sheet.write(row, 4, req.request_date.strftime('%d.%m.%Y %H:%M:%S') if req.request_date else '')
-                    details_sheet.write(row, 5, req.status)
-                    details_sheet.write(row, 6, req.organization)
-                    details_sheet.write(row, 7, req.department)
-                    details_sheet.write(row, 8, req.purpose)
-                    details_sheet.write(row, 9, req.payment_date.strftime('%d.%m.%Y') if req.payment_date else '')
-                    details_sheet.write(row, 10, req.paid_at.strftime('%d.%m.%Y') if req.paid_at else '')
-                    details_sheet.write(row, 11, req.applicant)
-                    details_sheet.write(row, 12, req.category)
-
-                    # Добавляем создателя для определенных ролей
-                    col_index = 13
-                    if current_user.role in ["deputy_director", "treasury"]:
-                        creator = db.query(User).filter(User.id == req.created_by).first()
-                        details_sheet.write(row, 13, creator.full_name if creator else "Неизвестно")
-                        col_index = 14
-
-                # Форматирование столбца с суммой
-                money_format = workbook.add_format({'num_format': '#,##0.00'})
-                details_sheet.set_column(1, 1, 15, money_format)
-
-                # Автоматическая ширина столбцов
-                for col in range(col_index):
-                    details_sheet.set_column(col, col, 20)
-
-        output.seek(0)
-
-        # Формируем имя файла
-        filename = f"statistics_{current_user.role}_{current_user.username}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
+        output, _ = build_statistics_workbook(db, current_user, start_date, end_date, group_by, status)
+
+        return xlsx_response(output, statistics_file_name(current_user))
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при экспорте: {str(e)}")
 
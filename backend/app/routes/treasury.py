@@ -1,20 +1,31 @@
-from urllib.parse import quote
+import hashlib
 from typing import List, Optional
 import uuid
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Response
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Response, Query
 from datetime import datetime, date, timedelta
-import pytz
-import openpyxl
-from io import BytesIO
 from sqlalchemy.orm import Session
-from sqlalchemy import func, or_
+from sqlalchemy import func, tuple_, case, distinct, insert, update, values, column
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
 from pydantic import BaseModel
 
 from app.database import get_db
-from app.models import TreasuryNotification, Request, User, Import, ApprovalProcess
+from app.models import TreasuryNotification, Request, User, Import, ApprovalProcess, ApprovalProcessRequest, DataVersion
 from app.schemas import RequestResponse, ImportType, Category
 from app.auth import get_current_user, require_treasury
-from app.utils.excel_processor import process_excel_file
+from app.utils.categorization import get_category_stats, category_condition
+from app.utils.filters import RequestFilter
+from app.utils.pivot import build_department_pivot
+from app.routes.notifications import create_notifications, batch_for_approval_notification
+from app.utils.pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, REQUEST_FIELDS, estimate_count, paginate, page_response, parse_fields, project_request_fields
+)
+from app.utils.import_pipeline import stage_upload, fail_import
+from app.utils.excel_processor import MAX_EXCEL_FILE_SIZE
+from app.utils.excel_export import (
+    EXPORT_YIELD_PER, ProgressCallback, build_xlsx, write_sheet, xlsx_response, format_moscow_datetime
+)
+from app.tasks import process_excel_import_task, recategorize_requests_task
+from app.celery_app import celery_app
 
 from typing import Optional, List
 
@@ -33,6 +44,16 @@ class TreeNode(BaseModel):
 
 TreeNode.update_forward_refs()
 
+def tree_node_id(prefix: str, *parts: str) -> str:
+    """
+    Стабильный идентификатор узла дерева
+
+    В отличие от hash() не зависит от процесса воркера, поэтому фронтенд
+    может кэшировать узлы между запросами.
+    """
+    digest = hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()[:16]
+    return f"{prefix}_{digest}"
+
 router = APIRouter()
 
 # Модель для запроса экспорта
@@ -132,15 +153,22 @@ async def get_requests_for_payment(
 
 @router.get("/approved-for-payment", response_model=List[RequestResponse])
 async def get_approved_requests_for_payment(
+    response: Response,
     category: Category = None,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
     current_user: User = Depends(require_treasury),
     db: Session = Depends(get_db)
 ):
     """
     Получение заявок, согласованных в оплату
+
+    Постраничная выдача по курсору (limit, cursor), fields - нужные поля.
     """
+    selected_fields = parse_fields(fields, REQUEST_FIELDS)
     query = db.query(Request).filter(Request.status == "approved_for_payment")
 
     if category:
@@ -152,12 +180,89 @@ async def get_approved_requests_for_payment(
     if end_date:
         query = query.filter(Request.created_at <= end_date)
 
-    requests = query.order_by(
-        Request.priority.desc() if Request.priority else None,
-        Request.created_at
-    ).all()
+    total = estimate_count(db, query, cursor)
+    query = project_request_fields(query, selected_fields)
 
-    return requests
+    requests, next_cursor = paginate(query, cursor, limit, descending=False)
+
+    return page_response(response, requests, next_cursor, total, selected_fields)
+
+# Столбцы выгрузки заявок к оплате
+EXPORT_HEADERS = [
+    "Статья ДДС", "Сумма", "Получатель", "Номер заявки",
+    "Дата заявки", "Статус", "Организация", "Подразделение",
+    "Приоритет", "Назначение", "Дата оплаты", "Заявитель"
+]
+
+def payment_register_file_name() -> str:
+    """
+    Имя файла выгрузки заявок к оплате
+    """
+    return f"Заявки_к_оплате_{datetime.now().strftime('%d-%m-%Y_%H-%M')}.xlsx"
+
+def build_payment_register(
+    db: Session,
+    export_data: ExportRequest,
+    output=None,
+    progress_callback: Optional[ProgressCallback] = None
+):
+    """
+    Книга с заявками к оплате
+
+    Заявки читаются серверным курсором пачками и сразу пишутся в книгу
+    xlsxwriter (constant_memory). Возвращает (файл, количество заявок).
+    """
+    query = db.query(
+        Request.article,
+        Request.amount,
+        Request.recipient,
+        Request.request_number,
+        Request.request_date,
+        Request.status,
+        Request.organization,
+        Request.department,
+        Request.priority,
+        Request.purpose,
+        Request.payment_date,
+        Request.applicant
+    ).filter(Request.status == "for_payment")
+
+    if not export_data.export_all and export_data.request_ids:
+        query = query.filter(Request.id.in_(export_data.request_ids))
+
+    # Общее количество нужно только для прогресса фоновой выгрузки
+    total = query.count() if progress_callback else None
+
+    def export_rows():
+        for row in query.yield_per(EXPORT_YIELD_PER):
+            yield (
+                row.article,
+                row.amount,
+                row.recipient,
+                row.request_number,
+                format_moscow_datetime(row.request_date),
+                row.status,
+                row.organization,
+                row.department,
+                row.priority,
+                row.purpose,
+                row.payment_date.strftime("%d.%m.%Y") if row.payment_date else "",
+                row.applicant
+            )
+
+    exported = {}
+
+    def write(workbook):
+        # Форматируем сумму как число с разделителями
+        exported["count"] = write_sheet(
+            workbook, "Заявки к оплате", EXPORT_HEADERS, export_rows(),
+            column_formats={1: {'num_format': '#,##0.00'}},
+            progress_callback=progress_callback,
+            total=total
+        )
+
+    output = build_xlsx(write, output)
+    return output, exported["count"]
 
 @router.post("/export")
 async def export_requests(
@@ -167,90 +272,30 @@ async def export_requests(
 ):
     """
     Экспорт заявок в Excel
+
+    Для больших выгрузок - фоновое задание POST /api/exports/treasury-payments.
     """
     import logging
     logger = logging.getLogger(__name__)
 
     logger.info(f"Export request: export_all={export_data.export_all}, request_ids={export_data.request_ids}")
 
-    query = db.query(Request).filter(Request.status == "for_payment")
-
-    logger.info(f"Initial query count: {query.count()}")
-
-    if not export_data.export_all and export_data.request_ids:
-        logger.info(f"Filtering by request_ids: {export_data.request_ids}")
-        query = query.filter(Request.id.in_(export_data.request_ids))
-
-    requests = query.all()
-    logger.info(f"Found {len(requests)} requests for export")
+    output, count = build_payment_register(db, export_data)
 
-    if not requests:
+    if not count:
+        output.close()
         logger.warning("No requests found for export")
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Нет заявок для экспорта"
         )
 
-    # Создание Excel файла
-    workbook = openpyxl.Workbook()
-    worksheet = workbook.active
-    worksheet.title = "Заявки к оплате"
-
-    # Заголовки
-    headers = [
-        "Статья ДДС", "Сумма", "Получатель", "Номер заявки",
-        "Дата заявки", "Статус", "Организация", "Подразделение",
-        "Приоритет", "Назначение", "Дата оплаты", "Заявитель"
-    ]
-
-    for col_num, header in enumerate(headers, 1):
-        worksheet.cell(row=1, column=col_num, value=header)
+    # Создание имени файла
+    filename = payment_register_file_name()
 
-    # Данные
-    for row_num, request in enumerate(requests, 2):
-        worksheet.cell(row=row_num, column=1, value=request.article)
-        # Форматируем сумму как число с разделителями
-        cell = worksheet.cell(row=row_num, column=2, value=request.amount)
-        cell.number_format = '#,##0.00'
-        worksheet.cell(row=row_num, column=3, value=request.recipient)
-        worksheet.cell(row=row_num, column=4, value=request.request_number)
-        # Конвертируем время в Московский часовой пояс
-        moscow_tz = pytz.timezone('Europe/Moscow')
-        if request.request_date.tzinfo is None:
-            # Если время без часового пояса, считаем что это UTC
-            request_date_utc = pytz.utc.localize(request.request_date)
-        else:
-            request_date_utc = request.request_date.astimezone(pytz.utc)
-        request_date_moscow = request_date_utc.astimezone(moscow_tz)
-        worksheet.cell(row=row_num, column=5, value=request_date_moscow.strftime("%d.%m.%Y %H:%M:%S"))
-        worksheet.cell(row=row_num, column=6, value=request.status)
-        worksheet.cell(row=row_num, column=7, value=request.organization)
-        worksheet.cell(row=row_num, column=8, value=request.department)
-        worksheet.cell(row=row_num, column=9, value=request.priority)
-        worksheet.cell(row=row_num, column=10, value=request.purpose)
-        worksheet.cell(row=row_num, column=11, value=request.payment_date.strftime("%d.%m.%Y") if request.payment_date else "")
-        worksheet.cell(row=row_num, column=12, value=request.applicant)
-
-    # Сохранение в буфер
-    excel_buffer = BytesIO()
-    workbook.save(excel_buffer)
-    excel_buffer.seek(0)
+    logger.info(f"Export completed: {count} requests, filename: {filename}")
 
-    # Создание имени файла
-    filename = f"Заявки_к_оплате_{datetime.now().strftime('%d-%m-%Y_%H-%M')}.xlsx"
-
-    logger.info(f"Export completed: {len(requests)} requests, filename: {filename}")
-
-    # Возвращаем файл как ответ
-    return Response(
-        content=excel_buffer.getvalue(),
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={
-            "Content-Disposition": f"attachment; filename=\"{filename}\"",
-            "Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename, safe='')}",
-            "Content-Type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet; charset=utf-8"
-        }
-    )
+    return xlsx_response(output, filename)
 
 @router.post("/special-import")
 async def special_import(
@@ -265,10 +310,10 @@ async def special_import(
     Импорт особых заявок (непереносимые оплаты, графики, согласовано в оплату)
     """
     # Валидация файла
-    if file.size > 5 * 1024 * 1024:
+    if file.size > MAX_EXCEL_FILE_SIZE:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Файл превышает лимит 5 МБ"
+            detail=f"Файл превышает лимит {MAX_EXCEL_FILE_SIZE // (1024 * 1024)} МБ"
         )
 
     # Создание записи об импорте
@@ -279,89 +324,42 @@ async def special_import(
         payment_date=datetime.strptime(payment_date, "%Y-%m-%d").date(),
         import_type=import_type.value,
         comment=comment,
-        status="processing"
+        status="queued",
+        progress=0
     )
 
     db.add(db_import)
     db.commit()
     db.refresh(db_import)
 
-    imported_count = 0
-
+    # Разбор и вставка заявок выполняются фоновой задачей
     try:
-        # Чтение файла
-        content = await file.read()
-
-        # Обработка Excel файла
-        requests_data = process_excel_file(content)
-
-        for request_data in requests_data:
-            # Создание особой заявки
-            # Маппинг ImportType -> Category и treasury_import_type
-            category_map = {
-                "non_transferable": "non_transferable",
-                "schedules": "schedules",
-                "approved_by_director": "schedules",
-                "approved_for_payment": "schedules",
-            }
-            treasury_import_type_map = {
-                "non_transferable": "non_transferable",
-                "schedules": "graphs",
-                "approved_by_director": "approved_by_director",
-                "approved_for_payment": "approved_by_director",
-            }
-            
-            db_request = Request(
-                article=request_data.get("Статья ДДС", ""),
-                amount=float(request_data.get("Сумма", 0)),
-                recipient=request_data.get("Получатель", ""),
-                request_number=request_data.get("Номер заявки", ""),
-                request_date=pytz.timezone('Europe/Moscow').localize(datetime.strptime(
-                    request_data.get("Дата заявки", datetime.now().strftime("%d.%m.%Y %H:%M:%S")),
-                    "%d.%m.%Y %H:%M:%S"
-                )),
-                organization=request_data.get("Организация", ""),
-                department=request_data.get("Подразделение", ""),
-                purpose=request_data.get("Назначение", ""),
-                applicant=request_data.get("Заявитель", ""),
-                category=category_map.get(import_type.value, "schedules"),
-                import_type="special",
-                treasury_import_type=treasury_import_type_map.get(import_type.value, import_type.value),
-                created_by=current_user.id,
-                import_id=db_import.id,
-                source='treasury',
-                status="pending"
-            )
-
-            db.add(db_request)
-            # Сохраняем каждую заявку
-            db.flush()
-            
-            # Автоматическая категоризация
-            from app.utils.categorization import categorize_request
-            categorize_request(db_request, db)
-            
-            imported_count += 1
-
-        # Обновление статуса импорта
-        db_import.status = "completed"
-        db_import.imported_count = imported_count
-        db.commit()
-
+        await stage_upload(db_import.id, 0, file)
     except Exception as e:
-        # В случае ошибки
-        db_import.status = "failed"
-        db_import.error_message = str(e)
-        db.commit()
+        # Частично записанный файл удаляется вместе с отметкой failed
+        fail_import(db, db_import, str(e))
 
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка при импорте: {str(e)}"
         )
 
+    try:
+        process_excel_import_task.delay(str(db_import.id))
+    except Exception as e:
+        # Брокер недоступен: задача не поставлена, импорт не будет обработан
+        fail_import(db, db_import, f"Не удалось поставить импорт в очередь: {str(e)}")
+
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Очередь импорта временно недоступна, повторите загрузку позже"
+        )
+
     return {
-        "message": f"Импорт завершен успешно",
-        "imported_count": imported_count,
+        "message": f"Импорт поставлен в очередь",
+        "import_id": str(db_import.id),
+        "status": db_import.status,
+        "imported_count": 0,
         "import_type": import_type.value
     }
 async def update_payment_date(
@@ -420,56 +418,37 @@ async def get_treasury_statistics(
     else:
         start_date = end_date - timedelta(days=30)
 
+    # Одним запросом: итоги по статусам и по (статус, категория).
+    # Период ограничивает выборку по индексу ix_requests_updated_at
+    grouped = db.query(
+        Request.status,
+        Request.category,
+        func.grouping(Request.category).label("by_status"),
+        func.count(Request.id).label("count"),
+        func.sum(Request.amount).label("total_amount")
+    ).filter(
+        Request.updated_at >= start_date,
+        Request.updated_at <= end_date,
+        Request.status.in_(["for_payment", "approved_for_payment", "rejected"])
+    ).group_by(
+        func.grouping_sets(tuple_(Request.status), tuple_(Request.status, Request.category))
+    ).all()
+
     # Статистика по статусам
     status_stats = {}
-    for status in ["for_payment", "approved_for_payment", "rejected"]:
-        query = db.query(Request).filter(
-            Request.status == status,
-            Request.updated_at >= start_date,
-            Request.updated_at <= end_date
-        )
-
-        count = query.count()
-
-        if count > 0:
-            total_amount = db.query(func.sum(Request.amount)).filter(
-                Request.status == status,
-                Request.updated_at >= start_date,
-                Request.updated_at <= end_date
-            ).scalar() or 0
-
-            status_stats[status] = {
-                "count": count,
-                "total_amount": total_amount
-            }
-
-    # Статистика по категориям
+    # Статистика по категориям (только заявки к оплате и согласованные к оплате)
     category_stats = {}
-    categories = db.query(Request.category).distinct().all()
-
-    for category_tuple in categories:
-        category = category_tuple[0]
-        query = db.query(Request).filter(
-            Request.category == category,
-            Request.status.in_(["for_payment", "approved_for_payment"]),
-            Request.updated_at >= start_date,
-            Request.updated_at <= end_date
-        )
-
-        count = query.count()
-
-        if count > 0:
-            total_amount = db.query(func.sum(Request.amount)).filter(
-                Request.category == category,
-                Request.status.in_(["for_payment", "approved_for_payment"]),
-                Request.updated_at >= start_date,
-                Request.updated_at <= end_date
-            ).scalar() or 0
 
-            category_stats[category] = {
-                "count": count,
-                "total_amount": total_amount
+    for row in grouped:
+        if row.by_status:
+            status_stats[row.status] = {
+                "count": row.count,
+                "total_amount": row.total_amount or 0
             }
+        elif row.status in ("for_payment", "approved_for_payment"):
+            stats = category_stats.setdefault(row.category, {"count": 0, "total_amount": 0})
+            stats["count"] += row.count
+            stats["total_amount"] += row.total_amount or 0
 
     return {
         "period": period,
@@ -536,13 +515,9 @@ async def send_requests_to_approval(
             detail="Не найдено активных заместителей ГД"
         )
 
-    # Импортируем функцию для создания уведомлений
-    from app.routes.notifications import create_batch_for_approval_notification
-
-    # Создаем уведомления для каждого заместителя
-    for deputy in deputies:
-        create_batch_for_approval_notification(
-            db=db,
+    # Уведомления всем заместителям одним INSERT в той же транзакции
+    create_notifications(db, [
+        batch_for_approval_notification(
             deputy_id=deputy.id,
             import_id=None,  # Нет импорта, так как отправка вручную
             request_count=request_count,
@@ -550,6 +525,8 @@ async def send_requests_to_approval(
             total_amount=total_amount,
             imported_by_user=current_user
         )
+        for deputy in deputies
+    ])
 
     db.commit()
 
@@ -562,16 +539,23 @@ async def send_requests_to_approval(
 
 @router.get("/requests", response_model=List[RequestResponse])
 async def get_treasury_requests(
+    response: Response,
     status: Optional[str] = None,
     category: Category = None,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
     current_user: User = Depends(require_treasury),
     db: Session = Depends(get_db)
 ):
     """
     Получение заявок казначейства с фильтрацией по статусу
+
+    Постраничная выдача по курсору (limit, cursor), fields - нужные поля.
     """
+    selected_fields = parse_fields(fields, REQUEST_FIELDS)
     query = db.query(Request).filter(Request.source == 'treasury')
 
     # Фильтрация по статусу
@@ -587,121 +571,114 @@ async def get_treasury_requests(
     if end_date:
         query = query.filter(Request.created_at <= end_date)
 
+    total = estimate_count(db, query, cursor)
+    query = project_request_fields(query, selected_fields)
+
     # Сортировка по дате создания (новые сверху)
-    requests = query.order_by(Request.created_at.desc()).all()
+    requests, next_cursor = paginate(query, cursor, limit)
 
-    return requests
+    return page_response(response, requests, next_cursor, total, selected_fields)
 
 # Новые endpoint'ы для заявок на согласовании в казначействе
 
+# Строка data_versions с версией заявок на согласовании (008_pending_requests_version.sql)
+PENDING_REQUESTS_VERSION = "pending_requests"
+
 @router.get("/pending/imports-tree")
 async def get_pending_imports_tree(
+    response: Response,
+    since: Optional[int] = None,
     current_user: User = Depends(require_treasury),
     db: Session = Depends(get_db)
 ):
     """
     Получение дерева импортов с комментариями для рабочей области казначейства
     Группировка: Организация -> Подразделение -> Импорт (пользователь + комментарий)
+
+    since - курсор из заголовка X-Tree-Cursor предыдущего ответа. Если с тех
+    пор заявки на согласовании не менялись, возвращается 304 без построения дерева.
     """
-    # Получаем все импорты с хотя бы одной заявкой в статусе 'pending'
-    imports_with_pending = db.query(Import).join(Request, Request.import_id == Import.id)\
-        .filter(Request.status == 'pending')\
-        .group_by(Import.id)\
-        .all()
+    # Курсор - версия заявок на согласовании: триггер увеличивает ее при любом
+    # добавлении, изменении и удалении заявок 'pending' в порядке commit
+    cursor = db.query(DataVersion.version).filter(
+        DataVersion.name == PENDING_REQUESTS_VERSION
+    ).scalar()
+    cursor_header = {"X-Tree-Cursor": str(cursor) if cursor is not None else ""}
+
+    if since is not None and cursor is not None and cursor == since:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cursor_header)
     
-    # Также получаем одиночные заявки без импорта
-    users_with_single_requests = db.query(User).join(Request, Request.created_by == User.id)\
-        .filter(
-            Request.status == 'pending',
-            Request.import_id.is_(None)
-        )\
-        .distinct()\
-        .all()
+    response.headers.update(cursor_header)
+    
+    # 1. Импорты с заявками в статусе 'pending': количество и сумма одним запросом
+    imports_with_pending = db.query(
+        Import.id,
+        Import.comment,
+        Import.file_name,
+        Import.created_at,
+        User.id,
+        User.full_name,
+        User.organization,
+        User.department,
+        func.count(Request.id),
+        func.coalesce(func.sum(Request.amount), 0)
+    ).join(
+        Request, Request.import_id == Import.id
+    ).join(
+        User, User.id == Import.user_id
+    ).filter(
+        Request.status == 'pending'
+    ).group_by(
+        Import.id,
+        User.id
+    ).all()
+    
+    # 2. Одиночные заявки без импорта, сгруппированные по пользователю
+    users_with_single_requests = db.query(
+        User.id,
+        User.full_name,
+        User.organization,
+        User.department,
+        func.count(Request.id),
+        func.coalesce(func.sum(Request.amount), 0)
+    ).join(
+        Request, Request.created_by == User.id
+    ).filter(
+        Request.status == 'pending',
+        Request.import_id.is_(None)
+    ).group_by(
+        User.id
+    ).all()
     
     # Собираем данные
     organizations_dict = {}
     
-    # 1. Обрабатываем импорты
-    for import_item in imports_with_pending:
-        user = db.query(User).filter(User.id == import_item.user_id).first()
-        if not user:
-            continue
-            
-        org_name = user.organization
-        dept_name = user.department
-        
-        if org_name not in organizations_dict:
-            organizations_dict[org_name] = {}
-        
-        if dept_name not in organizations_dict[org_name]:
-            organizations_dict[org_name][dept_name] = []
-        
-        # Количество заявок в этом импорте со статусом pending
-        pending_count = db.query(Request).filter(
-            Request.import_id == import_item.id,
-            Request.status == 'pending'
-        ).count()
-        
-        # Общая сумма заявок в этом импорте
-        total_amount_result = db.query(func.sum(Request.amount)).filter(
-            Request.import_id == import_item.id,
-            Request.status == 'pending'
-        ).first()
-        total_amount = total_amount_result[0] or 0
-        
-        import_data = {
-            'id': str(import_item.id),
+    for (import_id, comment, file_name, created_at,
+         user_id, user_name, org_name, dept_name, pending_count, total_amount) in imports_with_pending:
+        organizations_dict.setdefault(org_name, {}).setdefault(dept_name, []).append({
+            'id': str(import_id),
             'type': 'import',
-            'user_id': str(user.id),
-            'user_name': user.full_name,
-            'comment': import_item.comment,
-            'file_name': import_item.file_name,
+            'user_id': str(user_id),
+            'user_name': user_name,
+            'comment': comment,
+            'file_name': file_name,
             'pending_count': pending_count,
             'total_amount': float(total_amount),
-            'created_at': import_item.created_at.isoformat() if import_item.created_at else None
-        }
-        
-        organizations_dict[org_name][dept_name].append(import_data)
+            'created_at': created_at.isoformat() if created_at else None
+        })
     
-    # 2. Обрабатываем одиночные заявки без импорта
-    for user in users_with_single_requests:
-        org_name = user.organization
-        dept_name = user.department
-        
-        if org_name not in organizations_dict:
-            organizations_dict[org_name] = {}
-        
-        if dept_name not in organizations_dict[org_name]:
-            organizations_dict[org_name][dept_name] = []
-        
-        # Количество одиночных заявок пользователя
-        single_count = db.query(Request).filter(
-            Request.created_by == user.id,
-            Request.status == 'pending',
-            Request.import_id.is_(None)
-        ).count()
-        
-        # Общая сумма одиночных заявок
-        total_amount_result = db.query(func.sum(Request.amount)).filter(
-            Request.created_by == user.id,
-            Request.status == 'pending',
-            Request.import_id.is_(None)
-        ).first()
-        total_amount = total_amount_result[0] or 0
-        
-        user_data = {
-            'id': str(user.id),
+    for user_id, user_name, org_name, dept_name, single_count, total_amount in users_with_single_requests:
+        organizations_dict.setdefault(org_name, {}).setdefault(dept_name, []).append({
+            'id': str(user_id),
             'type': 'user',
-            'user_id': str(user.id),
-            'user_name': user.full_name,
+            'user_id': str(user_id),
+            'user_name': user_name,
             'comment': None,
             'file_name': None,
             'pending_count': single_count,
             'total_amount': float(total_amount),
             'created_at': None
-        }
-        
-        organizations_dict[org_name][dept_name].append(user_data)
+        })
     
     # Преобразуем в формат для фронтенда
     result = []
@@ -731,51 +708,41 @@ async def get_pending_imports_tree(
 
 
 
-@router.get("/pending/filter-by-node")
+@router.get("/pending/filter-by-node", response_model=List[RequestResponse])
 async def filter_requests_by_node(
+    response: Response,
     node_id: str,
     node_type: str,
     organization: Optional[str] = None,
     department: Optional[str] = None,
     user_id: Optional[str] = None,
     import_id: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
     current_user: User = Depends(require_treasury),
     db: Session = Depends(get_db)
 ):
     """
     Фильтрация заявок по выбранному узлу дерева
     """
-    query = db.query(Request).filter(Request.status == 'pending')
-    
-    # Применяем фильтры в зависимости от типа узла
-    if node_type == 'root':
-        # Все заявки - без фильтров
-        pass
-    elif node_type == 'organization' and organization:
-        query = query.filter(Request.organization == organization)
-    elif node_type == 'department' and organization and department:
-        query = query.filter(
-            Request.organization == organization,
-            Request.department == department
-        )
-    elif node_type == 'user' and user_id:
-        query = query.filter(Request.created_by == uuid.UUID(user_id))
-    elif node_type == 'import' and import_id:
-        # Для import_id может быть как UUID импорта, так и user_id для одиночных заявок
-        try:
-            import_uuid = uuid.UUID(import_id)
-            query = query.filter(Request.import_id == import_uuid)
-        except ValueError:
-            # Если не UUID, то это user_id для одиночных заявок
-            query = query.filter(
-                Request.created_by == uuid.UUID(import_id),
-                Request.import_id.is_(None)
-            )
-    
-    requests = query.order_by(Request.created_at.desc()).all()
-    
-    # Преобразуем в Response
-    return [RequestResponse.from_orm(req) for req in requests]
+    selected_fields = parse_fields(fields, REQUEST_FIELDS)
+    spec = RequestFilter.from_node(
+        node_type,
+        organization=organization,
+        department=department,
+        user_id=user_id,
+        import_id=import_id,
+        status='pending'
+    )
+    query = db.query(Request).filter(*spec.conditions())
+
+    total = estimate_count(db, query, cursor)
+    query = project_request_fields(query, selected_fields)
+
+    requests, next_cursor = paginate(query, cursor, limit)
+
+    return page_response(response, requests, next_cursor, total, selected_fields)
 
 
 @router.post("/pending/pivot-by-node")
@@ -787,77 +754,18 @@ async def get_pivot_by_node(
     """
     Получение сводной таблицы для выбранного узла дерева
     """
-    node_type = data.get('node_type')
-    organization = data.get('organization')
-    department = data.get('department')
-    user_id = data.get('user_id')
-    import_id = data.get('import_id')
-    
-    query = db.query(Request).filter(Request.status == 'pending')
-    
-    # Применяем фильтры в зависимости от типа узла
-    if node_type == 'organization' and organization:
-        query = query.filter(Request.organization == organization)
-    elif node_type == 'department' and organization and department:
-        query = query.filter(
-            Request.organization == organization,
-            Request.department == department
-        )
-    elif node_type == 'user' and user_id:
-        query = query.filter(Request.created_by == uuid.UUID(user_id))
-    elif node_type == 'import' and import_id:
-        try:
-            import_uuid = uuid.UUID(import_id)
-            query = query.filter(Request.import_id == import_uuid)
-        except ValueError:
-            query = query.filter(
-                Request.created_by == uuid.UUID(import_id),
-                Request.import_id.is_(None)
-            )
-    # Для root не применяем фильтры - все заявки
-    
-    requests = query.all()
-    
-    # Собираем данные для сводной таблицы
-    pivot_data = {}
-    departments_set = set()
-    
-    for request in requests:
-        org = request.organization
-        dept = request.department
-        
-        departments_set.add(dept)
-        
-        if org not in pivot_data:
-            pivot_data[org] = {}
-        
-        if dept not in pivot_data[org]:
-            pivot_data[org][dept] = 0
-        
-        pivot_data[org][dept] += request.amount
-    
-    # Преобразуем в формат для фронтенда
-    departments = sorted(list(departments_set))
-    rows = []
-    
-    for org, depts in pivot_data.items():
-        row = {
-            'organization': org,
-            'departments': {}
-        }
-        
-        for dept in departments:
-            row['departments'][dept] = depts.get(dept, 0)
-        
-        rows.append(row)
-    
-    # Сортируем строки по названию организации
-    rows.sort(key=lambda x: x['organization'])
+    spec = RequestFilter.from_node(
+        data.get('node_type'),
+        organization=data.get('organization'),
+        department=data.get('department'),
+        user_id=data.get('user_id'),
+        import_id=data.get('import_id'),
+        status='pending',
+        category=data.get('category')
+    )
     
-    return {
-        'departments': departments,
-        'rows': rows
-    }
+    return build_department_pivot(db, spec, with_recipients=bool(data.get('with_recipients')))
+
 @router.get("/pending/requests")
 
 @router.get("/pending/tree")
@@ -869,80 +777,39 @@ async def get_pending_tree(
     Получение дерева заявок для навигации
     Структура: Все заявки -> Организации -> Подразделения -> Пользователи/Импорты
     """
-    # Получаем все заявки в статусе 'pending'
-    all_requests = db.query(Request).filter(Request.status == 'pending').all()
-    
-    # Собираем данные для дерева
-    tree_data = {}
-    
-    # Обрабатываем все заявки
-    for request in all_requests:
-        org = request.organization or "Без организации"
-        dept = request.department or "Без подразделения"
-        
-        if org not in tree_data:
-            tree_data[org] = {
-                'name': org,
-                'departments': {},
-                'total_count': 0,
-                'total_amount': 0
-            }
-        
-        if dept not in tree_data[org]['departments']:
-            tree_data[org]['departments'][dept] = {
-                'name': dept,
-                'users': {},
-                'total_count': 0,
-                'total_amount': 0
-            }
-        
-        # Определяем пользователя
-        user_id = request.created_by
-        user = db.query(User).filter(User.id == user_id).first()
-        user_name = user.full_name if user else "Неизвестный пользователь"
-        
-        if user_id not in tree_data[org]['departments'][dept]['users']:
-            tree_data[org]['departments'][dept]['users'][user_id] = {
-                'name': user_name,
-                'user_id': str(user_id),
-                'imports': {},
-                'total_count': 0,
-                'total_amount': 0
-            }
-        
-        # Определяем import_id
-        import_id = request.import_id
-        if import_id:
-            import_obj = db.query(Import).filter(Import.id == import_id).first()
-            import_name = f"{user_name}" + (f" - {import_obj.comment}" if import_obj and import_obj.comment else "")
-        else:
-            import_id = str(user_id)  # Для одиночных заявок
-            import_name = f"{user_name} - одиночные заявки"
-        
-        import_key = str(import_id)
-        if import_key not in tree_data[org]['departments'][dept]['users'][user_id]['imports']:
-            tree_data[org]['departments'][dept]['users'][user_id]['imports'][import_key] = {
-                'name': import_name,
-                'import_id': str(import_id) if import_id else None,
-                'count': 0,
-                'amount': 0
-            }
-        
-        # Обновляем счетчики
-        tree_data[org]['departments'][dept]['users'][user_id]['imports'][import_key]['count'] += 1
-        tree_data[org]['departments'][dept]['users'][user_id]['imports'][import_key]['amount'] += request.amount
-        
-        tree_data[org]['departments'][dept]['users'][user_id]['total_count'] += 1
-        tree_data[org]['departments'][dept]['users'][user_id]['total_amount'] += request.amount
-        
-        tree_data[org]['departments'][dept]['total_count'] += 1
-        tree_data[org]['departments'][dept]['total_amount'] += request.amount
-        
-        tree_data[org]['total_count'] += 1
-        tree_data[org]['total_amount'] += request.amount
+    # Один агрегирующий запрос: листья дерева (пользователь + импорт)
+    # с количеством и суммой заявок в статусе 'pending'
+    leaves = db.query(
+        Request.organization,
+        Request.department,
+        Request.created_by,
+        Request.import_id,
+        User.full_name,
+        Import.comment,
+        func.count(Request.id),
+        func.coalesce(func.sum(Request.amount), 0)
+    ).outerjoin(
+        User, User.id == Request.created_by
+    ).outerjoin(
+        Import, Import.id == Request.import_id
+    ).filter(
+        Request.status == 'pending'
+    ).group_by(
+        Request.organization,
+        Request.department,
+        Request.created_by,
+        Request.import_id,
+        User.full_name,
+        Import.comment
+    ).order_by(
+        Request.organization,
+        Request.department,
+        User.full_name,
+        Request.import_id
+    ).all()
     
     # Строим дерево
-    def build_tree_node(node_id, name, node_type, count, amount, **kwargs):
+    def build_tree_node(node_id, name, node_type, count=0, amount=0.0, **kwargs):
         return TreeNode(
             id=node_id,
             name=name,
@@ -954,73 +821,87 @@ async def get_pending_tree(
         )
     
     # Корневой узел "Все заявки"
-    total_count = len(all_requests)
-    total_amount = sum(req.amount for req in all_requests) if all_requests else 0
-    
     root_node = build_tree_node(
         node_id="all",
         name="Все заявки",
-        node_type="root",
-        count=total_count,
-        amount=float(total_amount)
+        node_type="root"
     )
     
-    # Добавляем организации
-    for org_name, org_data in tree_data.items():
-        org_node = build_tree_node(
-            node_id=f"org_{hash(org_name)}",
-            name=org_name,
-            node_type="organization",
-            count=org_data['total_count'],
-            amount=float(org_data['total_amount']),
-            organization=org_name
-        )
+    org_nodes = {}
+    dept_nodes = {}
+    user_nodes = {}
+    
+    for org, dept, user_id, import_id, user_name, import_comment, count, amount in leaves:
+        org_name = org or "Без организации"
+        dept_name = dept or "Без подразделения"
+        user_name = user_name or "Неизвестный пользователь"
+        amount = float(amount)
+        
+        # Организация
+        org_node = org_nodes.get(org_name)
+        if org_node is None:
+            org_node = build_tree_node(
+                node_id=tree_node_id("org", org_name),
+                name=org_name,
+                node_type="organization",
+                organization=org_name
+            )
+            org_nodes[org_name] = org_node
+            root_node.children.append(org_node)
         
-        # Добавляем подразделения
-        for dept_name, dept_data in org_data['departments'].items():
+        # Подразделение
+        dept_key = (org_name, dept_name)
+        dept_node = dept_nodes.get(dept_key)
+        if dept_node is None:
             dept_node = build_tree_node(
-                node_id=f"dept_{hash(org_name + dept_name)}",
+                node_id=tree_node_id("dept", org_name, dept_name),
                 name=dept_name,
                 node_type="department",
-                count=dept_data['total_count'],
-                amount=float(dept_data['total_amount']),
                 organization=org_name,
                 department=dept_name
             )
-            
-            # Добавляем пользователей
-            for user_id, user_data in dept_data['users'].items():
-                user_node = build_tree_node(
-                    node_id=f"user_{user_id}",
-                    name=user_data['name'],
-                    node_type="user",
-                    count=user_data['total_count'],
-                    amount=float(user_data['total_amount']),
-                    user_id=user_data['user_id'],
-                    organization=org_name,
-                    department=dept_name
-                )
-                
-                # Добавляем импорты
-                for import_key, import_data in user_data['imports'].items():
-                    import_node = build_tree_node(
-                        node_id=f"import_{import_key}",
-                        name=import_data['name'],
-                        node_type="import",
-                        count=import_data['count'],
-                        amount=float(import_data['amount']),
-                        import_id=import_data['import_id'],
-                        user_id=user_data['user_id'],
-                        organization=org_name,
-                        department=dept_name
-                    )
-                    user_node.children.append(import_node)
-                
-                dept_node.children.append(user_node)
-            
+            dept_nodes[dept_key] = dept_node
             org_node.children.append(dept_node)
         
-        root_node.children.append(org_node)
+        # Пользователь
+        user_key = (org_name, dept_name, user_id)
+        user_node = user_nodes.get(user_key)
+        if user_node is None:
+            user_node = build_tree_node(
+                node_id=f"user_{user_id}",
+                name=user_name,
+                node_type="user",
+                user_id=str(user_id),
+                organization=org_name,
+                department=dept_name
+            )
+            user_nodes[user_key] = user_node
+            dept_node.children.append(user_node)
+        
+        # Импорт (для одиночных заявок import_id = user_id)
+        if import_id:
+            import_key = str(import_id)
+            import_name = user_name + (f" - {import_comment}" if import_comment else "")
+        else:
+            import_key = str(user_id)
+            import_name = f"{user_name} - одиночные заявки"
+        
+        user_node.children.append(build_tree_node(
+            node_id=f"import_{import_key}",
+            name=import_name,
+            node_type="import",
+            count=count,
+            amount=amount,
+            import_id=import_key,
+            user_id=str(user_id),
+            organization=org_name,
+            department=dept_name
+        ))
+        
+        # Обновляем счетчики
+        for node in (user_node, dept_node, org_node, root_node):
+            node.count += count
+            node.amount += amount
     
     return root_node
 async def get_pending_requests(
@@ -1037,36 +918,10 @@ async def get_pending_requests(
     query = db.query(Request).filter(Request.status == "pending")
 
     # Применяем фильтрацию по категории (та же логика, что и в get_pending_categories_stats)
-    if category == 'pitanie_projivanie':
-        query = query.filter(
-            Request.employee_category == 'pitanie_projivanie',
-            Request.source == 'employee'
-        )
-    elif category == 'graphs':
-        query = query.filter(
-            Request.treasury_import_type == 'graphs',
-            Request.source == 'treasury'
-        )
-    elif category == 'approved_by_director':
-        query = query.filter(
-            Request.treasury_import_type == 'approved_by_director',
-            Request.source == 'treasury'
-        )
-    elif category == 'non_transferable':
-        query = query.filter(
-            Request.treasury_import_type == 'non_transferable',
-            Request.source == 'treasury'
-        )
-    elif category == 'filialy':
-        query = query.filter(
-            Request.source == 'employee'
-        ).filter(
-            or_(
-                Request.employee_category == 'filialy',
-                Request.employee_category.is_(None)
-            )
-        )
     # Для категории 'all' не применяем дополнительных фильтров - берем все заявки
+    condition = category_condition(category)
+    if condition is not None:
+        query = query.filter(condition)
     
     if import_id:
         query = query.filter(Request.import_id == uuid.UUID(import_id))
@@ -1094,21 +949,15 @@ async def get_pending_categories_stats(
     Получение статистики по категориям для выбранного импорта
     Используется та же логика, что и в кабинете заместителя
     """
-    # Базовый запрос для заявок в статусе 'pending'
-    query = db.query(Request).filter(Request.status == 'pending')
-
-    # Отдельный запрос для категории "Все заявки"
+    # Все категории считаются одним GROUP BY по заявкам в статусе 'pending'
     # Если передан import_id, то считаем только заявки этого импорта
-    # Если import_id не передан, то считаем все заявки
-    all_query = db.query(Request).filter(Request.status == 'pending')
-
-    if import_id:
-        query = query.filter(Request.import_id == uuid.UUID(import_id))
-        # Для категории "Все заявки" ТОЖЕ применяем фильтр по import_id, если он передан
-        all_query = all_query.filter(Request.import_id == uuid.UUID(import_id))
+    # (в том числе для категории "Все заявки")
+    category_stats = get_category_stats(
+        db,
+        'pending',
+        uuid.UUID(import_id) if import_id else None
+    )
 
-    categories = []
-    
     # Определяем цвета для категорий
     colors = {
         'pitanie_projivanie': '#EF4444',      # Красный
@@ -1129,103 +978,19 @@ async def get_pending_categories_stats(
         'all': 'Все заявки'
     }
 
-    # 1. Питание, проживание, аренда, связь (заявки от сотрудников)
-    pitanie_query = query.filter(
-        Request.employee_category == 'pitanie_projivanie',
-        Request.source == 'employee'
-    )
-    pitanie_count = pitanie_query.count()
-    pitanie_amount = pitanie_query.with_entities(func.coalesce(func.sum(Request.amount), 0)).scalar() or 0
-    
-    categories.append({
-        'id': 'pitanie_projivanie',
-        'name': names['pitanie_projivanie'],
-        'count': pitanie_count,
-        'amount': float(pitanie_amount),
-        'color': colors['pitanie_projivanie']
-    })
-
-    # 2. Графики (особые заявки из казначейства)
-    graphs_query = query.filter(
-        Request.treasury_import_type == 'graphs',
-        Request.source == 'treasury'
-    )
-    graphs_count = graphs_query.count()
-    graphs_amount = graphs_query.with_entities(func.coalesce(func.sum(Request.amount), 0)).scalar() or 0
-    
-    categories.append({
-        'id': 'graphs',
-        'name': names['graphs'],
-        'count': graphs_count,
-        'amount': float(graphs_amount),
-        'color': colors['graphs']
-    })
-
-    # 3. Утверждено генеральным директором (особые заявки из казначейства)
-    approved_query = query.filter(
-        Request.treasury_import_type == 'approved_by_director',
-        Request.source == 'treasury'
-    )
-    approved_count = approved_query.count()
-    approved_amount = approved_query.with_entities(func.coalesce(func.sum(Request.amount), 0)).scalar() or 0
-    
-    categories.append({
-        'id': 'approved_by_director',
-        'name': names['approved_by_director'],
-        'count': approved_count,
-        'amount': float(approved_amount),
-        'color': colors['approved_by_director']
-    })
-
-    # 4. Непереносимые оплаты (особые заявки из казначейства)
-    non_transferable_query = query.filter(
-        Request.treasury_import_type == 'non_transferable',
-        Request.source == 'treasury'
-    )
-    non_transferable_count = non_transferable_query.count()
-    non_transferable_amount = non_transferable_query.with_entities(func.coalesce(func.sum(Request.amount), 0)).scalar() or 0
-    
-    categories.append({
-        'id': 'non_transferable',
-        'name': names['non_transferable'],
-        'count': non_transferable_count,
-        'amount': float(non_transferable_amount),
-        'color': colors['non_transferable']
-    })
-
-    # 5. Подразделения (заявки от сотрудников, не относящиеся к питанию/проживанию)
-    filialy_query = query.filter(
-        Request.source == 'employee'
-    ).filter(
-        or_(
-            Request.employee_category == 'filialy',
-            Request.employee_category.is_(None)
-        )
-    )
-    filialy_count = filialy_query.count()
-    filialy_amount = filialy_query.with_entities(func.coalesce(func.sum(Request.amount), 0)).scalar() or 0
-    
-    categories.append({
-        'id': 'filialy',
-        'name': names['filialy'],
-        'count': filialy_count,
-        'amount': float(filialy_amount),
-        'color': colors['filialy']
-    })
-
-    # 6. Все заявки (ВСЕ заявки со статусом pending, без фильтрации по import_id)
-    all_count = all_query.count()
-    all_amount = all_query.with_entities(func.coalesce(func.sum(Request.amount), 0)).scalar() or 0
-    
-    categories.append({
-        'id': 'all',
-        'name': names['all'],
-        'count': all_count,
-        'amount': float(all_amount),
-        'color': colors['all']
-    })
-
-    return categories
+    # Порядок кнопок сохраняется прежним
+    order = ['pitanie_projivanie', 'graphs', 'approved_by_director', 'non_transferable', 'filialy', 'all']
+
+    return [
+        {
+            'id': category_id,
+            'name': names[category_id],
+            'count': category_stats[category_id]['count'],
+            'amount': category_stats[category_id]['amount'],
+            'color': colors[category_id]
+        }
+        for category_id in order
+    ]
 @router.post("/pending/pivot-table")
 async def get_pending_pivot_table(
     data: dict,
@@ -1236,89 +1001,26 @@ async def get_pending_pivot_table(
     Получение сводной таблицы для заявок на согласовании
     Аналог endpoint'а заместителя, но с фильтрацией по импорту
     """
-    category = data.get('category', 'filialy')
-    import_id = data.get('import_id')
-
-    # Базовый запрос для заявок в статусе 'pending'
-    query = db.query(Request).filter(Request.status == 'pending')
-
-    if import_id:
-        query = query.filter(Request.import_id == uuid.UUID(import_id))
-
-    # Применяем фильтрацию по категории (та же логика, что и в get_pending_categories_stats) (та же логика, что и в get_pending_categories_stats) (та же логика, что и в get_pending_categories_stats)
-    if category == 'pitanie_projivanie':
-        query = query.filter(
-            Request.employee_category == 'pitanie_projivanie',
-            Request.source == 'employee'
-        )
-    elif category == 'graphs':
-        query = query.filter(
-            Request.treasury_import_type == 'graphs',
-            Request.source == 'treasury'
-        )
-    elif category == 'approved_by_director':
-        query = query.filter(
-            Request.treasury_import_type == 'approved_by_director',
-            Request.source == 'treasury'
-        )
-    elif category == 'non_transferable':
-        query = query.filter(
-            Request.treasury_import_type == 'non_transferable',
-            Request.source == 'treasury'
-        )
-    elif category == 'filialy':
-        query = query.filter(
-            Request.source == 'employee'
-        ).filter(
-            or_(
-                Request.employee_category == 'filialy',
-                Request.employee_category.is_(None)
-            )
-        )
-    # Для категории 'all' не применяем дополнительных фильтров - берем все заявки
-
-    requests = query.all()
-
-    # Собираем данные для сводной таблицы
-    pivot_data = {}
-    departments_set = set()
-
-    for request in requests:
-        org = request.organization
-        dept = request.department
-
-        departments_set.add(dept)
-
-        if org not in pivot_data:
-            pivot_data[org] = {}
-
-        if dept not in pivot_data[org]:
-            pivot_data[org][dept] = 0
-
-        pivot_data[org][dept] += request.amount
-
-    # Преобразуем в формат для фронтенда
-    departments = sorted(list(departments_set))
-    rows = []
-
-    for org, depts in pivot_data.items():
-        row = {
-            'organization': org,
-            'departments': {}
-        }
+    spec = RequestFilter(
+        status='pending',
+        category=data.get('category', 'filialy'),
+        import_id=data.get('import_id') or None
+    )
 
-        for dept in departments:
-            row['departments'][dept] = depts.get(dept, 0)
+    return build_department_pivot(db, spec, with_recipients=bool(data.get('with_recipients')))
 
-        rows.append(row)
+# Категория процесса согласования при отправке заместителю:
+# заявки сотрудников - питание/проживание или филиалы, заявки казначейства - тип импорта
+DEPUTY_PROCESS_CATEGORY = case(
+    (
+        Request.source == 'employee',
+        case((Request.employee_category == 'pitanie_projivanie', 'pitanie_projivanie'), else_='filialy')
+    ),
+    else_=func.coalesce(Request.treasury_import_type, 'other')
+)
 
-    # Сортируем строки по названию организации
-    rows.sort(key=lambda x: x['organization'])
-
-    return {
-        'departments': departments,
-        'rows': rows
-}
+# Заявок в одном UPDATE ... FROM (VALUES ...)
+SEND_TO_DEPUTY_BATCH_SIZE = 1000
 
 @router.post("/pending/send-to-deputy")
 async def send_to_deputy(
@@ -1336,130 +1038,182 @@ async def send_to_deputy(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Не выбраны заявки для отправки"
         )
-    
-    # Проверяем, что все заявки в статусе 'pending'
-    requests = db.query(Request).filter(Request.id.in_(request_ids)).all()
 
-    if len(requests) != len(request_ids):
+    request_ids = list(dict.fromkeys(request_ids))
+
+    # Заявки по категориям согласования и статусам одним запросом:
+    # категория -> id заявок, сумма, импорты
+    groups = db.query(
+        DEPUTY_PROCESS_CATEGORY.label("process_category"),
+        Request.status,
+        func.array_agg(Request.id).label("ids"),
+        func.sum(Request.amount).label("total_amount"),
+        func.array_agg(distinct(Request.import_id)).label("import_ids")
+    ).filter(
+        Request.id.in_(request_ids)
+    ).group_by(DEPUTY_PROCESS_CATEGORY, Request.status).all()
+
+    if sum(len(group.ids) for group in groups) != len(request_ids):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Некоторые заявки не найдены"
         )
 
-    for request in requests:
-        if request.status != 'pending':
+    # Проверяем, что все заявки в статусе 'pending'
+    for group in groups:
+        if group.status != 'pending':
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Заявка {request.id} имеет статус {request.status}, а должен быть 'pending'"
+                detail=f"Заявка {group.ids[0]} имеет статус {group.status}, а должен быть 'pending'"
             )
 
-    # Получаем все уникальные import_id из выбранных заявок
-    import_ids = set()
-    for request in requests:
-        if request.import_id:
-            import_ids.add(request.import_id)
-
-    # Группируем заявки по категориям для создания процессов согласования
-    from collections import defaultdict
-    categories_dict = defaultdict(list)
-
-    for request in requests:
-        # Определяем категорию для группировки (используем ту же логику, что и в get_pending_categories_stats)
-        if request.source == 'employee':
-            if request.employee_category == 'pitanie_projivanie':
-                category = 'pitanie_projivanie'
-            else:
-                category = 'filialy'
-        else:
-            # Для заявок из казначейства используем treasury_import_type как категорию
-            category = request.treasury_import_type or 'other'
-        
-        categories_dict[category].append(request.id)
-
-    created_processes = []
+    # Заместитель, которому отправляются все процессы
+    deputy = db.query(User).filter(
+        User.role == "deputy_director",
+        User.is_active == True
+    ).first()
 
-    # Создаем ApprovalProcess для каждой категории
-    for category, cat_request_ids in categories_dict.items():
-        # Находим заместителя для этой категории
-        deputy = db.query(User).filter(
-            User.role == "deputy_director",
-            User.is_active == True
-        ).first()
+    if not deputy:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Не найден активный заместитель"
+        )
 
-        if not deputy:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Не найден активный заместитель"
-            )
+    # Процессы согласования для всех категорий одним INSERT
+    processes = [
+        {
+            "id": uuid.uuid4(),
+            "deputy_id": deputy.id,
+            "category": group.process_category,
+            "comment": treasury_comment,
+            "treasury_comment": treasury_comment,
+            "treasury_user_id": current_user.id,
+            "status": 'pending',
+            "request_ids": list(group.ids),
+            "total_amount": float(group.total_amount or 0)
+        }
+        for group in groups
+    ]
+    db.execute(
+        insert(ApprovalProcess),
+        [{key: value for key, value in process.items() if key != "total_amount"} for process in processes]
+    )
 
-        # Создаем процесс согласования
-        approval_process = ApprovalProcess(
-            id=uuid.uuid4(),
-            deputy_id=deputy.id,
-            category=category,
-            comment=treasury_comment,
-            treasury_comment=treasury_comment,
-            treasury_user_id=current_user.id,
-            status='pending',
-            request_ids=cat_request_ids
+    # Статус заявок и привязка к процессам: UPDATE ... FROM (VALUES ...) пачками
+    links = [(request_id, process["id"]) for process in processes for request_id in process["request_ids"]]
+    updated_count = 0
+
+    for start in range(0, len(links), SEND_TO_DEPUTY_BATCH_SIZE):
+        batch = values(
+            column("id", PG_UUID(as_uuid=True)),
+            column("process_id", PG_UUID(as_uuid=True)),
+            name="links"
+        ).data(links[start:start + SEND_TO_DEPUTY_BATCH_SIZE])
+
+        updated_count += db.execute(
+            update(Request).where(
+                Request.id == batch.c.id,
+                Request.status == 'pending'
+            ).values(
+                status='approved_for_payment',
+                approval_process_id=batch.c.process_id,
+                updated_at=func.now()
+            ),
+            execution_options={"synchronize_session": False}
+        ).rowcount
+
+    if updated_count != len(request_ids):
+        # Статус части заявок изменился между проверкой и обновлением
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Заявки были изменены другим пользователем, обновите список"
         )
 
-        db.add(approval_process)
-        created_processes.append(approval_process)
-
-        # Обновляем статус заявок и привязываем к процессу
-        for req_id in cat_request_ids:
-            request = db.query(Request).filter(Request.id == req_id).first()
-            if request:
-                request.status = 'approved_for_payment'
-                request.approval_process_id = approval_process.id
+    # Состав процессов (история согласования заявок)
+    db.execute(
+        insert(ApprovalProcessRequest),
+        [
+            {"process_id": process_id, "request_id": request_id, "decision": "submitted"}
+            for request_id, process_id in links
+        ]
+    )
 
     # АВТОМАТИЧЕСКОЕ ОТКЛОНЕНИЕ ОСТАВШИХСЯ ЗАЯВОК
+    # Заявки в тех же импортах со статусом 'pending', не вошедшие в выбор
+    # (выбранные уже переведены в approved_for_payment)
+    import_ids = {import_id for group in groups for import_id in group.import_ids if import_id}
     rejected_count = 0
-    
+
     if import_ids:
-        # Находим все заявки в тех же импортах, которые имеют статус 'pending'
-        # и НЕ входят в список выбранных заявок
-        query = db.query(Request).filter(
+        rejected_count = db.query(Request).filter(
             Request.status == 'pending',
-            Request.import_id.in_(list(import_ids)),
-            ~Request.id.in_(request_ids)
-        )
-        
-        rejected_count = query.update(
+            Request.import_id.in_(list(import_ids))
+        ).update(
             {"status": "rejected"},
             synchronize_session=False
         )
-    
-    db.commit()
-
-    # Отправляем уведомления заместителю
-    from app.routes.notifications import create_batch_for_approval_notification
-    for process in created_processes:
-        # Рассчитываем общую сумму для этой категории
-        total_amount = sum([r.amount for r in requests if r.id in process.request_ids])
 
-        create_batch_for_approval_notification(
-            db=db,
-            deputy_id=process.deputy_id,
+    # Уведомления заместителю по каждому процессу - в той же транзакции
+    create_notifications(db, [
+        batch_for_approval_notification(
+            deputy_id=process["deputy_id"],
             import_id=None,
-            request_count=len(process.request_ids),
-            categories=[process.category],
-            total_amount=total_amount,
+            request_count=len(process["request_ids"]),
+            categories=[process["category"]],
+            total_amount=process["total_amount"],
             imported_by_user=current_user
         )
+        for process in processes
+    ])
+
+    db.commit()
 
     return {
         "message": f"{len(request_ids)} заявок отправлено на финальное согласование, {rejected_count} заявок отклонено",
-        "created_processes": len(created_processes),
+        "created_processes": len(processes),
         "rejected_count": rejected_count
     }
 
+@router.post("/recategorize")
+async def start_recategorization(
+    current_user: User = Depends(require_treasury)
+):
+    """
+    Запуск фоновой перекатегоризации всех заявок
+    """
+    task = recategorize_requests_task.delay()
+
+    return {
+        "message": "Перекатегоризация поставлена в очередь",
+        "task_id": task.id
+    }
+
+@router.get("/recategorize/{task_id}")
+async def get_recategorization_status(
+    task_id: str,
+    current_user: User = Depends(require_treasury)
+):
+    """
+    Состояние фоновой перекатегоризации
+    """
+    result = celery_app.AsyncResult(task_id)
+
+    if result.failed():
+        return {"task_id": task_id, "state": result.state, "error": str(result.result)}
+
+    info = result.info if isinstance(result.info, dict) else {}
+    return {"task_id": task_id, "state": result.state, "progress": info}
+
 @router.get("/approved", response_model=List[RequestResponse])
 async def get_approved_requests_alias(
+    response: Response,
     category: Category = None,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
     current_user: User = Depends(require_treasury),
     db: Session = Depends(get_db)
 ):
@@ -1467,9 +1221,13 @@ async def get_approved_requests_alias(
     Алиас для /approved-for-payment
     """
     return await get_approved_requests_for_payment(
+        response=response,
         category=category,
         start_date=start_date,
         end_date=end_date,
+        cursor=cursor,
+        limit=limit,
+        fields=fields,
         current_user=current_user,
         db=db
     )
@@ -105,6 +105,7 @@ class RequestResponse(RequestBase):
     source: str
     employee_category: Optional[str] = None
     treasury_import_type: Optional[str] = None
+    effective_category: Optional[str] = None
     created_by: UUID
     approval_process_id: Optional[UUID] = None
     import_id: Optional[UUID] = None
@@ -146,11 +147,38 @@ class ImportResponse(ImportBase):
     error_message: Optional[str] = None
     imported_count: int
     skipped_count: int
+    progress: Optional[int] = 0
     created_at: datetime
 
     class Config:
         from_attributes = True
 
+# Схемы для фоновых выгрузок в Excel
+class ExportType(str, Enum):
+    TREASURY_PAYMENTS = "treasury_payments"
+    STATISTICS = "statistics"
+
+class StatisticsExportParams(BaseModel):
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    group_by: str = "article"
+    status: Optional[str] = None
+
+class ExportJobResponse(BaseModel):
+    id: UUID
+    export_type: ExportType
+    status: str
+    progress: Optional[int] = 0
+    row_count: Optional[int] = 0
+    file_name: str
+    file_size: Optional[int] = None
+    error_message: Optional[str] = None
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
 # Схемы для процессов согласования
 class ApprovalProcessBase(BaseModel):
     deputy_id: UUID
@@ -175,6 +203,18 @@ class ApprovalProcessResponse(ApprovalProcessBase):
 class ApprovalProcessUpdate(BaseModel):
     status: str
 
+class ApprovalHistoryItem(BaseModel):
+    process_id: UUID
+    decision: str
+    category: str
+    process_status: str
+    deputy_id: UUID
+    deputy_name: Optional[str] = None
+    comment: Optional[str] = None
+    treasury_comment: Optional[str] = None
+    created_at: Optional[datetime] = None
+    approved_at: Optional[datetime] = None
+
 # Схемы для уведомлений казначейства
 class TreasuryNotificationBase(BaseModel):
     approval_process_id: Optional[UUID] = None
@@ -203,6 +243,9 @@ class UserNotificationBase(BaseModel):
     approval_process_id: Optional[UUID] = None
     import_id: Optional[UUID] = None
 
+class UserNotificationCreate(UserNotificationBase):
+    pass
+
 class UserNotificationResponse(UserNotificationBase):
     id: UUID
     is_read: bool
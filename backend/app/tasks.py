@@ -1,50 +1,364 @@
 from app.celery_app import celery_app
 from app.database import SessionLocal
-from app.models import Import, Request
-import openpyxl
-from io import BytesIO
-from datetime import datetime
+from app.models import Import, Request, User, ExportJob
+from app.utils.categorization import get_keyword_matcher, recategorize_requests
+from app.utils.excel_processor import iter_import_rows
+from app.utils.import_pipeline import (
+    import_request_rows,
+    staged_files,
+    staged_file_name,
+    remove_staged,
+    fail_import,
+    SPECIAL_CATEGORY_MAP,
+    SPECIAL_TREASURY_IMPORT_TYPE_MAP
+)
+from app.utils.stats_rollup import REQUEST_DAY, refresh_request_stats, rebuild_deleted_days
+from app.utils.excel_export import EXPORT_ARTIFACT_DIR, EXPORT_ARTIFACT_TTL_HOURS, export_artifact_path
+from app.routes.notifications import create_notifications, batch_for_approval_notification
+from datetime import datetime, date
+from pathlib import Path
+from sqlalchemy import delete, update
+import logging
 import traceback
 
-@celery_app.task(bind=True, max_retries=3)
-def process_excel_import_task(self, import_id):
+logger = logging.getLogger(__name__)
+
+@celery_app.task
+def process_excel_import_task(import_id):
     """
     Фоновая задача для обработки импорта Excel файлов
+
+    Файлы берутся из области хранения (IMPORT_STAGING_DIR/<import_id>), каждый
+    файл импортируется пакетным INSERT в отдельной транзакции, после каждого
+    файла обновляется поле progress. В конце отправляются уведомления.
     """
     db = SessionLocal()
+    import_record = None
     
     try:
         import_record = db.query(Import).filter(Import.id == import_id).first()
         if not import_record:
             return {"status": "error", "message": "Import record not found"}
         
+        if import_record.status in ("completed", "failed"):
+            # Повторная доставка уже обработанной задачи
+            return {"status": "skipped", "import_id": str(import_id)}
+        
+        if import_record.status == "processing":
+            # Воркер упал посреди обработки - удаляем частично импортированные заявки.
+            # Особые заявки уже не черновики и учтены в суточных итогах - их дни
+            # пересчитываются в той же транзакции
+            deleted = db.execute(
+                delete(Request).where(
+                    Request.import_id == import_record.id
+                ).returning(REQUEST_DAY, Request.status),
+                execution_options={"synchronize_session": False}
+            ).all()
+            rebuild_deleted_days(db, [day for day, status in deleted if status != "draft"])
+        
         # Обновляем статус импорта
         import_record.status = "processing"
+        import_record.progress = 0
+        import_record.imported_count = 0
+        import_record.skipped_count = 0
         db.commit()
         
-        # Здесь будет логика обработки Excel файла
-        # В реальном приложении здесь будет чтение файла из хранилища
+        user = db.query(User).filter(User.id == import_record.user_id).first()
+        special = import_record.import_type not in (None, "regular")
+        
+        # Общие для всех заявок импорта значения
+        if special:
+            defaults = {
+                "request_date": datetime.now().strftime("%d.%m.%Y %H:%M:%S"),
+                "category": SPECIAL_CATEGORY_MAP.get(import_record.import_type, "schedules"),
+                "import_type": "special",
+                "treasury_import_type": SPECIAL_TREASURY_IMPORT_TYPE_MAP.get(
+                    import_record.import_type, import_record.import_type
+                ),
+                "created_by": user.id,
+                "import_id": import_record.id,
+                "source": 'treasury',
+                "status": "pending"
+            }
+        else:
+            defaults = {
+                "applicant": user.full_name,
+                "request_date": "2024-01-01",
+                "category": "subdivisions",  # По умолчанию
+                "import_type": "regular",
+                "created_by": user.id,
+                "import_id": import_record.id,
+                "source": 'treasury' if user.role == 'treasury' else 'employee',
+                "status": "draft"
+            }
         
-        # Имитация обработки
-        import_record.status = "completed"
-        import_record.imported_count = 10  # Примерное количество
+        # Скомпилированный поиск ключевых слов из кэша процесса
+        matcher = get_keyword_matcher(db)
+        
+        files = staged_files(import_record.id)
+        imported_count = 0
+        skipped_count = 0
+        imported_amount = 0.0
+        imported_categories = set()
+        errors = []
+        
+        for index, path in enumerate(files, start=1):
+            file_name = staged_file_name(path)
+            
+            try:
+                # Файл читается потоково в зависимости от формата (xlsx, xlsb, csv),
+                # лимиты размера и строк проверяет парсер
+                summary, row_errors = import_request_rows(
+                    db, iter_import_rows(path), defaults, file_name, matcher
+                )
+                
+                # Особые заявки казначейства: ошибка в любой строке отменяет файл
+                if special and row_errors:
+                    db.rollback()
+                    raise ValueError("; ".join(row_errors[:5]))
+                
+                imported_count += summary["count"]
+                skipped_count += len(row_errors)
+                imported_amount += summary["amount"]
+                imported_categories.update(summary["categories"])
+                errors.extend(row_errors)
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Ошибка при обработке файла {file_name}: {str(e)}")
+                errors.append(f"Ошибка при обработке файла {file_name}: {str(e)}")
+                skipped_count += 1
+            
+            # Файл импортирован (или отклонен) целиком - фиксируем прогресс
+            import_record.imported_count = imported_count
+            import_record.skipped_count = skipped_count
+            import_record.progress = int(index * 100 / len(files))
+            db.commit()
+        
+        # Особый импорт казначейства из одного файла считается неуспешным при ошибке
+        import_record.status = "failed" if special and errors else "completed"
+        import_record.progress = 100
+        if errors:
+            import_record.error_message = "; ".join(errors[:5])  # Сохраняем первые 5 ошибок
         db.commit()
         
-        return {"status": "success", "import_id": str(import_id)}
+        # Создание пакетного уведомления для заместителей (обычный импорт)
+        if imported_count and not special:
+            try:
+                deputies = db.query(User).filter(User.role == "deputy_director").all()
+                
+                # Уведомления всем заместителям одним INSERT
+                create_notifications(db, [
+                    batch_for_approval_notification(
+                        deputy_id=deputy.id,
+                        import_id=import_record.id,
+                        request_count=imported_count,
+                        categories=list(imported_categories),
+                        total_amount=imported_amount,
+                        imported_by_user=user
+                    )
+                    for deputy in deputies
+                ])
+                db.commit()
+                
+                logger.info(f"Создано пакетное уведомление для заместителей о {imported_count} заявках")
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Ошибка при создании уведомления: {str(e)}")
+                # Не прерываем импорт из-за ошибки уведомления
+        
+        remove_staged(import_record.id)
+        
+        return {
+            "status": "success",
+            "import_id": str(import_id),
+            "imported_count": imported_count,
+            "skipped_count": skipped_count
+        }
         
     except Exception as e:
         # В случае ошибки
+        db.rollback()
         if import_record:
-            import_record.status = "failed"
-            import_record.error_message = str(e)
-            db.commit()
+            # Повторная доставка пропустит failed - файлы удаляются сейчас
+            fail_import(db, import_record, str(e))
         
-        # Повторная попытка
-        raise self.retry(exc=e, countdown=60)
+        logger.error(f"Ошибка импорта {import_id}: {traceback.format_exc()}")
+        return {"status": "error", "import_id": str(import_id), "message": str(e)}
     
     finally:
         db.close()
 
+@celery_app.task(bind=True)
+def recategorize_requests_task(self):
+    """
+    Фоновая перекатегоризация всех заявок (после изменения ключевых слов)
+
+    Ход выполнения публикуется в состоянии задачи PROGRESS
+    (processed / total / total_updated).
+    """
+    db = SessionLocal()
+
+    def report_progress(stats):
+        self.update_state(state="PROGRESS", meta=dict(stats))
+
+    try:
+        stats = recategorize_requests(db, progress_callback=report_progress)
+        logger.info(f"Перекатегоризация завершена: {stats}")
+        return stats
+
+    except Exception:
+        db.rollback()
+        logger.error(f"Ошибка перекатегоризации: {traceback.format_exc()}")
+        raise
+
+    finally:
+        db.close()
+
+@celery_app.task
+def run_export_job(job_id):
+    """
+    Фоновая выгрузка в Excel
+
+    Книга пишется во временный файл в EXPORT_ARTIFACT_DIR и после успешного
+    завершения переименовывается в <job_id>.xlsx. Данные читаются в отдельной
+    сессии: коммиты прогресса не закрывают серверный курсор выгрузки.
+    """
+    # Построители книг живут в модулях маршрутов, которые сами импортируют задачи
+    from app.routes.treasury import build_payment_register, ExportRequest
+    from app.routes.statistics import build_statistics_workbook
+
+    db = SessionLocal()
+    data_db = SessionLocal()
+    job = None
+    part_path = None
+
+    try:
+        job = db.query(ExportJob).filter(ExportJob.id == job_id).first()
+        if not job:
+            return {"status": "error", "message": "Export job not found"}
+
+        if job.status in ("completed", "failed"):
+            # Повторная доставка уже выполненной задачи
+            return {"status": "skipped", "job_id": str(job_id)}
+
+        job.status = "processing"
+        job.progress = 0
+        db.commit()
+
+        def report_progress(written, total):
+            if total:
+                job.progress = min(int(written * 100 / total), 99)
+                db.commit()
+
+        EXPORT_ARTIFACT_DIR.mkdir(parents=True, exist_ok=True)
+        path = export_artifact_path(job.id)
+        part_path = path.with_suffix(".part")
+        params = job.params or {}
+
+        with open(part_path, "wb") as output:
+            if job.export_type == "treasury_payments":
+                _, row_count = build_payment_register(
+                    data_db, ExportRequest(**params), output, report_progress
+                )
+            elif job.export_type == "statistics":
+                user = data_db.query(User).filter(User.id == job.user_id).first()
+                _, row_count = build_statistics_workbook(
+                    data_db,
+                    user,
+                    start_date=date.fromisoformat(params["start_date"]) if params.get("start_date") else None,
+                    end_date=date.fromisoformat(params["end_date"]) if params.get("end_date") else None,
+                    group_by=params.get("group_by", "article"),
+                    status=params.get("status"),
+                    output=output,
+                    progress_callback=report_progress
+                )
+            else:
+                raise ValueError(f"Неизвестный тип выгрузки: {job.export_type}")
+
+        part_path.replace(path)
+
+        job.status = "completed"
+        job.progress = 100
+        job.row_count = row_count
+        job.file_path = str(path)
+        job.file_size = path.stat().st_size
+        job.completed_at = datetime.utcnow()
+        db.commit()
+
+        return {"status": "success", "job_id": str(job_id), "row_count": row_count}
+
+    except Exception as e:
+        db.rollback()
+        if part_path:
+            part_path.unlink(missing_ok=True)
+        if job:
+            job.status = "failed"
+            job.error_message = str(e)
+            db.commit()
+
+        logger.error(f"Ошибка выгрузки {job_id}: {traceback.format_exc()}")
+        return {"status": "error", "job_id": str(job_id), "message": str(e)}
+
+    finally:
+        data_db.close()
+        db.close()
+
+@celery_app.task
+def cleanup_old_exports():
+    """
+    Удаление файлов и записей фоновых выгрузок старше EXPORT_ARTIFACT_TTL_HOURS
+
+    Зависшие задания (queued/processing старше того же срока - воркер упал или
+    задача потеряна) помечаются как failed, их файлы (в том числе недописанные
+    .part) удаляются; записи удаляются при следующем запуске вместе с failed.
+    """
+    db = SessionLocal()
+
+    try:
+        from datetime import timedelta
+
+        cutoff_date = datetime.utcnow() - timedelta(hours=EXPORT_ARTIFACT_TTL_HOURS)
+        jobs = db.query(ExportJob.id, ExportJob.file_path).filter(
+            ExportJob.created_at < cutoff_date,
+            ExportJob.status.in_(["completed", "failed"])
+        ).all()
+
+        for job in jobs:
+            if job.file_path:
+                Path(job.file_path).unlink(missing_ok=True)
+
+        deleted_count = db.query(ExportJob).filter(
+            ExportJob.id.in_([job.id for job in jobs])
+        ).delete(synchronize_session=False) if jobs else 0
+
+        expired = db.execute(
+            update(ExportJob).where(
+                ExportJob.created_at < cutoff_date,
+                ExportJob.status.in_(["queued", "processing"])
+            ).values(
+                status="failed",
+                error_message=f"Выгрузка не завершена за {EXPORT_ARTIFACT_TTL_HOURS} ч",
+                completed_at=datetime.utcnow()
+            ).returning(ExportJob.id),
+            execution_options={"synchronize_session": False}
+        ).all()
+
+        for job in expired:
+            path = export_artifact_path(job.id)
+            path.unlink(missing_ok=True)
+            path.with_suffix(".part").unlink(missing_ok=True)
+
+        db.commit()
+
+        return {"deleted_count": deleted_count, "expired_count": len(expired)}
+
+    except Exception as e:
+        db.rollback()
+        return {"status": "error", "message": str(e)}
+
+    finally:
+        db.close()
+
 @celery_app.task
 def cleanup_old_imports():
     """
@@ -77,30 +391,18 @@ def cleanup_old_imports():
 @celery_app.task
 def update_request_statistics():
     """
-    Обновление статистики по заявкам
+    Обновление суточных итогов по заявкам (request_stats_daily)
+
+    Пересчитываются только дни, в которых заявки менялись с прошлого запуска.
     """
     db = SessionLocal()
     
     try:
-        from sqlalchemy import func
-        
-        # Статистика по статусам
-        status_stats = db.query(
-            Request.status,
-            func.count(Request.id).label('count'),
-            func.sum(Request.amount).label('total_amount')
-        ).group_by(Request.status).all()
-        
-        # Здесь можно сохранить статистику в кэш или отдельную таблицу
-        
-        return {
-            "status_stats": [
-                {"status": stat.status, "count": stat.count, "total_amount": float(stat.total_amount or 0)}
-                for stat in status_stats
-            ]
-        }
+        return refresh_request_stats(db)
         
     except Exception as e:
+        db.rollback()
+        logger.error(f"Ошибка обновления статистики: {traceback.format_exc()}")
         return {"status": "error", "message": str(e)}
     
     finally:
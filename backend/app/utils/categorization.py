@@ -2,10 +2,24 @@
 Утилиты для категоризации заявок
 """
 from sqlalchemy.orm import Session
-from typing import List, Dict, Optional
+from sqlalchemy import func, update, values, column, String
+from sqlalchemy.dialects.postgresql import UUID
+from typing import List, Dict, Optional, Tuple, Callable
 import re
+import threading
+import time
+import uuid
 from app.models import Request, CategoryKeyword
 
+# Категории кабинета заместителя (кнопки над сводной таблицей)
+UI_CATEGORIES = [
+    'pitanie_projivanie',
+    'graphs',
+    'approved_by_director',
+    'non_transferable',
+    'filialy',
+]
+
 def categorize_request(request: Request, db: Session) -> None:
     """
     Автоматическая категоризация заявки
@@ -29,37 +43,225 @@ def categorize_request(request: Request, db: Session) -> None:
             db.commit()
             db.refresh(request)
 
-def determine_employee_category(request: Request, db: Session) -> Optional[str]:
+# Окончания, отбрасываемые при построении основы русского слова.
+# Отсортированы по убыванию длины, чтобы отбрасывалось самое длинное окончание.
+RUSSIAN_ENDINGS = sorted([
+    'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'иях', 'ией',
+    'ах', 'ях', 'ов', 'ев', 'ей', 'ия', 'ие', 'ий', 'ый', 'ой', 'ая', 'яя',
+    'ое', 'ее', 'ые', 'ью', 'ом', 'ем', 'ам', 'ям', 'ую', 'юю',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+], key=len, reverse=True)
+
+# Минимальная длина основы: более короткие слова ищутся целиком
+MIN_STEM_LENGTH = 4
+
+# Как часто (в секундах) проверять, не изменились ли ключевые слова в БД
+KEYWORD_CACHE_TTL = 30
+
+def normalize_text(text: str) -> str:
     """
-    Определение категории для заявок от сотрудников
-    
-    Возвращает:
-    - 'pitanie_projivanie' если найдены ключевые слова
-    - 'filialy' если не найдены ключевые слова
-    - None если не удалось определить
+    Нижний регистр и 'ё' -> 'е' для сопоставления с ключевыми словами
+    """
+    return text.lower().replace('ё', 'е')
+
+def russian_stem(word: str) -> str:
+    """
+    Упрощенная основа слова: отбрасывается одно окончание, если основа
+    остается не короче MIN_STEM_LENGTH символов
     """
-    # Получаем все ключевые слова для категории pitanie_projivanie
-    keywords = db.query(CategoryKeyword).filter(
-        CategoryKeyword.category == 'pitanie_projivanie'
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+def keyword_pattern(keyword: str) -> str:
+    """
+    Регулярное выражение для ключевого слова
+
+    - каждое слово ищется с начала слова (граница слова слева);
+    - слово приводится к основе и допускает любое окончание
+      ("питание" находит "питания", "питанием");
+    - '*' в конце ключевого слова задает основу явно ("прожив*");
+    - короткие слова ищутся целиком.
+    """
+    keyword = normalize_text(keyword.strip())
+    explicit_stem = keyword.endswith('*')
+    words = keyword.rstrip('*').split()
+
+    parts = []
+    for index, word in enumerate(words):
+        is_last = index == len(words) - 1
+        if explicit_stem and is_last:
+            parts.append(re.escape(word) + r'\w*')
+        elif len(word) >= MIN_STEM_LENGTH:
+            parts.append(re.escape(russian_stem(word)) + r'\w*')
+        else:
+            parts.append(re.escape(word) + r'(?!\w)')
+
+    return r'(?<!\w)' + r'\s+'.join(parts)
+
+class KeywordMatcher:
+    """
+    Скомпилированный поиск ключевых слов категорий
+
+    Ключевые слова каждой категории объединяются в одно регулярное выражение,
+    поэтому текст просматривается за один проход на категорию, а совпадения
+    разных категорий не перекрывают друг друга ("аренда офиса" одной категории
+    не скрывает "аренда" другой). Каждое найденное ключевое слово добавляет
+    свой вес (weight) к оценке своей категории, вес 0 - ключевое слово не влияет
+    на выбор.
+    """
+
+    def __init__(self, keywords: List[Tuple[str, str, int]]):
+        # (category, keyword, weight), без повторов
+        self.entries = []
+        seen = set()
+        for category, keyword, weight in keywords:
+            if not keyword or not keyword.strip('* '):
+                continue
+            key = (category, normalize_text(keyword.strip()))
+            if key in seen:
+                continue
+            seen.add(key)
+            self.entries.append((category, keyword, 1 if weight is None else weight))
+
+        # Категория -> выражение; внутри категории длинные ключевые слова
+        # раньше коротких - предпочитаем самое длинное совпадение
+        self.patterns = {}
+        for category in dict.fromkeys(entry[0] for entry in self.entries):
+            order = sorted(
+                (i for i, entry in enumerate(self.entries) if entry[0] == category),
+                key=lambda i: -len(self.entries[i][1])
+            )
+            self.patterns[category] = re.compile(
+                '|'.join(f'(?P<k{i}>{keyword_pattern(self.entries[i][1])})' for i in order)
+            )
+
+    def score(self, text: str) -> Dict[str, int]:
+        """
+        Суммарный вес найденных ключевых слов по категориям
+        """
+        scores = {}
+        if not self.patterns or not text:
+            return scores
+
+        text = normalize_text(text)
+        for category, pattern in self.patterns.items():
+            found = set()
+            for match in pattern.finditer(text):
+                index = int(match.lastgroup[1:])
+                if index in found:
+                    continue
+                found.add(index)
+                scores[category] = scores.get(category, 0) + self.entries[index][2]
+
+        return scores
+
+    def classify(self, text: str, prefer: Optional[str] = None) -> Optional[str]:
+        """
+        Категория с наибольшим положительным весом или None, если ничего не найдено
+
+        При равенстве весов выбирается prefer.
+        """
+        scores = {category: weight for category, weight in self.score(text).items() if weight > 0}
+        if not scores:
+            return None
+        return max(scores.items(), key=lambda item: (item[1], item[0] == prefer))[0]
+
+# Кэш скомпилированного поиска на уровне процесса
+_keyword_cache = {
+    'matcher': None,
+    'version': None,
+    'checked_at': 0.0,
+}
+_keyword_cache_lock = threading.Lock()
+
+def invalidate_keyword_cache() -> None:
+    """
+    Сброс кэша ключевых слов (вызывать после изменения category_keywords)
+    """
+    with _keyword_cache_lock:
+        _keyword_cache['version'] = None
+        _keyword_cache['checked_at'] = 0.0
+
+def get_keyword_matcher(db: Session) -> KeywordMatcher:
+    """
+    Скомпилированный поиск по всем ключевым словам из кэша процесса
+
+    Не чаще раза в KEYWORD_CACHE_TTL секунд проверяется версия ключевых слов
+    (количество и max(updated_at)); при изменении поиск пересобирается.
+    Между проверками категоризация не обращается к БД.
+    """
+    now = time.monotonic()
+    with _keyword_cache_lock:
+        matcher = _keyword_cache['matcher']
+        if matcher is not None and now - _keyword_cache['checked_at'] < KEYWORD_CACHE_TTL:
+            return matcher
+
+    version = tuple(db.query(
+        func.count(CategoryKeyword.id),
+        func.max(CategoryKeyword.updated_at),
+        func.max(CategoryKeyword.id)
+    ).one())
+
+    with _keyword_cache_lock:
+        if _keyword_cache['matcher'] is not None and _keyword_cache['version'] == version:
+            _keyword_cache['checked_at'] = now
+            return _keyword_cache['matcher']
+
+    keywords = db.query(
+        CategoryKeyword.category,
+        CategoryKeyword.keyword,
+        CategoryKeyword.weight
     ).all()
+    matcher = KeywordMatcher([tuple(row) for row in keywords])
+
+    with _keyword_cache_lock:
+        _keyword_cache['matcher'] = matcher
+        _keyword_cache['version'] = version
+        _keyword_cache['checked_at'] = now
+
+    return matcher
+
+def classify_employee_text(article: Optional[str], purpose: Optional[str], matcher: KeywordMatcher) -> str:
+    """
+    Категория заявки сотрудника по тексту статьи и назначения платежа
     
-    if not keywords:
-        return 'filialy'
-    
+    Возвращает 'pitanie_projivanie', если у этой категории наибольший суммарный
+    вес найденных ключевых слов (при равенстве - тоже она), иначе 'filialy'
+    """
     # Текст для анализа (объединяем article и purpose)
-    text_to_analyze = f"{request.article or ''} {request.purpose or ''}".lower()
+    category = matcher.classify(f"{article or ''} {purpose or ''}", prefer='pitanie_projivanie')
     
-    # Проверяем наличие ключевых слов
-    for keyword_obj in keywords:
-        keyword = keyword_obj.keyword.lower()
-        
-        # Простой поиск подстроки (можно улучшить)
-        if keyword in text_to_analyze:
-            return 'pitanie_projivanie'
+    if category == 'pitanie_projivanie':
+        return 'pitanie_projivanie'
     
     # Если ключевые слова не найдены
     return 'filialy'
 
+def determine_employee_category(request: Request, db: Session) -> Optional[str]:
+    """
+    Определение категории для заявок от сотрудников
+    
+    Возвращает:
+    - 'pitanie_projivanie' если найдены ключевые слова
+    - 'filialy' если не найдены ключевые слова
+    - None если не удалось определить
+    """
+    return classify_employee_text(request.article, request.purpose, get_keyword_matcher(db))
+
+def category_condition(category: str):
+    """
+    Условие фильтрации заявок по категории интерфейса
+
+    Использует материализованный столбец effective_category, поэтому
+    фильтр обслуживается индексами (status, effective_category).
+    Для 'all' и неизвестных категорий возвращает None - фильтр не нужен.
+    """
+    if category in UI_CATEGORIES:
+        return Request.effective_category == category
+    return None
+
 def get_requests_by_category(
     db: Session, 
     category: str,
@@ -78,67 +280,146 @@ def get_requests_by_category(
     """
     query = db.query(Request).filter(Request.status == 'approved_for_payment')  # На согласовании
     
-    if category == 'all':
-        # Все заявки со статусом pending
-        pass
-    elif category == 'pitanie_projivanie':
-        query = query.filter(
-            Request.employee_category == 'pitanie_projivanie',
-            Request.source == 'employee'
-        )
-    elif category == 'graphs':
-        query = query.filter(
-            Request.treasury_import_type == 'graphs',
-            Request.source == 'treasury'
-        )
-    elif category == 'approved_by_director':
-        query = query.filter(
-            Request.treasury_import_type == 'approved_by_director',
-            Request.source == 'treasury'
-        )
-    elif category == 'non_transferable':
-        query = query.filter(
-            Request.treasury_import_type == 'non_transferable',
-            Request.source == 'treasury'
-        )
-    elif category == 'filialy':
-        query = query.filter(
-            (Request.employee_category == 'filialy') |
-            (
-                (Request.employee_category.is_(None)) &
-                (Request.source == 'employee') &
-                (Request.treasury_import_type.is_(None))
-            )
-        )
+    condition = category_condition(category)
+    if condition is not None:
+        query = query.filter(condition)
     
     if source:
         query = query.filter(Request.source == source)
     
     return query.all()
 
-def update_request_categories(db: Session) -> Dict[str, int]:
+def get_category_stats(
+    db: Session,
+    status: str,
+    import_id: Optional[uuid.UUID] = None
+) -> Dict[str, Dict[str, float]]:
     """
-    Обновление категорий для всех заявок
-    Возвращает статистику по обновленным категориям
+    Количество и сумма заявок по всем категориям за один GROUP BY
+
+    Возвращает словарь {категория: {'count': ..., 'amount': ...}} для всех
+    категорий из UI_CATEGORIES и итоговой категории 'all'.
+    """
+    query = db.query(
+        Request.effective_category,
+        func.count(Request.id),
+        func.coalesce(func.sum(Request.amount), 0)
+    ).filter(Request.status == status)
+
+    if import_id:
+        query = query.filter(Request.import_id == import_id)
+
+    stats = {name: {'count': 0, 'amount': 0.0} for name in UI_CATEGORIES + ['all']}
+
+    for name, count, amount in query.group_by(Request.effective_category).all():
+        if name in stats:
+            stats[name]['count'] += count
+            stats[name]['amount'] += float(amount)
+        # Категория 'all' включает и заявки без категории
+        stats['all']['count'] += count
+        stats['all']['amount'] += float(amount)
+
+    return stats
+
+# Размер пачки при массовой перекатегоризации
+RECATEGORIZE_CHUNK_SIZE = 1000
+
+def recategorize_requests(
+    db: Session,
+    chunk_size: int = RECATEGORIZE_CHUNK_SIZE,
+    progress_callback: Optional[Callable[[Dict[str, int]], None]] = None
+) -> Dict[str, int]:
     """
-    requests = db.query(Request).all()
+    Массовая перекатегоризация всех заявок
+
+    Заявки читаются пачками по первичному ключу (keyset-пагинация), категории
+    вычисляются в памяти, а изменения записываются одним
+    UPDATE ... FROM (VALUES ...) на пачку и только для заявок, у которых
+    категория действительно изменилась. Каждая пачка - отдельная короткая
+    транзакция, таблица не блокируется на все время работы.
+    """
+    # Ключевые слова могли только что измениться - пересобираем поиск
+    invalidate_keyword_cache()
+    matcher = get_keyword_matcher(db)
+
     stats = {
         'pitanie_projivanie': 0,
         'filialy': 0,
-        'total_updated': 0
+        'total_updated': 0,
+        'processed': 0,
+        'total': db.query(func.count(Request.id)).scalar() or 0
     }
-    
-    for request in requests:
-        old_category = request.employee_category
-        categorize_request(request, db)
-        
-        if request.employee_category != old_category:
-            stats['total_updated'] += 1
-            
-            if request.employee_category == 'pitanie_projivanie':
-                stats['pitanie_projivanie'] += 1
-            elif request.employee_category == 'filialy':
-                stats['filialy'] += 1
-    
-    db.commit()
+
+    last_id = None
+    while True:
+        query = db.query(
+            Request.id,
+            Request.source,
+            Request.article,
+            Request.purpose,
+            Request.employee_category,
+            Request.treasury_import_type
+        )
+        if last_id is not None:
+            query = query.filter(Request.id > last_id)
+        chunk = query.order_by(Request.id).limit(chunk_size).all()
+
+        if not chunk:
+            break
+
+        employee_changes = []
+        treasury_defaults = []
+
+        for request_id, source, article, purpose, employee_category, treasury_import_type in chunk:
+            if source == 'employee':
+                new_category = classify_employee_text(article, purpose, matcher)
+                if new_category != employee_category:
+                    employee_changes.append({'id': request_id, 'category': new_category})
+            elif source == 'treasury' and not treasury_import_type:
+                # Для казначейства категория по умолчанию (как в categorize_request)
+                treasury_defaults.append(request_id)
+
+        if employee_changes:
+            changes = values(
+                column('id', UUID(as_uuid=True)),
+                column('category', String(50)),
+                name='changes'
+            ).data([(change['id'], change['category']) for change in employee_changes])
+
+            db.execute(
+                update(Request).where(
+                    Request.id == changes.c.id,
+                    Request.employee_category.is_distinct_from(changes.c.category)
+                ).values(employee_category=changes.c.category),
+                execution_options={'synchronize_session': False}
+            )
+
+            for change in employee_changes:
+                if change['category'] in stats:
+                    stats[change['category']] += 1
+
+        if treasury_defaults:
+            db.query(Request).filter(
+                Request.id.in_(treasury_defaults)
+            ).update(
+                {'treasury_import_type': 'non_transferable'},
+                synchronize_session=False
+            )
+
+        db.commit()
+
+        stats['total_updated'] += len(employee_changes) + len(treasury_defaults)
+        stats['processed'] += len(chunk)
+        last_id = chunk[-1][0]
+
+        if progress_callback:
+            progress_callback(stats)
+
     return stats
+
+def update_request_categories(db: Session) -> Dict[str, int]:
+    """
+    Обновление категорий для всех заявок
+    Возвращает статистику по обновленным категориям
+    """
+    return recategorize_requests(db)
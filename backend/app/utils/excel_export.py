@@ -0,0 +1,152 @@
+"""
+Потоковый экспорт в Excel
+
+Книга пишется xlsxwriter в режиме constant_memory: строки сбрасываются на диск
+по мере записи, а готовый файл собирается во временном файле
+(SpooledTemporaryFile - в памяти до EXPORT_SPOOL_MAX_SIZE, дальше на диске)
+и отдается клиенту частями через StreamingResponse.
+"""
+from datetime import datetime
+from pathlib import Path
+from tempfile import SpooledTemporaryFile
+from typing import Callable, Dict, Iterable, Iterator, Optional, Sequence
+from urllib.parse import quote
+import os
+
+import pytz
+import xlsxwriter
+from fastapi.responses import StreamingResponse
+
+MOSCOW_TZ = pytz.timezone('Europe/Moscow')
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Размер пачки строк при чтении из БД серверным курсором
+EXPORT_YIELD_PER = 1000
+# До этого размера готовый файл держится в памяти, дальше - на диске
+EXPORT_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+# Размер части файла в ответе
+EXPORT_CHUNK_SIZE = 64 * 1024
+# Каталог временных файлов xlsxwriter (по умолчанию системный)
+EXPORT_TMP_DIR = os.getenv("EXPORT_TMP_DIR") or None
+# Каталог готовых файлов фоновых выгрузок и срок их хранения
+EXPORT_ARTIFACT_DIR = Path(os.getenv("EXPORT_ARTIFACT_DIR", "/opt/sariz/exports"))
+EXPORT_ARTIFACT_TTL_HOURS = int(os.getenv("EXPORT_ARTIFACT_TTL_HOURS", "24"))
+
+# Прогресс выгрузки: (записано строк, всего строк или None)
+ProgressCallback = Callable[[int, Optional[int]], None]
+
+def to_moscow(value: Optional[datetime]) -> Optional[datetime]:
+    """
+    Время в часовом поясе Москвы (время без пояса считается UTC)
+    """
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = pytz.utc.localize(value)
+    return value.astimezone(MOSCOW_TZ)
+
+def format_moscow_datetime(value: Optional[datetime]) -> str:
+    """
+    Дата и время по Москве в формате "09.10.2025 23:59:59"
+    """
+    value = to_moscow(value)
+    return value.strftime("%d.%m.%Y %H:%M:%S") if value else ""
+
+def write_sheet(
+    workbook: xlsxwriter.Workbook,
+    name: str,
+    headers: Sequence[str],
+    rows: Iterable[Sequence],
+    column_formats: Optional[Dict[int, Dict]] = None,
+    column_width: Optional[float] = None,
+    progress_callback: Optional[ProgressCallback] = None,
+    total: Optional[int] = None
+) -> int:
+    """
+    Лист с заголовками и строками (строки пишутся по одной, по порядку)
+
+    column_formats - формат xlsxwriter для столбца по его индексу,
+    column_width - ширина всех столбцов листа. progress_callback вызывается
+    каждые EXPORT_YIELD_PER строк.
+    Возвращает количество записанных строк данных.
+    """
+    worksheet = workbook.add_worksheet(name)
+
+    if column_width:
+        worksheet.set_column(0, len(headers) - 1, column_width)
+    for column, options in (column_formats or {}).items():
+        worksheet.set_column(column, column, column_width, workbook.add_format(options))
+
+    worksheet.write_row(0, 0, headers)
+
+    count = 0
+    for count, row in enumerate(rows, start=1):
+        worksheet.write_row(count, 0, row)
+        if progress_callback and count % EXPORT_YIELD_PER == 0:
+            progress_callback(count, total)
+
+    return count
+
+def build_xlsx(write: Callable[[xlsxwriter.Workbook], None], output=None):
+    """
+    Сборка книги во временном файле
+
+    write заполняет книгу листами (см. write_sheet). Без output возвращается
+    временный файл, установленный на начало; при ошибке он закрывается.
+    Переданный output (открытый файл) закрывает вызывающий код.
+    """
+    owned = output is None
+    if owned:
+        output = SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_SIZE)
+    try:
+        workbook = xlsxwriter.Workbook(output, {
+            'constant_memory': True,
+            'tmpdir': EXPORT_TMP_DIR,
+            'default_date_format': 'dd.mm.yyyy',
+        })
+        try:
+            write(workbook)
+        finally:
+            workbook.close()
+    except Exception:
+        if owned:
+            output.close()
+        raise
+
+    if owned:
+        output.seek(0)
+    return output
+
+def export_artifact_path(job_id) -> Path:
+    """
+    Путь к файлу фоновой выгрузки
+    """
+    return EXPORT_ARTIFACT_DIR / f"{job_id}.xlsx"
+
+def iter_file_chunks(file, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Чтение файла частями с закрытием по окончании
+    """
+    try:
+        while chunk := file.read(chunk_size):
+            yield chunk
+    finally:
+        file.close()
+
+def xlsx_response(file, filename: str) -> StreamingResponse:
+    """
+    Потоковая отдача готовой книги
+    """
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(0)
+
+    return StreamingResponse(
+        iter_file_chunks(file),
+        media_type=XLSX_MEDIA_TYPE,
+        headers={
+            "Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename, safe='')}",
+            "Content-Length": str(size),
+        }
+    )
@@ -1,132 +1,304 @@
 import openpyxl
+import codecs
+import csv
 from io import BytesIO
-from typing import List, Dict
-import re
-
-def process_excel_file_optimized(file_content: bytes, max_rows: int = 500) -> List[Dict]:
-    """Оптимизированная обработка Excel файлов для сервера с ограниченными ресурсами"""
-    import logging
-    logger = logging.getLogger(__name__)
-
-    # Проверка размера файла
-    if len(file_content) > 5 * 1024 * 1024:  # 5 MB
-        raise ValueError("Файл превышает лимит 5 МБ")
-
-    # Использование режима read_only для экономии памяти
-    workbook = openpyxl.load_workbook(
-        filename=BytesIO(file_content),
-        read_only=True,
-        data_only=True
-    )
-
-    worksheet = workbook.active
-    data = []
-
-    # Чтение заголовков для определения индексов столбцов
-    headers = []
-    for cell in worksheet[1]:  # Первая строка - заголовки
-        headers.append(str(cell.value).strip() if cell.value else "")
-
-    # Логирование найденных заголовков для отладки - ВЫВОДИМ В КОНСОЛЬ
-    print(f"=== EXCEL ПАРСИНГ: НАЙДЕНЫ ЗАГОЛОВКИ ===")
-    for i, header in enumerate(headers):
-        print(f"Столбец {i}: '{header}'")
-    logger.debug(f"Найдены заголовки в Excel файле: {headers}")
-
-    # Определяем индексы нужных столбцов
+from datetime import date, datetime, time
+from pathlib import Path
+from typing import List, Dict, Iterator, Tuple, Union
+import logging
+import os
+
+try:
+    # Быстрое чтение xlsx/xlsb/xls (Rust, без построения объектов ячеек openpyxl)
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+logger = logging.getLogger(__name__)
+
+# Лимиты на один файл импорта (настраиваются через окружение)
+MAX_EXCEL_FILE_SIZE = int(os.getenv("EXCEL_MAX_FILE_SIZE_MB", "50")) * 1024 * 1024
+MAX_EXCEL_ROWS = int(os.getenv("EXCEL_MAX_ROWS", "50000"))
+
+# Поле заявки -> возможные названия столбца в файле
+TARGET_COLUMNS = {
+    'Статья ДДС': ['Статья движения денежных средств', 'Статья ДДС'],
+    'Сумма': ['Сумма'],
+    'Получатель': ['Получатель'],
+    'Номер заявки': ['Заявка', 'Номер заявки'],
+    'Дата заявки': ['Дата заявки'],
+    'Статус': ['Статус'],
+    'Организация': ['Организация'],
+    'Подразделение': ['Подразделение'],
+    'Приоритет': ['Приоритет'],
+    'Назначение': ['Назначение платежа', 'Назначение'],
+    'Дата оплаты': ['Дата оплаты'],
+    'Заявитель': ['Заявитель']
+}
+
+AMOUNT_FIELDS = {'Сумма'}
+DATE_FIELDS = {'Дата заявки', 'Дата оплаты'}
+DATE_FORMATS = ("%d.%m.%Y %H:%M:%S", "%d.%m.%Y")
+
+ExcelSource = Union[bytes, str, Path]
+
+# Поддерживаемые форматы файлов импорта
+IMPORT_EXTENSIONS = {
+    ".xlsx": "xlsx",
+    ".xlsm": "xlsx",
+    ".xlsb": "xlsb",
+    ".xls": "xls",
+    ".csv": "csv",
+    ".tsv": "csv",
+    ".txt": "csv",
+}
+ZIP_SIGNATURE = b"PK\x03\x04"
+OLE_SIGNATURE = b"\xd0\xcf\x11\xe0"
+
+# Кодировки выгрузок 1С: UTF-8 (с BOM или без) и Windows-1251
+CSV_ENCODINGS = ("utf-8-sig", "cp1251")
+CSV_DELIMITERS = ";,\t"
+CSV_SAMPLE_SIZE = 64 * 1024
+
+def resolve_columns(headers: List[str]) -> Dict[str, int]:
+    """
+    Индексы столбцов для полей заявки (-1 - столбец не найден)
+
+    Сначала ищется точное совпадение названия, и только для оставшихся полей -
+    прежнее нечеткое сопоставление (вхождение названия или любого его слова).
+    """
+    normalized = [header.lower().strip() for header in headers]
     column_indices = {}
-    target_columns = {
-        'Статья ДДС': ['Статья движения денежных средств', 'Статья ДДС'],
-        'Сумма': ['Сумма'],
-        'Получатель': ['Получатель'],
-        'Номер заявки': ['Заявка', 'Номер заявки'],
-        'Дата заявки': ['Дата заявки'],
-        'Статус': ['Статус'],
-        'Организация': ['Организация'],
-        'Подразделение': ['Подразделение'],
-        'Приоритет': ['Приоритет'],
-        'Назначение': ['Назначение платежа', 'Назначение'],
-        'Дата оплаты': ['Дата оплаты'],
-        'Заявитель': ['Заявитель']
-    }
-
-    # Логирование для отладки соответствия столбцов
-    print(f"=== EXCEL ПАРСИНГ: ПОИСК СТОЛБЦОВ ===")
-    logger.debug(f"Ищем столбцы по шаблонам: {target_columns}")
-    for target_name, possible_names in target_columns.items():
-        found = False
-        for i, header in enumerate(headers):
-            header_lower = header.lower().strip()
-            for possible_name in possible_names:
-                possible_lower = possible_name.lower().strip()
-                # Проверяем точное совпадение или частичное (если заголовок содержит ключевые слова)
-                if (header_lower == possible_lower or
-                    possible_lower in header_lower or
-                    any(word in header_lower for word in possible_lower.split())):
-                    column_indices[target_name] = i
-                    found = True
-                    print(f"Найден столбец '{target_name}' как столбец {i}: '{header}'")
-                    break
-            if found:
+
+    for target_name, possible_names in TARGET_COLUMNS.items():
+        possible_lower = [name.lower() for name in possible_names]
+        column_indices[target_name] = next(
+            (i for name in possible_lower for i, header in enumerate(normalized) if header == name),
+            -1
+        )
+
+    for target_name, possible_names in TARGET_COLUMNS.items():
+        if column_indices[target_name] >= 0:
+            continue
+
+        for i, header in enumerate(normalized):
+            if any(
+                name.lower() in header or any(word in header for word in name.lower().split())
+                for name in possible_names
+            ):
+                column_indices[target_name] = i
                 break
-        if not found:
-            print(f"ВНИМАНИЕ: Столбец '{target_name}' не найден! Возможные имена: {possible_names}")
-            logger.warning(f"Столбец '{target_name}' не найден. Возможные имена: {possible_names}")
-            # Если столбец не найден, используем -1
-            column_indices[target_name] = -1
-    
-    print(f"=== EXCEL ПАРСИНГ: РЕЗУЛЬТАТЫ ===")
-    for field_name, col_index in column_indices.items():
-        if col_index >= 0:
-            print(f"{field_name}: столбец {col_index} ('{headers[col_index] if col_index < len(headers) else 'N/A'}')")
         else:
-            print(f"{field_name}: НЕ НАЙДЕН - будет пустое значение")
-    print(f"=====================================")
+            logger.warning(f"Столбец '{target_name}' не найден. Возможные имена: {possible_names}")
+
+    logger.debug(f"Столбцы Excel файла: {column_indices}")
+    return column_indices
+
+def parse_amount(value) -> float:
+    """
+    Сумма из ячейки: числа берутся как есть, строки вида "9 100,00" разбираются
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not value:
+        return 0.0
+    try:
+        return float(str(value).replace('\xa0', '').replace(' ', '').replace(',', '.'))
+    except ValueError:
+        return 0.0
+
+def normalize_cell(value):
+    """
+    Значение ячейки в едином для всех способов чтения виде
+
+    openpyxl отдает целые числа как int и даты как datetime, python-calamine -
+    все числа как float и даты без времени как date. Целые float приводятся
+    к int, date - к datetime, чтобы записи не зависели от формата файла.
+    """
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime.combine(value, time.min)
+    return value
+
+def parse_date(value):
+    """
+    Дата из ячейки: datetime из Excel без изменений, date дополняется временем
+    00:00:00, строки "09.10.2025 23:59:59" и "09.10.2025" приводятся к datetime,
+    прочее возвращается строкой
+    """
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, time.min)
+    text = str(value or '').strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+    return text
+
+def iter_excel_rows(source: ExcelSource, max_rows: int = MAX_EXCEL_ROWS) -> Iterator[Tuple[int, Dict]]:
+    """
+    Потоковое чтение заявок из Excel файла
+
+    Файл открывается в режиме read_only, строки читаются по одной и отдаются
+    генератором в виде (номер строки, запись) - весь лист в память не загружается.
+    source - путь к файлу или его содержимое.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        if len(source) > MAX_EXCEL_FILE_SIZE:
+            raise ValueError(f"Файл превышает лимит {MAX_EXCEL_FILE_SIZE // (1024 * 1024)} МБ")
+        source = BytesIO(source)
+    elif Path(source).stat().st_size > MAX_EXCEL_FILE_SIZE:
+        raise ValueError(f"Файл превышает лимит {MAX_EXCEL_FILE_SIZE // (1024 * 1024)} МБ")
 
-    # Чтение данных
-    for i, row in enumerate(worksheet.iter_rows(min_row=2, values_only=True), start=2):
-        if i > max_rows + 1:
+    workbook = openpyxl.load_workbook(filename=source, read_only=True, data_only=True)
+
+    try:
+        worksheet = workbook.active
+
+        header_row = next(worksheet.iter_rows(min_row=1, max_row=1, values_only=True), ())
+        headers = [str(normalize_cell(value)).strip() if value else "" for value in header_row]
+        yield from iter_sheet_records(headers, worksheet.iter_rows(min_row=2, values_only=True), max_rows)
+    finally:
+        workbook.close()
+
+def detect_file_format(path: Path) -> str:
+    """
+    Формат файла импорта по расширению, а при неизвестном расширении -
+    по сигнатуре (zip - xlsx, OLE - xls, иначе текстовый CSV)
+    """
+    file_format = IMPORT_EXTENSIONS.get(path.suffix.lower())
+    if file_format:
+        return file_format
+
+    with open(path, "rb") as f:
+        signature = f.read(4)
+    if signature == ZIP_SIGNATURE:
+        return "xlsx"
+    if signature == OLE_SIGNATURE:
+        return "xls"
+    return "csv"
+
+def detect_csv_encoding(path: Path) -> str:
+    """
+    Кодировка CSV файла: первая из CSV_ENCODINGS, которой декодируется начало файла
+    """
+    with open(path, "rb") as f:
+        sample = f.read(CSV_SAMPLE_SIZE)
+
+    for encoding in CSV_ENCODINGS:
+        try:
+            # Инкрементальный декодер не считает ошибкой символ, обрезанный границей выборки
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return CSV_ENCODINGS[-1]
+
+def iter_csv_rows(path: Path, max_rows: int = MAX_EXCEL_ROWS) -> Iterator[Tuple[int, Dict]]:
+    """
+    Потоковое чтение заявок из CSV/TSV выгрузки (1С)
+
+    Кодировка и разделитель определяются по началу файла, строки читаются
+    модулем csv по одной.
+    """
+    encoding = detect_csv_encoding(path)
+
+    with open(path, "r", encoding=encoding, newline="") as f:
+        sample = f.read(CSV_SAMPLE_SIZE)
+        f.seek(0)
+
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=CSV_DELIMITERS)
+        except csv.Error:
+            dialect = csv.excel_tab if path.suffix.lower() == ".tsv" else csv.excel
+
+        reader = csv.reader(f, dialect)
+        headers = [value.strip() for value in next(reader, [])]
+        yield from iter_sheet_records(headers, reader, max_rows)
+
+def iter_calamine_rows(path: Path, max_rows: int = MAX_EXCEL_ROWS) -> Iterator[Tuple[int, Dict]]:
+    """
+    Чтение заявок из xlsx/xlsb/xls через python-calamine
+    """
+    workbook = CalamineWorkbook.from_path(str(path))
+    rows = workbook.get_sheet_by_index(0).iter_rows()
+
+    headers = [str(normalize_cell(value)).strip() if value not in (None, "") else "" for value in next(rows, [])]
+    yield from iter_sheet_records(headers, rows, max_rows)
+
+def iter_import_rows(path: Union[str, Path], max_rows: int = MAX_EXCEL_ROWS) -> Iterator[Tuple[int, Dict]]:
+    """
+    Потоковое чтение заявок из файла импорта любого поддерживаемого формата
+
+    CSV/TSV читаются модулем csv, xlsx/xlsb/xls - через python-calamine, если он
+    установлен, иначе xlsx читается openpyxl. Все форматы дают одинаковые
+    записи (номер строки, запись).
+    """
+    path = Path(path)
+    if path.stat().st_size > MAX_EXCEL_FILE_SIZE:
+        raise ValueError(f"Файл превышает лимит {MAX_EXCEL_FILE_SIZE // (1024 * 1024)} МБ")
+
+    file_format = detect_file_format(path)
+
+    if file_format == "csv":
+        return iter_csv_rows(path, max_rows)
+    if CalamineWorkbook is not None:
+        return iter_calamine_rows(path, max_rows)
+    if file_format == "xlsx":
+        return iter_excel_rows(path, max_rows)
+
+    raise ValueError(f"Для чтения файлов формата {file_format} требуется пакет python-calamine")
+
+def iter_sheet_records(headers: List[str], rows, max_rows: int = MAX_EXCEL_ROWS) -> Iterator[Tuple[int, Dict]]:
+    """
+    Преобразование строк листа в записи заявок по заголовкам
+
+    Индексы столбцов вычисляются один раз на файл, пустые строки пропускаются.
+    Значения ячеек приводятся normalize_cell, поэтому записи одного и того же
+    листа совпадают для openpyxl, python-calamine и CSV.
+    """
+    column_indices = resolve_columns(headers)
+    fields = [
+        (name, index, name in AMOUNT_FIELDS, name in DATE_FIELDS)
+        for name, index in column_indices.items()
+    ]
+
+    found = False
+    for row_number, row in enumerate(rows, start=2):
+        if row_number > max_rows + 1:
             raise ValueError(f"Файл содержит более {max_rows} строк")
 
-        # Собираем данные по найденным индексам
-        row_data = {}
-
-        for field_name, col_index in column_indices.items():
-            if col_index >= 0 and col_index < len(row):
-                value = row[col_index]
-
-                # Преобразование типов
-                if field_name == 'Сумма':
-                    try:
-                        # Заменяем запятые на точки и убираем пробелы
-                        if isinstance(value, str):
-                            value = value.replace(',', '.').replace(' ', '')
-                        row_data[field_name] = float(value or 0)
-                    except (ValueError, TypeError):
-                        row_data[field_name] = 0.0
-                else:
-                    row_data[field_name] = str(value or '').strip()
+        row_length = len(row)
+        record = {}
+        for name, index, is_amount, is_date in fields:
+            value = normalize_cell(row[index]) if 0 <= index < row_length else None
+            if is_amount:
+                record[name] = parse_amount(value)
+            elif is_date:
+                if value not in (None, ''):
+                    record[name] = parse_date(value)
             else:
-                row_data[field_name] = '' if field_name != 'Сумма' else 0.0
+                record[name] = str(value).strip() if value is not None else ''
 
         # Пропуск пустых строк
-        if not any(row_data.values()):
+        if not any(record.values()):
             continue
 
-        data.append(row_data)
-
-    workbook.close()
+        found = True
+        yield row_number, record
 
-    if not data:
+    if not found:
         raise ValueError("Файл не содержит данных или имеет неверный формат")
 
-    print(f"=== EXCEL ПАРСИНГ: ЗАВЕРШЕНО ===")
-    print(f"Обработано строк: {len(data)}")
-    print(f"=====================================")
-    
-    return data
+def process_excel_file_optimized(file_content: ExcelSource, max_rows: int = MAX_EXCEL_ROWS) -> List[Dict]:
+    """Обработка Excel файла целиком в список записей (для небольших файлов)"""
+    return [record for _, record in iter_excel_rows(file_content, max_rows)]
 
-def process_excel_file(file_content: bytes, max_rows: int = 500) -> List[Dict]:
+def process_excel_file(file_content: ExcelSource, max_rows: int = MAX_EXCEL_ROWS) -> List[Dict]:
     """Основная функция обработки Excel (для обратной совместимости)"""
     return process_excel_file_optimized(file_content, max_rows)
 
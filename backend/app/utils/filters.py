@@ -0,0 +1,81 @@
+"""
+Составные фильтры заявок для дерева казначейства и сводных таблиц
+"""
+from pydantic import BaseModel
+from typing import List, Optional
+import uuid
+from app.models import Request
+from app.utils.categorization import category_condition
+
+class RequestFilter(BaseModel):
+    """
+    Описание отбора заявок: статус, категория и узел дерева навигации
+
+    Все заданные поля объединяются через AND.
+    """
+    status: Optional[str] = None
+    category: Optional[str] = None
+    organization: Optional[str] = None
+    department: Optional[str] = None
+    user_id: Optional[uuid.UUID] = None
+    import_id: Optional[uuid.UUID] = None
+    # Одиночные заявки пользователя (без импорта)
+    single_user_id: Optional[uuid.UUID] = None
+
+    @classmethod
+    def from_node(
+        cls,
+        node_type: Optional[str],
+        organization: Optional[str] = None,
+        department: Optional[str] = None,
+        user_id: Optional[str] = None,
+        import_id: Optional[str] = None,
+        **kwargs
+    ) -> "RequestFilter":
+        """
+        Фильтр для выбранного узла дерева (root/organization/department/user/import)
+        """
+        spec = cls(**kwargs)
+
+        if node_type == 'organization' and organization:
+            spec.organization = organization
+        elif node_type == 'department' and organization and department:
+            spec.organization = organization
+            spec.department = department
+        elif node_type == 'user' and user_id:
+            spec.user_id = uuid.UUID(user_id)
+        elif node_type == 'import' and import_id:
+            # Для одиночных заявок в дереве import_id совпадает с user_id
+            if user_id and import_id == user_id:
+                spec.single_user_id = uuid.UUID(user_id)
+            else:
+                spec.import_id = uuid.UUID(import_id)
+        # Для root не применяем фильтры - все заявки
+
+        return spec
+
+    def conditions(self) -> List:
+        """
+        Список SQL-условий для query.filter(*conditions)
+        """
+        conditions = []
+
+        if self.status:
+            conditions.append(Request.status == self.status)
+        if self.category:
+            condition = category_condition(self.category)
+            if condition is not None:
+                conditions.append(condition)
+        if self.organization:
+            conditions.append(Request.organization == self.organization)
+        if self.department:
+            conditions.append(Request.department == self.department)
+        if self.user_id:
+            conditions.append(Request.created_by == self.user_id)
+        if self.import_id:
+            conditions.append(Request.import_id == self.import_id)
+        if self.single_user_id:
+            conditions.append(Request.created_by == self.single_user_id)
+            conditions.append(Request.import_id.is_(None))
+
+        return conditions
@@ -0,0 +1,205 @@
+"""
+Пакетный импорт заявок из Excel
+
+Строки файла читаются потоково, категоризируются скомпилированным поиском
+ключевых слов и вставляются пакетными INSERT по IMPORT_INSERT_CHUNK_SIZE
+строк внутри одной точки сохранения (SAVEPOINT): файл импортируется либо
+целиком, либо не импортируется вовсе.
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import insert
+from typing import List, Dict, Iterable, Optional, Tuple
+from datetime import datetime
+from pathlib import Path
+import logging
+import os
+import shutil
+import uuid
+import aiofiles
+import pytz
+
+from app.models import Request
+from app.utils.categorization import classify_employee_text, KeywordMatcher
+
+logger = logging.getLogger(__name__)
+
+MOSCOW_TZ = pytz.timezone('Europe/Moscow')
+
+# Локальная область хранения загруженных файлов до обработки фоновой задачей
+IMPORT_STAGING_DIR = Path(os.getenv("IMPORT_STAGING_DIR", "/opt/sariz/staging/imports"))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Количество заявок в одном INSERT
+IMPORT_INSERT_CHUNK_SIZE = 1000
+
+# Маппинг ImportType -> Category и treasury_import_type для особых заявок казначейства
+SPECIAL_CATEGORY_MAP = {
+    "non_transferable": "non_transferable",
+    "schedules": "schedules",
+    "approved_by_director": "schedules",
+    "approved_for_payment": "schedules",
+}
+SPECIAL_TREASURY_IMPORT_TYPE_MAP = {
+    "non_transferable": "non_transferable",
+    "schedules": "graphs",
+    "approved_by_director": "approved_by_director",
+    "approved_for_payment": "approved_by_director",
+}
+
+def parse_request_date(value) -> datetime:
+    """
+    Дата заявки в часовом поясе Москвы (формат "09.10.2025 23:59:59")
+    """
+    if isinstance(value, datetime):
+        return value if value.tzinfo else MOSCOW_TZ.localize(value)
+    return MOSCOW_TZ.localize(datetime.strptime(value, "%d.%m.%Y %H:%M:%S"))
+
+def build_request_row(
+    request_data: Dict,
+    defaults: Dict,
+    matcher: Optional[KeywordMatcher] = None
+) -> Dict:
+    """
+    Значения для INSERT одной заявки из строки файла
+
+    defaults - общие для всего импорта поля (created_by, import_id, source,
+    status, category, import_type, treasury_import_type, applicant, request_date).
+    """
+    row = {
+        "id": uuid.uuid4(),
+        "article": request_data.get("Статья ДДС", ""),
+        "amount": float(request_data.get("Сумма", 0)),
+        "recipient": request_data.get("Получатель", ""),
+        "request_number": request_data.get("Номер заявки", ""),
+        "request_date": parse_request_date(
+            request_data.get("Дата заявки", defaults.get("request_date"))
+        ),
+        "organization": request_data.get("Организация", ""),
+        "department": request_data.get("Подразделение", ""),
+        "purpose": request_data.get("Назначение", ""),
+        "applicant": request_data.get("Заявитель", defaults.get("applicant", "")),
+        "category": defaults["category"],
+        "import_type": defaults["import_type"],
+        "treasury_import_type": defaults.get("treasury_import_type"),
+        "employee_category": None,
+        "created_by": defaults["created_by"],
+        "import_id": defaults["import_id"],
+        "source": defaults["source"],
+        "status": defaults["status"],
+    }
+
+    # Автоматическая категоризация (та же логика, что и в categorize_request)
+    if row["source"] == 'employee':
+        row["employee_category"] = classify_employee_text(row["article"], row["purpose"], matcher or KeywordMatcher([]))
+    elif row["source"] == 'treasury' and not row["treasury_import_type"]:
+        row["treasury_import_type"] = 'non_transferable'
+
+    return row
+
+def import_request_rows(
+    db: Session,
+    records: Iterable[Tuple[int, Dict]],
+    defaults: Dict,
+    file_name: str,
+    matcher: Optional[KeywordMatcher] = None,
+    chunk_size: int = IMPORT_INSERT_CHUNK_SIZE
+) -> Tuple[Dict, List[str]]:
+    """
+    Импорт строк одного файла пакетными INSERT по chunk_size строк
+
+    records - пары (номер строки, запись), например из iter_excel_rows: строки
+    читаются потоково и в памяти одновременно держится не больше одной пачки.
+    Строки с ошибками преобразования пропускаются и попадают в список ошибок
+    с номером строки. Все пачки файла вставляются в одном SAVEPOINT: при ошибке
+    откатываются только заявки этого файла, остальная транзакция вызывающего
+    кода сохраняется.
+
+    Возвращает (итоги файла: count, amount, categories; ошибки).
+    """
+    summary = {"count": 0, "amount": 0.0, "categories": set()}
+    errors = []
+    chunk = []
+
+    def flush():
+        db.execute(insert(Request), chunk)
+        summary["count"] += len(chunk)
+        summary["amount"] += sum(row["amount"] for row in chunk)
+        summary["categories"].update(row["category"] for row in chunk)
+        chunk.clear()
+
+    savepoint = db.begin_nested()
+    try:
+        for row_number, request_data in records:
+            try:
+                chunk.append(build_request_row(request_data, defaults, matcher))
+            except Exception as e:
+                errors.append(f"Ошибка в файле {file_name}, строка {row_number}: {str(e)}")
+                continue
+
+            if len(chunk) >= chunk_size:
+                flush()
+
+        if chunk:
+            flush()
+        savepoint.commit()
+    except Exception:
+        savepoint.rollback()
+        raise
+
+    logger.info(f"Imported {summary['count']} requests from file {file_name}")
+    return summary, errors
+
+def staging_dir(import_id) -> Path:
+    """
+    Каталог с файлами импорта в области хранения
+    """
+    return IMPORT_STAGING_DIR / str(import_id)
+
+async def stage_upload(import_id, index: int, upload) -> Path:
+    """
+    Сохранение загруженного файла в область хранения (потоково, по 1 МБ)
+
+    Префикс с номером сохраняет порядок файлов внутри импорта.
+    """
+    directory = staging_dir(import_id)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    path = directory / f"{index:02d}_{Path(upload.filename).name}"
+    async with aiofiles.open(path, "wb") as out:
+        while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+            await out.write(chunk)
+
+    return path
+
+def staged_files(import_id) -> List[Path]:
+    """
+    Файлы импорта в порядке загрузки
+    """
+    directory = staging_dir(import_id)
+    if not directory.exists():
+        return []
+    return sorted(path for path in directory.iterdir() if path.is_file())
+
+def staged_file_name(path: Path) -> str:
+    """
+    Исходное имя файла (без префикса с номером)
+    """
+    return path.name.split("_", 1)[1] if "_" in path.name else path.name
+
+def remove_staged(import_id) -> None:
+    """
+    Удаление файлов импорта из области хранения
+    """
+    shutil.rmtree(staging_dir(import_id), ignore_errors=True)
+
+def fail_import(db: Session, import_record, message: str) -> None:
+    """
+    Отметка импорта как неуспешного и удаление его файлов из области хранения
+
+    Повторная доставка задачи пропускает импорты в статусе failed, поэтому
+    файлы удаляются сразу, иначе они останутся на диске навсегда.
+    """
+    import_record.status = "failed"
+    import_record.error_message = message
+    db.commit()
+    remove_staged(import_record.id)
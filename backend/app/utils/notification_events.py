@@ -0,0 +1,284 @@
+"""
+Счетчики непрочитанных уведомлений в Redis и доставка их в реальном времени
+
+Число непрочитанных хранится в Redis по ключу на пользователя и меняется
+только приращениями: +1 при создании уведомления, -1 при прочтении, минус
+число отмеченных при "прочитать все". Приращения перестановочны, поэтому
+порядок применения параллельных транзакций не важен. Уведомления создаются в
+транзакции вызывающего кода, поэтому изменения копятся в сессии и применяются
+только после commit (при откате - отбрасываются), новые значения публикуются в
+каналы пользователей (Redis pub/sub).
+
+Если ключа нет (истек срок, Redis перезапущен), число пересчитывается по БД.
+Перед пересчетом ставится метка пересчета: приращения, пришедшие во время
+COUNT, копятся в ней и прибавляются к результату одним скриптом вместе с
+сохранением счетчика. Остаточное расхождение (транзакция, завершенная между
+меткой и COUNT) ограничено коротким сроком жизни ключа.
+"""
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from typing import AsyncIterator, Dict, Iterable
+import redis
+import redis.asyncio as aioredis
+import json
+import logging
+import os
+import time
+import uuid
+
+from app.models import UserNotification
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+CHANNEL_PREFIX = "notifications:"
+COUNTER_PREFIX = "notifications:unread:"
+REFILL_SUFFIX = ":refill"
+
+# Срок жизни счетчика (секунды): после него число пересчитывается по БД
+UNREAD_COUNTER_TTL = 10 * 60
+
+# Срок жизни метки пересчета (секунды): не дольше самого медленного COUNT
+UNREAD_REFILL_TTL = 60
+
+# Ключ изменений счетчиков в Session.info: {user_id: приращение}
+UNREAD_CHANGES_KEY = "notification_unread_changes"
+
+# Как часто проверять отключение клиента и как часто слать keep-alive (секунды)
+STREAM_POLL_TIMEOUT = 1.0
+STREAM_HEARTBEAT_INTERVAL = 25
+
+# Применение приращения: к счетчику, если он есть, иначе к метке пересчета.
+# Возвращает новое значение или nil, если счетчика нет (отрицательное значение
+# означает расхождение - счетчик удаляется)
+APPLY_UNREAD_CHANGE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    if redis.call('EXISTS', KEYS[2]) == 1 then
+        redis.call('INCRBY', KEYS[2], ARGV[1])
+    end
+    return false
+end
+local value = redis.call('INCRBY', KEYS[1], ARGV[1])
+if value < 0 then
+    redis.call('DEL', KEYS[1])
+    return false
+end
+return value
+"""
+
+# Завершение пересчета: сохранить COUNT плюс приращения, накопленные в метке.
+# Если счетчик уже сохранен параллельным пересчетом - вернуть его; если метка
+# истекла (приращения могли потеряться) - не сохранять ничего
+FINISH_UNREAD_REFILL_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current then
+    return tonumber(current)
+end
+local pending = redis.call('GET', KEYS[2])
+if not pending then
+    return tonumber(ARGV[1])
+end
+local value = tonumber(ARGV[1]) + tonumber(pending)
+if value < 0 then
+    value = 0
+end
+redis.call('SET', KEYS[1], value, 'EX', ARGV[2])
+redis.call('DEL', KEYS[2])
+return value
+"""
+
+_redis_client = None
+_apply_unread_change = None
+_finish_unread_refill = None
+
+def get_redis() -> redis.Redis:
+    """
+    Клиент Redis процесса (создается при первом обращении)
+    """
+    global _redis_client, _apply_unread_change, _finish_unread_refill
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(REDIS_URL)
+        _apply_unread_change = _redis_client.register_script(APPLY_UNREAD_CHANGE_SCRIPT)
+        _finish_unread_refill = _redis_client.register_script(FINISH_UNREAD_REFILL_SCRIPT)
+    return _redis_client
+
+def user_channel(user_id) -> str:
+    """
+    Канал событий пользователя
+    """
+    return f"{CHANNEL_PREFIX}{user_id}"
+
+def unread_counter_key(user_id) -> str:
+    """
+    Ключ счетчика непрочитанных уведомлений пользователя
+    """
+    return f"{COUNTER_PREFIX}{user_id}"
+
+def unread_refill_key(user_id) -> str:
+    """
+    Ключ метки пересчета счетчика (приращения во время пересчета)
+    """
+    return f"{COUNTER_PREFIX}{user_id}{REFILL_SUFFIX}"
+
+def count_unread(db: Session, user_id: uuid.UUID) -> int:
+    """
+    Число непрочитанных уведомлений по БД (частичный индекс непрочитанных)
+    """
+    return db.query(func.count(UserNotification.id)).filter(
+        UserNotification.user_id == user_id,
+        UserNotification.is_read == False
+    ).scalar()
+
+def get_unread_count(db: Session, user_id: uuid.UUID) -> int:
+    """
+    Число непрочитанных уведомлений: из Redis, при отсутствии - пересчет по БД
+    с сохранением в Redis
+    """
+    keys = [unread_counter_key(user_id), unread_refill_key(user_id)]
+    try:
+        client = get_redis()
+        cached = client.get(keys[0])
+        if cached is None:
+            # Метка ставится до COUNT; nx - не сбрасывать метку параллельного пересчета
+            client.set(keys[1], 0, ex=UNREAD_REFILL_TTL, nx=True)
+    except redis.RedisError as e:
+        logger.warning(f"Счетчик уведомлений недоступен: {str(e)}")
+        return count_unread(db, user_id)
+
+    if cached is not None:
+        return int(cached)
+
+    count = count_unread(db, user_id)
+    try:
+        return _finish_unread_refill(keys=keys, args=[count, UNREAD_COUNTER_TTL])
+    except redis.RedisError as e:
+        logger.warning(f"Не удалось сохранить счетчик уведомлений: {str(e)}")
+    return count
+
+def _unread_changes(db: Session) -> Dict[uuid.UUID, int]:
+    return db.info.setdefault(UNREAD_CHANGES_KEY, {})
+
+def add_unread(db: Session, user_ids: Iterable[uuid.UUID], amount: int = 1) -> None:
+    """
+    Изменить число непрочитанных на amount для каждого из пользователей
+    (применяется после commit текущей транзакции)
+    """
+    changes = _unread_changes(db)
+    for user_id in user_ids:
+        changes[user_id] = changes.get(user_id, 0) + amount
+
+def apply_unread_changes(changes: Dict[uuid.UUID, int]) -> None:
+    """
+    Применение изменений счетчиков и публикация новых значений
+
+    Если счетчика не было, публикуется null - клиент запрашивает число заново.
+    Ошибка Redis не прерывает запрос: счетчик истечет и будет пересчитан.
+    """
+    try:
+        client = get_redis()
+        pipe = client.pipeline(transaction=False)
+        for user_id, amount in changes.items():
+            _apply_unread_change(
+                keys=[unread_counter_key(user_id), unread_refill_key(user_id)],
+                args=[amount],
+                client=pipe
+            )
+        results = pipe.execute()
+
+        pipe = client.pipeline(transaction=False)
+        for user_id, unread_count in zip(changes, results):
+            pipe.publish(user_channel(user_id), json.dumps({"unread_count": unread_count}))
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Не удалось обновить счетчики уведомлений: {str(e)}")
+
+@event.listens_for(Session, "after_commit")
+def apply_after_commit(session: Session) -> None:
+    changes = session.info.pop(UNREAD_CHANGES_KEY, None)
+    changes = {
+        user_id: amount for user_id, amount in (changes or {}).items()
+        if amount != 0
+    }
+    if changes:
+        apply_unread_changes(changes)
+
+@event.listens_for(Session, "after_soft_rollback")
+def discard_after_rollback(session: Session, previous_transaction) -> None:
+    # Откат точки сохранения не отменяет изменений внешней транзакции
+    if not previous_transaction.nested:
+        session.info.pop(UNREAD_CHANGES_KEY, None)
+
+# Пауза перед переподключением EventSource после обрыва потока (миллисекунды)
+STREAM_RETRY_MS = 10000
+
+def sse_event(name: str, payload: dict) -> str:
+    """
+    Событие в формате Server-Sent Events
+    """
+    return f"event: {name}\ndata: {json.dumps(payload)}\n\n"
+
+async def open_unread_count_subscription(user_id: uuid.UUID):
+    """
+    Подписка на канал пользователя: (клиент, pubsub)
+
+    Ошибка Redis (redis.RedisError) возникает здесь, до начала ответа, чтобы
+    вызывающий код мог вернуть 503 вместо оборванного потока.
+    """
+    client = aioredis.Redis.from_url(REDIS_URL)
+    pubsub = client.pubsub()
+    try:
+        await pubsub.subscribe(user_channel(user_id))
+    except redis.RedisError:
+        await close_unread_count_subscription(client, pubsub)
+        raise
+    return client, pubsub
+
+async def close_unread_count_subscription(client, pubsub) -> None:
+    """
+    Закрытие подписки; ошибки разорванного соединения не маскируют исходную
+    """
+    try:
+        await pubsub.unsubscribe()
+    except redis.RedisError:
+        pass
+    try:
+        await pubsub.aclose()
+        await client.aclose()
+    except redis.RedisError as e:
+        logger.debug(f"Ошибка при закрытии подписки на уведомления: {str(e)}")
+
+async def iter_unread_count_events(
+    client,
+    pubsub,
+    unread_count: int,
+    is_disconnected
+) -> AsyncIterator[str]:
+    """
+    Поток SSE с числом непрочитанных уведомлений пользователя
+
+    Первое событие - текущее число (и пауза переподключения retry), далее -
+    опубликованные изменения. Пока событий нет, отправляется keep-alive
+    комментарий, чтобы прокси не закрывали соединение. is_disconnected -
+    корутина проверки отключения клиента. Подписка закрывается по завершении.
+    """
+    try:
+        yield f"retry: {STREAM_RETRY_MS}\n" + sse_event("unread_count", {"unread_count": unread_count})
+        last_sent = time.monotonic()
+
+        while not await is_disconnected():
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True,
+                timeout=STREAM_POLL_TIMEOUT
+            )
+            if message and message["type"] == "message":
+                yield sse_event("unread_count", json.loads(message["data"]))
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= STREAM_HEARTBEAT_INTERVAL:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+    except redis.RedisError as e:
+        # Поток обрывается; при переподключении клиент получит 503 и перейдет на опрос
+        logger.warning(f"Поток уведомлений прерван: {str(e)}")
+    finally:
+        await close_unread_count_subscription(client, pubsub)
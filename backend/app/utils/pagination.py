@@ -0,0 +1,183 @@
+"""
+Keyset-пагинация и выбор полей для списков заявок
+
+Страница продолжается с места, где закончилась предыдущая: курсор кодирует
+(created_at, id) последней заявки страницы, следующая страница выбирается
+условием (created_at, id) < курсора - без OFFSET и без чтения пропущенных строк.
+Курсор следующей страницы и оценка общего количества возвращаются в заголовках
+X-Next-Cursor и X-Total-Count (оценка - только на первой странице), тело ответа
+остается списком.
+"""
+from fastapi import HTTPException, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import tuple_
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+import base64
+import uuid
+
+from app.models import Request
+
+# Размер страницы по умолчанию и максимальный
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+
+# Поля, которые всегда возвращаются (нужны для курсора)
+KEY_FIELDS = ("id", "created_at")
+
+class Explain(Executable, ClauseElement):
+    """
+    EXPLAIN (FORMAT JSON) для запроса (параметры связываются как у самого запроса)
+    """
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+@compiles(Explain, "postgresql")
+def compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+def estimate_count(db, query, cursor: Optional[str] = None) -> Optional[int]:
+    """
+    Оценка количества строк запроса по плану PostgreSQL (без COUNT по таблице)
+
+    Считается только для первой страницы (без cursor): следующие страницы того
+    же списка не выполняют лишний EXPLAIN. Ошибки БД не перехватываются -
+    после неудачного запроса транзакция PostgreSQL прервана, и основной запрос
+    все равно не выполнился бы; None - только если план не содержит оценки.
+    """
+    if cursor:
+        return None
+
+    plan = db.execute(Explain(query.order_by(None).statement)).scalar()
+    try:
+        return int(plan[0]["Plan"]["Plan Rows"])
+    except (LookupError, TypeError, ValueError):
+        return None
+
+def encode_cursor(created_at: datetime, request_id) -> str:
+    """
+    Курсор страницы по (created_at, id) последней заявки
+    """
+    raw = f"{created_at.isoformat()}|{request_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """
+    (created_at, id) из курсора
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, request_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), uuid.UUID(request_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Некорректный курсор страницы"
+        )
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[List[str]]:
+    """
+    Список полей из параметра fields ("article,amount,recipient")
+
+    None - поля не заданы, возвращается полная запись. Поля id и created_at
+    добавляются всегда.
+    """
+    if not fields:
+        return None
+
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    allowed = set(allowed)
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Неизвестные поля: {', '.join(unknown)}"
+        )
+
+    return list(dict.fromkeys([*KEY_FIELDS, *names]))
+
+# Поля заявки, доступные для выбора в списках
+REQUEST_FIELDS = [column.key for column in Request.__table__.columns]
+
+def project_request_fields(query, fields: Optional[List[str]]):
+    """
+    Запрос только выбранных столбцов заявки
+    """
+    if not fields:
+        return query
+    return query.with_entities(*[getattr(Request, name) for name in fields])
+
+def paginate(
+    query,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    descending: bool = True
+) -> Tuple[list, Optional[str]]:
+    """
+    Страница запроса по ключу (created_at, id)
+
+    Без limit возвращаются все строки после курсора. Возвращает
+    (строки, курсор следующей страницы или None).
+    """
+    key = tuple_(Request.created_at, Request.id)
+
+    if descending:
+        query = query.order_by(None).order_by(Request.created_at.desc(), Request.id.desc())
+    else:
+        query = query.order_by(None).order_by(Request.created_at, Request.id)
+
+    if cursor:
+        created_at, request_id = decode_cursor(cursor)
+        bound = tuple_(created_at, request_id)
+        query = query.filter(key < bound if descending else key > bound)
+
+    if not limit:
+        return query.all(), None
+
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
+
+def page_headers(next_cursor: Optional[str], total: Optional[int]) -> Dict[str, str]:
+    """
+    Заголовки с курсором следующей страницы и оценкой количества
+    """
+    headers = {}
+    if next_cursor:
+        headers[CURSOR_HEADER] = next_cursor
+    if total is not None:
+        headers[TOTAL_COUNT_HEADER] = str(total)
+    return headers
+
+def page_response(
+    response: Response,
+    rows: list,
+    next_cursor: Optional[str],
+    total: Optional[int],
+    fields: Optional[List[str]] = None
+):
+    """
+    Ответ со страницей: полные записи (через response_model) или только
+    выбранные поля (fields)
+    """
+    headers = page_headers(next_cursor, total)
+
+    if fields:
+        return JSONResponse(
+            content=jsonable_encoder([dict(row._mapping) for row in rows]),
+            headers=headers
+        )
+
+    response.headers.update(headers)
+    return rows
@@ -0,0 +1,159 @@
+"""
+Сводные таблицы по заявкам, агрегируемые на стороне БД
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from typing import List, Dict, Any
+from app.models import Request
+from app.utils.filters import RequestFilter
+
+def query_pivot_totals(db: Session, conditions: List, by_recipient: bool = False) -> List:
+    """
+    Суммы заявок в разрезе организация [-> получатель] x подразделение
+
+    Один GROUP BY по отфильтрованным заявкам, строки ORM не загружаются.
+    Возвращает кортежи (organization, [recipient,] department, amount).
+    """
+    columns = [Request.organization]
+    if by_recipient:
+        columns.append(Request.recipient)
+    columns.append(Request.department)
+
+    return db.query(
+        *columns,
+        func.coalesce(func.sum(Request.amount), 0)
+    ).filter(*conditions).group_by(*columns).order_by(*columns).all()
+
+def build_recipient_pivot(db: Session, conditions: List) -> Dict[str, Any]:
+    """
+    Сводная таблица кабинета заместителя
+
+    - Строки: organization -> recipient
+    - Столбцы: department (только встречающиеся в отфильтрованных заявках)
+    - Значения: amount (SUM)
+    """
+    totals = query_pivot_totals(db, conditions, by_recipient=True)
+
+    departments = sorted({dept for _, _, dept, _ in totals if dept})
+
+    pivot_data = {}
+
+    for org, recipient, dept, amount in totals:
+        if org not in pivot_data:
+            pivot_data[org] = {
+                'department_totals': {d: 0 for d in departments},
+                'organization_total': 0,
+                'recipients': {}
+            }
+
+        org_data = pivot_data[org]
+        if recipient not in org_data['recipients']:
+            org_data['recipients'][recipient] = {
+                'department_amounts': {d: 0 for d in departments},
+                'recipient_total': 0
+            }
+
+        if dept:
+            recipient_data = org_data['recipients'][recipient]
+            recipient_data['department_amounts'][dept] += float(amount)
+            recipient_data['recipient_total'] += float(amount)
+
+            org_data['department_totals'][dept] += float(amount)
+            org_data['organization_total'] += float(amount)
+
+    rows = []
+    department_totals = {d: 0 for d in departments}
+
+    for org, org_data in pivot_data.items():
+        # Строка организации (итог)
+        rows.append({
+            'type': 'organization',
+            'organization': org,
+            'department_amounts': org_data['department_totals'],
+            'total': org_data['organization_total'],
+            'is_expanded': False
+        })
+
+        # Строки контрагентов
+        for recipient, recipient_data in org_data['recipients'].items():
+            rows.append({
+                'type': 'recipient',
+                'organization': org,
+                'recipient': recipient,
+                'department_amounts': recipient_data['department_amounts'],
+                'total': recipient_data['recipient_total']
+            })
+
+        for dept, amount in org_data['department_totals'].items():
+            department_totals[dept] += amount
+
+    total_row = {
+        'type': 'total',
+        'department_totals': department_totals,
+        'grand_total': sum(department_totals.values())
+    }
+
+    return {
+        'rows': rows,
+        'total_row': total_row,
+        'departments': departments
+    }
+
+def build_department_pivot(
+    db: Session,
+    spec: RequestFilter,
+    with_recipients: bool = False
+) -> Dict[str, Any]:
+    """
+    Сводная таблица казначейства: организация x подразделение
+
+    При with_recipients=True каждая строка организации дополнительно
+    содержит разбивку по получателям ('recipients'). Память и время не
+    зависят от количества заявок - в Python приходят только итоги GROUP BY.
+    """
+    totals = query_pivot_totals(db, spec.conditions(), by_recipient=with_recipients)
+
+    pivot_data = {}
+    recipients_data = {}
+    departments_set = set()
+
+    for item in totals:
+        if with_recipients:
+            org, recipient, dept, amount = item
+        else:
+            org, dept, amount = item
+
+        departments_set.add(dept)
+
+        org_departments = pivot_data.setdefault(org, {})
+        org_departments[dept] = org_departments.get(dept, 0) + float(amount)
+
+        if with_recipients:
+            recipient_departments = recipients_data.setdefault(org, {}).setdefault(recipient, {})
+            recipient_departments[dept] = float(amount)
+
+    departments = sorted(departments_set)
+    rows = []
+
+    # Строки отсортированы по названию организации (ORDER BY в запросе)
+    for org, depts in pivot_data.items():
+        row = {
+            'organization': org,
+            'departments': {dept: depts.get(dept, 0) for dept in departments}
+        }
+
+        if with_recipients:
+            row['recipients'] = [
+                {
+                    'recipient': recipient,
+                    'departments': {dept: amounts.get(dept, 0) for dept in departments}
+                }
+                for recipient, amounts in recipients_data[org].items()
+            ]
+
+        rows.append(row)
+
+    return {
+        'departments': departments,
+        'rows': rows
+    }
@@ -0,0 +1,158 @@
+"""
+Суточные итоги по заявкам (request_stats_daily)
+
+Агрегат обновляется инкрементально: по отметке updated_at находятся дни
+(по created_at), в которых заявки менялись с прошлого обновления, и итоги
+этих дней пересчитываются целиком. Черновики в агрегат не попадают - их
+исключает вся статистика.
+
+Удаленная заявка не оставляет updated_at, поэтому код, удаляющий заявки не в
+статусе черновика (перезапуск прерванного импорта), пересчитывает их дни сам -
+rebuild_deleted_days в той же транзакции.
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import func, cast, or_, and_, insert, select, Date
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+import logging
+
+from app.models import Request, RequestStatsDaily, RollupWatermark
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_NAME = "request_stats_daily"
+
+# Запас к отметке: транзакции, начатые до прошлого обновления, могли
+# зафиксироваться позже с updated_at меньше отметки
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+# Сколько дней пересчитывать одним запросом
+REFRESH_DAYS_CHUNK_SIZE = 100
+
+# День заявки (в часовом поясе сессии БД, как и фильтры по created_at)
+REQUEST_DAY = cast(Request.created_at, Date)
+
+ROLLUP_KEY_COLUMNS = (
+    Request.status,
+    Request.organization,
+    Request.department,
+    Request.article,
+    Request.recipient,
+    Request.created_by,
+)
+
+def days_condition(days: List[date]):
+    """
+    Условие "заявка создана в один из дней" через диапазоны created_at (по индексу)
+    """
+    return or_(*[
+        and_(Request.created_at >= day, Request.created_at < day + timedelta(days=1))
+        for day in days
+    ])
+
+def rebuild_days(db: Session, days: Optional[List[date]] = None) -> None:
+    """
+    Пересчет итогов за указанные дни (None - за все время)
+    """
+    delete_query = db.query(RequestStatsDaily)
+    source = select(
+        REQUEST_DAY,
+        *ROLLUP_KEY_COLUMNS,
+        func.count(Request.id),
+        func.sum(Request.amount)
+    ).where(Request.status != "draft")
+
+    if days is not None:
+        delete_query = delete_query.filter(RequestStatsDaily.day.in_(days))
+        source = source.where(days_condition(days))
+
+    delete_query.delete(synchronize_session=False)
+    db.execute(
+        insert(RequestStatsDaily).from_select(
+            [
+                "day", "status", "organization", "department", "article",
+                "recipient", "created_by", "count", "total_amount"
+            ],
+            source.group_by(REQUEST_DAY, *ROLLUP_KEY_COLUMNS)
+        )
+    )
+
+def rebuild_day_chunks(db: Session, days: List[date]) -> None:
+    """
+    Пересчет итогов за дни частями по REFRESH_DAYS_CHUNK_SIZE
+    """
+    for start in range(0, len(days), REFRESH_DAYS_CHUNK_SIZE):
+        rebuild_days(db, days[start:start + REFRESH_DAYS_CHUNK_SIZE])
+
+def rebuild_deleted_days(db: Session, days: Iterable[date]) -> None:
+    """
+    Пересчет итогов за дни удаленных заявок (без commit, в транзакции удаления)
+
+    Строка отметки блокируется, как и в refresh_request_stats, чтобы пересчет
+    не шел параллельно с обновлением агрегата.
+    """
+    days = sorted(set(days))
+    if not days:
+        return
+
+    db.query(RollupWatermark).filter(
+        RollupWatermark.name == ROLLUP_NAME
+    ).with_for_update().first()
+    rebuild_day_chunks(db, days)
+
+def refresh_request_stats(db: Session) -> Dict:
+    """
+    Инкрементальное обновление request_stats_daily
+
+    Первый запуск строит агрегат целиком. Строка отметки блокируется на время
+    обновления, поэтому параллельные запуски выполняются по очереди.
+    """
+    state = db.query(RollupWatermark).filter(
+        RollupWatermark.name == ROLLUP_NAME
+    ).with_for_update().first()
+
+    if not state:
+        state = RollupWatermark(name=ROLLUP_NAME)
+        db.add(state)
+        db.flush()
+
+    new_watermark = db.query(func.max(Request.updated_at)).scalar()
+
+    if state.watermark is None:
+        rebuild_days(db)
+        refreshed_days = None
+    else:
+        refreshed_days = [
+            day for (day,) in db.query(REQUEST_DAY).filter(
+                Request.updated_at > state.watermark - WATERMARK_OVERLAP
+            ).distinct().all()
+        ]
+        rebuild_day_chunks(db, refreshed_days)
+
+    state.watermark = new_watermark or state.watermark
+    state.refreshed_at = datetime.utcnow()
+    db.commit()
+
+    result = {
+        "full_rebuild": refreshed_days is None,
+        "refreshed_days": len(refreshed_days) if refreshed_days is not None else None,
+        "watermark": new_watermark.isoformat() if new_watermark else None
+    }
+    logger.info(f"Обновлены суточные итоги по заявкам: {result}")
+    return result
+
+def rollup_covers(db: Session, end_date: Optional[date]) -> bool:
+    """
+    Можно ли взять статистику из суточных итогов
+
+    Фильтр created_at <= end_date заканчивается в начале дня end_date, поэтому
+    период без сегодняшних заявок - это end_date не позже сегодняшнего дня.
+    Агрегат должен быть уже построен.
+    """
+    if end_date is None or end_date > date.today():
+        return False
+
+    return db.query(RollupWatermark.watermark).filter(
+        RollupWatermark.name == ROLLUP_NAME,
+        RollupWatermark.watermark.isnot(None)
+    ).first() is not None
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Проверка: все способы чтения файлов импорта дают одинаковые записи
+
+Каждый файл читается всеми доступными способами (openpyxl для xlsx,
+python-calamine для xlsx/xlsb/xls, модуль csv для CSV/TSV), записи всех файлов
+и способов сравниваются с первыми. Передавать можно один и тот же лист,
+сохраненный в разных форматах:
+
+    python check_import_readers.py sheet.xlsx sheet.xlsb sheet.csv
+
+Код выхода 1 - записи различаются.
+"""
+import sys
+from pathlib import Path
+
+sys.path.append('/opt/sariz/backend')
+
+from app.utils.excel_processor import (
+    CalamineWorkbook,
+    detect_file_format,
+    iter_calamine_rows,
+    iter_csv_rows,
+    iter_excel_rows
+)
+
+def readers_for(path: Path):
+    """
+    Способы чтения, доступные для файла: (название, функция)
+    """
+    file_format = detect_file_format(path)
+    if file_format == "csv":
+        return [("csv", iter_csv_rows)]
+
+    readers = []
+    if file_format == "xlsx":
+        readers.append(("openpyxl", iter_excel_rows))
+    if CalamineWorkbook is not None:
+        readers.append(("calamine", iter_calamine_rows))
+    return readers
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(2)
+
+    reference = None
+    mismatches = 0
+
+    for path in map(Path, sys.argv[1:]):
+        for reader_name, reader in readers_for(path):
+            records = list(reader(path))
+            source = f"{path.name} ({reader_name})"
+            print(f"{source}: {len(records)} записей")
+
+            if reference is None:
+                reference = (source, records)
+                continue
+
+            reference_source, reference_records = reference
+            if len(records) != len(reference_records):
+                print(f"  ! число записей отличается от {reference_source}: {len(records)} != {len(reference_records)}")
+                mismatches += 1
+                continue
+
+            for (row_number, record), (_, expected) in zip(records, reference_records):
+                if record != expected:
+                    print(f"  ! строка {row_number} отличается от {reference_source}:")
+                    for field in sorted(set(record) | set(expected)):
+                        if record.get(field) != expected.get(field):
+                            print(f"    {field}: {record.get(field)!r} != {expected.get(field)!r}")
+                    mismatches += 1
+
+    if mismatches:
+        print(f"Найдено расхождений: {mismatches}")
+        sys.exit(1)
+
+    print("Записи всех способов чтения совпадают")
+
+if __name__ == "__main__":
+    main()
@@ -66,14 +66,80 @@ const Header: React.FC<HeaderProps> = ({ userName, userRole, onLogout }) => {
 
   // Загружаем уведомления
   useEffect(() => {
-    if (userName) {
+    if (!userName) {
+      return;
+    }
+
+    const token = localStorage.getItem('token');
+    let interval: ReturnType<typeof setInterval> | null = null;
+
+    if (!token || typeof EventSource === 'undefined') {
+      // Без потока событий - опрос каждые 30 секунд
       fetchNotifications();
-      // Устанавливаем интервал для обновления уведомлений каждые 30 секунд
-      const interval = setInterval(fetchNotifications, 30000);
-      return () => clearInterval(interval);
+      interval = setInterval(fetchNotifications, 30000);
+      return () => clearInterval(interval!);
     }
+
+    // Число непрочитанных приходит через Server-Sent Events: первое событие
+    // сразу после подключения, далее - при каждом изменении
+    const source = new EventSource(
+      `/api/notifications/user-notifications/stream?token=${encodeURIComponent(token)}`
+    );
+
+    // Подряд неудачных подключений до перехода на опрос
+    const MAX_STREAM_ERRORS = 3;
+    let streamErrors = 0;
+
+    const startPolling = () => {
+      if (!interval) {
+        fetchNotifications();
+        interval = setInterval(fetchNotifications, 30000);
+      }
+    };
+
+    source.addEventListener('unread_count', (event) => {
+      streamErrors = 0;
+      const { unread_count } = JSON.parse((event as MessageEvent).data);
+      if (unread_count === null) {
+        // Счетчик на сервере пересчитывается - запрашиваем число заново
+        fetchNotifications();
+        return;
+      }
+      setUnreadCount(unread_count);
+      fetchNotificationList();
+    });
+
+    source.onerror = () => {
+      // Браузер переподключается сам, но если поток закрыт окончательно (ответ
+      // с ошибкой, например 503) или обрывается несколько раз подряд - опрос
+      streamErrors += 1;
+      if (source.readyState === EventSource.CLOSED || streamErrors >= MAX_STREAM_ERRORS) {
+        source.close();
+        startPolling();
+      }
+    };
+
+    return () => {
+      source.close();
+      if (interval) {
+        clearInterval(interval);
+      }
+    };
   }, [userName]);
 
+  const fetchNotificationList = async () => {
+    try {
+      setLoading(true);
+      const notificationsResponse = await api.get('/notifications/user-notifications?limit=10&unread_only=true');
+      setNotifications(notificationsResponse.data);
+    } catch (error: any) {
+      console.error('Ошибка при загрузке уведомлений:', error);
+      setNotifications([]);
+    } finally {
+      setLoading(false);
+    }
+  };
+
   const fetchNotifications = async () => {
     try {
       setLoading(true);
@@ -19,8 +19,9 @@ const EmployeeImport: React.FC = () => {
 
   // Ограничения согласно ТЗ
   const MAX_FILES = 10;
-  const MAX_FILE_SIZE = 5 * 1024 * 1024; // 5 МБ
-  const MAX_ROWS = 200; // Максимальное количество строк согласно ТЗ
+  // Размер и число строк - как на сервере (EXCEL_MAX_FILE_SIZE_MB, EXCEL_MAX_ROWS)
+  const MAX_FILE_SIZE = 50 * 1024 * 1024; // 50 МБ
+  const MAX_ROWS = 50000;
   const MAX_SUM = 500000; // 500,000 руб. согласно ТЗ
 
   const fileInputRef = useRef<HTMLInputElement>(null);
@@ -102,13 +103,13 @@ const EmployeeImport: React.FC = () => {
     for (const file of fileArray) {
       // Проверка размера файлов
       if (file.size > MAX_FILE_SIZE) {
-        setError(`Файл ${file.name} превышает лимит 5 МБ`);
+        setError(`Файл ${file.name} превышает лимит ${MAX_FILE_SIZE / 1024 / 1024} МБ`);
         return;
       }
 
       // Проверка формата
-      if (!file.name.match(/\.(xlsx|xls)$/i)) {
-        setError(`Файл ${file.name} должен быть в формате Excel (.xlsx или .xls)`);
+      if (!file.name.match(/\.(xlsx|xls|xlsb|csv|tsv)$/i)) {
+        setError(`Файл ${file.name} должен быть в формате Excel (.xlsx, .xls, .xlsb) или CSV`);
         return;
       }
 
@@ -399,13 +400,13 @@ const EmployeeImport: React.FC = () => {
           Выберите файлы Excel
         </div>
         <div style={{ fontSize: '14px', color: '#666666' }}>
-          Максимум {MAX_FILES} файлов, каждый до 5 МБ, сумма не более {MAX_SUM.toLocaleString('ru-RU')} руб.
+          Максимум {MAX_FILES} файлов, каждый до {MAX_FILE_SIZE / 1024 / 1024} МБ, сумма не более {MAX_SUM.toLocaleString('ru-RU')} руб.
         </div>
         <input
           ref={fileInputRef}
           type="file"
           multiple
-          accept=".xlsx,.xls"
+          accept=".xlsx,.xls,.xlsb,.csv,.tsv"
           onChange={handleFileSelect}
           style={{ display: 'none' }}
         />
@@ -116,7 +116,9 @@ const EmployeeRequests: React.FC = () => {
       });
 
       if (response.status === 200) {
-        alert('Заявки успешно отправлены на согласование');
+        alert(response.data.failed?.length
+          ? response.data.message
+          : 'Заявки успешно отправлены на согласование');
         fetchRequests(); // Обновляем список
         setSelectedRows([]);
       }
@@ -141,7 +143,9 @@ const EmployeeRequests: React.FC = () => {
       });
 
       if (response.status === 200) {
-        alert('Заявки успешно удалены');
+        alert(response.data.failed?.length
+          ? response.data.message
+          : 'Заявки успешно удалены');
         fetchRequests(); // Обновляем список
         setSelectedRows([]);
       }
@@ -84,6 +84,12 @@ const TreasuryPending: React.FC = () => {
   const [loadingRequests, setLoadingRequests] = useState(false);
   const [loadingPivot, setLoadingPivot] = useState(false);
 
+  // Постраничная загрузка заявок узла: курсор следующей страницы (X-Next-Cursor)
+  // и оценка общего количества (X-Total-Count)
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [totalCount, setTotalCount] = useState<number | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+
   // Комментарий для заместителя
   const [treasuryComment, setTreasuryComment] = useState('');
 
@@ -120,6 +126,8 @@ const TreasuryPending: React.FC = () => {
       setSelectedNode(null);
       setPivotData(null);
       setRequests([]);
+      setNextCursor(null);
+      setTotalCount(null);
       setSelectedCategory(null);
     }
   }, [selectedNodeId]);
@@ -133,6 +141,8 @@ const TreasuryPending: React.FC = () => {
         params: { category: categoryName }
       });
       setRequests(response.data);
+      setNextCursor(null);
+      setTotalCount(null);
       setSelectedRows([]);
     } catch (error) {
       console.error('Ошибка загрузки заявок по категории:', error);
@@ -171,9 +181,13 @@ const TreasuryPending: React.FC = () => {
     }
   };
 
-  const loadRequestsByNode = async (node: TreeNode) => {
+  const loadRequestsByNode = async (node: TreeNode, cursor?: string) => {
     try {
-      setLoadingRequests(true);
+      if (cursor) {
+        setLoadingMore(true);
+      } else {
+        setLoadingRequests(true);
+      }
       console.log('TreasuryPending: loadRequestsByNode для узла:', node.id, node.type);
       
       // Формируем параметры для запроса
@@ -186,16 +200,28 @@ const TreasuryPending: React.FC = () => {
       if (node.department) params.department = node.department;
       if (node.user_id) params.user_id = node.user_id;
       if (node.import_id) params.import_id = node.import_id;
+      if (cursor) params.cursor = cursor;
       
       const response = await api.get('/treasury/pending/filter-by-node', { params });
-      setRequests(response.data);
-      setSelectedRows([]);
+      if (cursor) {
+        setRequests(prev => [...prev, ...response.data]);
+      } else {
+        setRequests(response.data);
+        setSelectedRows([]);
+        const total = response.headers['x-total-count'];
+        setTotalCount(total ? Number(total) : null);
+      }
+      setNextCursor(response.headers['x-next-cursor'] || null);
       console.log('TreasuryPending: Загружено заявок:', response.data.length);
     } catch (error) {
       console.error('TreasuryPending: Ошибка загрузки заявок:', error);
-      setRequests([]);
+      if (!cursor) {
+        setRequests([]);
+        setNextCursor(null);
+      }
     } finally {
       setLoadingRequests(false);
+      setLoadingMore(false);
     }
   };
 
@@ -457,7 +483,10 @@ const TreasuryPending: React.FC = () => {
         {/* Управление отправкой на финальное согласование и удалением */}
         <div className="send-to-deputy-section">
           <div className="selection-info">
-            <span>Выбрано заявок: {selectedRows.length} из {requests.length}</span>
+            <span>
+              Выбрано заявок: {selectedRows.length} из {requests.length}
+              {nextCursor && totalCount !== null && ` (всего ≈ ${totalCount})`}
+            </span>
             <button onClick={handleSelectAll} className="select-all-btn">
               {selectedRows.length === requests.length ? 'Снять все' : 'Выбрать все'}
             </button>
@@ -525,6 +554,16 @@ const TreasuryPending: React.FC = () => {
               columnSettings={columnSettings}
             />
           )}
+
+          {selectedNode && nextCursor && !loadingRequests && (
+            <button
+              onClick={() => loadRequestsByNode(selectedNode, nextCursor)}
+              disabled={loadingMore}
+              className="load-more-btn"
+            >
+              {loadingMore ? 'Загрузка...' : 'Показать еще'}
+            </button>
+          )}
         </div>
       </div>
     </div>
@@ -2,17 +2,8 @@ import React, { useState, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 
 
-// Функция форматирования числа в русском формате (100 000,00)
-const formatNumber = (num: number): string => {
-  return new Intl.NumberFormat('ru-RU', {
-    minimumFractionDigits: 2,
-    maximumFractionDigits: 2
-  }).format(num);
-};
-
 import axios from 'axios';
 import { FaFileExcel, FaUpload, FaExclamationTriangle, FaInfoCircle } from 'react-icons/fa';
-import * as XLSX from 'xlsx';
 import './TreasurySpecialImport.css';
 
 const TreasurySpecialImport: React.FC = () => {
@@ -27,15 +18,15 @@ const TreasurySpecialImport: React.FC = () => {
   const [successMessage, setSuccessMessage] = useState('');
   const [validationResult, setValidationResult] = useState<{
     fileName: string;
-    rowCount: number;
-    totalAmount: number;
+    fileSize: number;
     isValid: boolean;
     error?: string;
   } | null>(null);
 
   // Ограничения
-  const MAX_FILE_SIZE = 5 * 1024 * 1024; // 5 МБ
-  const MAX_ROWS = 200;
+  // Число строк, колонки и суммы проверяет сервер при импорте: файл не
+  // разбирается в браузере (графики казначейства - десятки тысяч строк)
+  const MAX_FILE_SIZE = 50 * 1024 * 1024; // 50 МБ
 
   const fileInputRef = useRef<HTMLInputElement>(null);
 
@@ -58,90 +49,6 @@ const TreasurySpecialImport: React.FC = () => {
     }
   ];
 
-  // Функция для чтения Excel и проверки
-  const validateFile = async (file: File): Promise<{rowCount: number, totalAmount: number, error?: string}> => {
-    return new Promise((resolve, reject) => {
-      const reader = new FileReader();
-
-      reader.onload = (e) => {
-        try {
-          const data = e.target?.result;
-          if (!data) {
-            reject(new Error('Не удалось прочитать файл'));
-            return;
-          }
-
-          const workbook = XLSX.read(data, { type: 'binary' });
-          const worksheet = workbook.Sheets[workbook.SheetNames[0]];
-          const jsonData = XLSX.utils.sheet_to_json(worksheet);
-
-          // Проверка количества строк
-          if (jsonData.length > MAX_ROWS) {
-            reject(new Error(`Файл содержит более ${MAX_ROWS} строк`));
-            return;
-          }
-
-                    // Проверка обязательных колонок (с поддержкой альтернативных названий)
-          const columnMappings = {
-            'Статья ДДС': ['Статья движения денежных средств', 'Статья ДДС'],
-            'Сумма': ['Сумма'],
-            'Получатель': ['Получатель'],
-            'Номер заявки': ['Заявка', 'Номер заявки'],
-            'Назначение': ['Назначение платежа', 'Назначение']
-          };
-          
-          const firstRow = jsonData[0] as any;
-          const rowKeys = Object.keys(firstRow || {});
-          const missingColumns = [];
-          
-          for (const [requiredCol, possibleNames] of Object.entries(columnMappings)) {
-            const found = possibleNames.some(name => 
-              rowKeys.some(key => key.toLowerCase().includes(name.toLowerCase()))
-            );
-            if (!found) {
-              missingColumns.push(requiredCol);
-            }
-          }
-
-          if (missingColumns.length > 0) {
-            reject(new Error(`Отсутствуют обязательные колонки: ${missingColumns.join(', ')}`));
-            return;
-          }
-          // Подсчет суммы
-          let totalSum = 0;
-          let errorRows = 0;
-
-          jsonData.forEach((row: any) => {
-            const amount = parseFloat(row['Сумма']);
-            if (isNaN(amount) || amount <= 0) {
-              errorRows++;
-            } else {
-              totalSum += amount;
-            }
-          });
-
-          if (errorRows > 0) {
-            console.warn(`${errorRows} строк с некорректной суммой в файле ${file.name}`);
-          }
-
-          resolve({
-            rowCount: jsonData.length,
-            totalAmount: totalSum
-          });
-
-        } catch (err: any) {
-          reject(new Error(`Ошибка при чтении файла: ${err.message}`));
-        }
-      };
-
-      reader.onerror = () => {
-        reject(new Error('Ошибка при чтении файла'));
-      };
-
-      reader.readAsBinaryString(file);
-    });
-  };
-
   const handleFileSelect = async (event: React.ChangeEvent<HTMLInputElement>) => {
     const selectedFiles = event.target.files;
     if (!selectedFiles || selectedFiles.length === 0) return;
@@ -158,31 +65,17 @@ const TreasurySpecialImport: React.FC = () => {
     }
 
     // Проверка расширения
-    if (!selectedFile.name.match(/\.(xlsx|xls)$/i)) {
-      setError('Поддерживаются только файлы Excel (.xlsx, .xls)');
+    if (!selectedFile.name.match(/\.(xlsx|xls|xlsb|csv|tsv)$/i)) {
+      setError('Поддерживаются только файлы Excel (.xlsx, .xls, .xlsb) и CSV/TSV');
       return;
     }
 
-    try {
-      const result = await validateFile(selectedFile);
-      setValidationResult({
-        fileName: selectedFile.name,
-        rowCount: result.rowCount,
-        totalAmount: result.totalAmount,
-        isValid: true
-      });
-      
-      setFile(selectedFile);
-    } catch (err: any) {
-      setValidationResult({
-        fileName: selectedFile.name,
-        rowCount: 0,
-        totalAmount: 0,
-        isValid: false,
-        error: err.message
-      });
-      setFile(null);
-    }
+    setValidationResult({
+      fileName: selectedFile.name,
+      fileSize: selectedFile.size,
+      isValid: true
+    });
+    setFile(selectedFile);
 
     // Сбрасываем значение input для возможности повторной загрузки того же файла
     if (fileInputRef.current) {
@@ -239,7 +132,7 @@ const TreasurySpecialImport: React.FC = () => {
         }
       });
 
-      setSuccessMessage(`Успешно импортировано ${response.data.imported_count} заявок`);
+      setSuccessMessage(response.data.message || 'Импорт поставлен в очередь');
       setFile(null);
       setValidationResult(null);
       setComment('');
@@ -342,13 +235,13 @@ const TreasurySpecialImport: React.FC = () => {
             <FaUpload size={48} />
             <p>Перетащите файл сюда или нажмите для выбора</p>
             <p className="file-requirements">
-              Поддерживаются файлы Excel (.xlsx, .xls), не более {MAX_FILE_SIZE / 1024 / 1024} МБ
+              Поддерживаются файлы Excel (.xlsx, .xls, .xlsb) и CSV/TSV, не более {MAX_FILE_SIZE / 1024 / 1024} МБ
             </p>
             <input
               type="file"
               ref={fileInputRef}
               onChange={handleFileSelect}
-              accept=".xlsx,.xls"
+              accept=".xlsx,.xls,.xlsb,.csv,.tsv"
               style={{ display: 'none' }}
             />
           </div>
@@ -363,7 +256,7 @@ const TreasurySpecialImport: React.FC = () => {
                   <span className="file-name">{validationResult.fileName}</span>
                   {validationResult.isValid ? (
                     <span className="file-stats">
-                      {validationResult.rowCount} строк, {formatNumber(validationResult.totalAmount)} руб.
+                      {(validationResult.fileSize / 1024 / 1024).toFixed(1)} МБ
                     </span>
                   ) : (
                     <span className="file-error">{validationResult.error}</span>
@@ -377,15 +270,6 @@ const TreasurySpecialImport: React.FC = () => {
                   ×
                 </button>
               </div>
-              
-              {/* Статистика */}
-              {validationResult.isValid && (
-                <div className="total-stats">
-                  <p>
-                    <strong>Итого:</strong> {validationResult.rowCount} строк, {formatNumber(validationResult.totalAmount)} руб.
-                  </p>
-                </div>
-              )}
             </div>
           )}
         </div>